@@ -0,0 +1,75 @@
+from gi.repository import Gimp # type: ignore
+from imagerevision import get_image_revision
+
+class ImageChangeTracker:
+	"""
+	Keeps the last known state of the open GIMP images that are shown (their structural
+	revision, their selected layers and their selection bounds) and tells which of them
+	changed since the last poll, GIMP has no signals for this that a plug-in can connect
+	to, so the state is polled
+
+	Reading the whole state takes a few calls per layer, so every poll only reads a cheap
+	token (dirty flag, top level layer ids and selected layer ids) and the whole state is
+	only read again when that token changed, edits that leave an already dirty image with
+	the same layers are picked up when the dialog is focused, see include_dirty
+	"""
+	def __init__(self):
+		self.image_tokens = {}
+		self.image_states = {}
+		self.image_ids = None
+
+	def get_image_token(self, image):
+		selected_layers = image.get_selected_layers() or []
+		return (
+			image.is_dirty(),
+			tuple(layer.get_id() for layer in image.get_layers()),
+			tuple(layer.get_id() for layer in selected_layers),
+		)
+
+	def get_image_state(self, image):
+		selected_layers = image.get_selected_layers() or []
+		return (
+			get_image_revision(image, dirty_buckets=False),
+			tuple(layer.get_id() for layer in selected_layers),
+			# the selection load types depend on where the selection is
+			tuple(Gimp.Selection.bounds(image)),
+		)
+
+	def poll(self, shown_image_ids=None, include_dirty=False):
+		"""
+		Returns whether the list of open images changed and the set of ids of the shown
+		images whose state changed, shown_image_ids are the images to look at (all of them
+		if None), include_dirty also reports every one of them with unsaved changes since
+		edits to the pixels can not be seen in the state
+		"""
+		new_tokens = {}
+		new_states = {}
+		changed_image_ids = set()
+		image_ids = []
+		for image in Gimp.get_images():
+			image_id = image.get_id()
+			image_ids.append(image_id)
+			if shown_image_ids is not None and image_id not in shown_image_ids:
+				continue
+
+			token = self.get_image_token(image)
+			new_tokens[image_id] = token
+			state = self.image_states.get(image_id, None)
+			if state is None or self.image_tokens.get(image_id, None) != token:
+				state = self.get_image_state(image)
+				if self.image_states.get(image_id, None) != state:
+					changed_image_ids.add(image_id)
+			new_states[image_id] = state
+			if include_dirty and token[0]:
+				changed_image_ids.add(image_id)
+
+		image_list_changed = self.image_ids != image_ids
+		self.image_tokens = new_tokens
+		self.image_states = new_states
+		self.image_ids = image_ids
+		return image_list_changed, changed_image_ids
+
+	def reset(self):
+		self.image_tokens = {}
+		self.image_states = {}
+		self.image_ids = None
@@ -45,7 +45,7 @@ class ConditionEvaluator:
 
         self.error_evaluating = None
     
-    def evaluate(self, workflow_elements_all, half_size, half_size_coords):
+    def evaluate(self, workflow_elements_all, resolution_mode, scale_coords):
         if not self.condition:
             return True
         
@@ -60,7 +60,7 @@ class ConditionEvaluator:
         # Build context from workflow elements
         context = {}
         for element in workflow_elements_all:
-            context[element.get_id()] = element.get_value(half_size=half_size, half_size_coords=half_size_coords)
+            context[element.get_id()] = element.get_value(resolution_mode=resolution_mode, scale_coords=scale_coords)
         
         try:
             # Parse the condition string into an AST
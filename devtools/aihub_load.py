@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+aihub-load, simulates N concurrent GIMP clients against an AIHub server (or the
+local stand-in in devtools/aihub_mock_server.py) and reports per-phase latency
+percentiles, throughput and error rates.
+
+The connection options are the ones of the vendored websocket/_wsdump.py tool,
+each simulated client does what the plug-in does for a run: connect and wait for
+INFO_LIST, upload the input files with FILE_UPLOAD, send WORKFLOW_OPERATION and
+receive WORKFLOW_AWAIT/START/STATUS, the result files and WORKFLOW_FINISHED.
+
+	python3 devtools/aihub_load.py ws://127.0.0.1:8000/ws -c 8 -n 5 --payloads recorded.json
+
+The payloads file is a json list of recorded runs, either plain WORKFLOW_OPERATION
+messages or objects like
+	{"workflow_id": "...", "expose": {...}, "uploads": [{"expose_id": "image", "path": "input.png"}]}
+where every upload is sent first and its server path set as the local_file of that expose,
+{"expose_id": "image", "size": 1048576} uploads that many random bytes instead.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import ssl
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import websocket # noqa: E402
+from websocket._wsdump import VAction # noqa: E402
+from framing import FRAMED_FILES_PROTOCOL, encode_framed_message, decode_framed_message # noqa: E402
+from runstats import percentile # noqa: E402
+
+PHASES = ["connect", "upload", "queue", "execute", "receive", "total"]
+
+def parse_args():
+	parser = argparse.ArgumentParser(prog="aihub-load", description="AIHub protocol load generator")
+	parser.add_argument("url", metavar="ws_url", help="websocket url. ex. ws://127.0.0.1:8000/ws")
+	parser.add_argument("-c", "--clients", type=int, default=4, help="number of concurrent simulated clients")
+	parser.add_argument("-n", "--runs", type=int, default=3, help="runs per client")
+	parser.add_argument("--payloads", help="json file with recorded workflow payloads")
+	parser.add_argument("--apikey", default="", help="api key sent in the handshake")
+	parser.add_argument("--framed", action="store_true", help="ask the server for framed file transfers")
+	parser.add_argument("--think-time", type=float, default=0.0, help="seconds each client waits between runs")
+	parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for any server message")
+	parser.add_argument("--seed", type=int, default=1, help="seed used to pick payloads and generate upload data")
+	parser.add_argument("--json", action="store_true", help="print the report as json")
+	parser.add_argument("-p", "--proxy", help="proxy url. ex. http://127.0.0.1:8080")
+	parser.add_argument("--nocert", action="store_true", help="Ignore invalid SSL cert")
+	parser.add_argument("--headers", help="Set custom headers. Use ',' as separator")
+	parser.add_argument(
+		"-v",
+		"--verbose",
+		default=0,
+		nargs="?",
+		action=VAction,
+		dest="verbose",
+		help="set verbose mode. If set to 1, show errors as they happen. "
+		"If set to 2, enable to trace  websocket module",
+	)
+	return parser.parse_args()
+
+def load_payloads(path):
+	if path is None:
+		return None
+	with open(path, "r") as f:
+		payloads = json.load(f)
+	if isinstance(payloads, dict):
+		payloads = [payloads]
+	return payloads
+
+class LoadStats:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.phases = {phase: [] for phase in PHASES}
+		self.runs_ok = 0
+		self.runs_failed = 0
+		self.errors = {}
+		self.bytes_sent = 0
+		self.bytes_received = 0
+		self.files_received = 0
+
+	def add_phase(self, phase, seconds):
+		with self.lock:
+			self.phases[phase].append(seconds)
+
+	def add_error(self, kind):
+		with self.lock:
+			self.errors[kind] = self.errors.get(kind, 0) + 1
+
+	def add(self, field, amount=1):
+		with self.lock:
+			setattr(self, field, getattr(self, field) + amount)
+
+class ClientError(Exception):
+	def __init__(self, kind, message=""):
+		super().__init__(message or kind)
+		self.kind = kind
+
+class SimulatedClient:
+	def __init__(self, index, args, payloads, stats, connection_options, sslopt):
+		self.index = index
+		self.args = args
+		self.payloads = payloads
+		self.stats = stats
+		self.connection_options = connection_options
+		self.sslopt = sslopt
+		self.rng = random.Random("{}:{}".format(args.seed, index))
+		self.ws = None
+		self.framed = False
+		self.info = None
+		self.current_workflow_id = None
+
+	def log(self, *message):
+		if self.args.verbose:
+			print("[client {}]".format(self.index), *message, flush=True)
+
+	def recv(self):
+		# returns (json message or None, binary data or None)
+		try:
+			opcode, data = self.ws.recv_data()
+		except websocket.WebSocketTimeoutException:
+			raise ClientError("timeout")
+		except (websocket.WebSocketException, OSError) as e:
+			raise ClientError("disconnected", str(e))
+		if opcode == websocket.ABNF.OPCODE_TEXT:
+			return json.loads(data.decode("utf-8")), None
+		if opcode == websocket.ABNF.OPCODE_BINARY:
+			return None, data
+		raise ClientError("disconnected", "connection closed by server")
+
+	def recv_json(self):
+		while True:
+			message, data = self.recv()
+			if message is not None:
+				return message
+
+	def connect(self):
+		start = time.perf_counter()
+		header = ["api-key: {}".format(self.args.apikey), "client: aihub-load", "locale: en"]
+		if self.args.framed:
+			header.append("framing: {}".format(FRAMED_FILES_PROTOCOL))
+		header.extend(self.connection_options.get("header", []))
+		options = dict(self.connection_options, header=header)
+		try:
+			self.ws = websocket.create_connection(self.args.url, sslopt=self.sslopt, timeout=self.args.timeout, **options)
+		except Exception as e:
+			raise ClientError("connect", str(e))
+		self.info = self.recv_json()
+		if self.info.get("type", None) != "INFO_LIST":
+			raise ClientError("protocol", "expected INFO_LIST, got {}".format(self.info.get("type", None)))
+		self.framed = self.args.framed and self.info.get("framed_files", None) == FRAMED_FILES_PROTOCOL
+		self.stats.add_phase("connect", time.perf_counter() - start)
+
+	def make_default_payload(self):
+		# without recorded payloads we run the first workflow with its defaults and upload
+		# random data for every image input
+		workflows = self.info.get("workflows", {})
+		if not workflows:
+			raise ClientError("protocol", "server has no workflows")
+		workflow_id = sorted(workflows.keys())[0]
+		uploads = []
+		for expose_id, expose in workflows[workflow_id].get("expose", {}).items():
+			if expose.get("type", None) in ("AIHubExposeImage", "AIHubExposeAudio", "AIHubExposeVideo", "AIHubExposeLatent"):
+				uploads.append({"expose_id": expose_id, "size": 1024 * 1024})
+		return {"workflow_id": workflow_id, "expose": {}, "uploads": uploads}
+
+	def upload(self, upload):
+		if "path" in upload:
+			with open(upload["path"], "rb") as f:
+				data = f.read()
+		else:
+			data = self.rng.randbytes(int(upload.get("size", 1024)))
+		header = {
+			"type": "FILE_UPLOAD",
+			"filename": hashlib.md5(data).hexdigest(),
+			"workflow_id": self.current_workflow_id,
+			"if_not_exists": True,
+		}
+
+		if self.framed:
+			self.ws.send_binary(encode_framed_message(header, data))
+			self.stats.add("bytes_sent", len(data))
+		else:
+			self.ws.send(json.dumps(header))
+			response = self.recv_json()
+			if response["type"] == "UPLOAD_ACK":
+				self.ws.send_binary(data)
+				self.stats.add("bytes_sent", len(data))
+			elif response["type"] == "FILE_UPLOAD_SKIP":
+				return response.get("file", None)
+			else:
+				raise ClientError("upload", response.get("message", response["type"]))
+
+		response = self.recv_json()
+		if response["type"] in ("FILE_UPLOAD_SUCCESS", "FILE_UPLOAD_SKIP"):
+			return response.get("file", None)
+		raise ClientError("upload", response.get("message", response["type"]))
+
+	def run_once(self):
+		payload = self.rng.choice(self.payloads) if self.payloads else self.make_default_payload()
+		expose = json.loads(json.dumps(payload.get("expose", {})))
+		self.current_workflow_id = payload["workflow_id"]
+
+		run_start = time.perf_counter()
+		for upload in payload.get("uploads", []):
+			file_path = self.upload(upload)
+			expose_value = expose.get(upload["expose_id"], None)
+			if not isinstance(expose_value, dict):
+				expose_value = {}
+				expose[upload["expose_id"]] = expose_value
+			expose_value["local_file"] = file_path
+		submit = time.perf_counter()
+		if payload.get("uploads", []):
+			self.stats.add_phase("upload", submit - run_start)
+
+		self.ws.send(json.dumps({"type": "WORKFLOW_OPERATION", "workflow_id": payload["workflow_id"], "expose": expose}))
+
+		started = None
+		first_file = None
+		last_file = None
+		pending_file_info = 0
+		while True:
+			message, data = self.recv()
+			if data is not None:
+				if self.framed:
+					header, data = decode_framed_message(data)
+				elif pending_file_info > 0:
+					pending_file_info -= 1
+				now = time.perf_counter()
+				first_file = first_file or now
+				last_file = now
+				self.stats.add("files_received")
+				self.stats.add("bytes_received", len(data))
+				continue
+
+			message_type = message.get("type", None)
+			if message_type == "WORKFLOW_START":
+				started = time.perf_counter()
+				self.stats.add_phase("queue", started - submit)
+			elif message_type == "FILE":
+				pending_file_info += 1
+			elif message_type == "ERROR":
+				raise ClientError("server_error", message.get("message", ""))
+			elif message_type == "WORKFLOW_FINISHED":
+				finished = time.perf_counter()
+				if message.get("error", False):
+					self.stats.add("runs_failed")
+					self.stats.add_error("run_failed")
+					self.log("run failed:", message.get("error_message", ""))
+				else:
+					self.stats.add("runs_ok")
+					if started is not None:
+						self.stats.add_phase("execute", finished - started)
+					if first_file is not None:
+						self.stats.add_phase("receive", last_file - first_file)
+					self.stats.add_phase("total", finished - run_start)
+				return
+
+	def run(self):
+		try:
+			self.connect()
+			for i in range(self.args.runs):
+				self.run_once()
+				if self.args.think_time:
+					time.sleep(self.args.think_time)
+		except ClientError as e:
+			self.stats.add_error(e.kind)
+			self.log("error:", e.kind, str(e))
+		except Exception as e:
+			self.stats.add_error("client_exception")
+			self.log("unexpected error:", e)
+		finally:
+			if self.ws is not None:
+				try:
+					self.ws.close()
+				except Exception:
+					pass
+
+def run_load(args):
+	payloads = load_payloads(args.payloads)
+
+	connection_options = {}
+	if args.proxy:
+		from urllib.parse import urlparse
+		p = urlparse(args.proxy)
+		connection_options["http_proxy_host"] = p.hostname
+		connection_options["http_proxy_port"] = p.port
+	if args.headers:
+		connection_options["header"] = list(map(str.strip, args.headers.split(",")))
+	sslopt = {}
+	if args.nocert:
+		sslopt = {"cert_reqs": ssl.CERT_NONE, "check_hostname": False}
+	if args.verbose > 1:
+		websocket.enableTrace(True)
+
+	stats = LoadStats()
+	clients = [SimulatedClient(i, args, payloads, stats, connection_options, sslopt) for i in range(args.clients)]
+	threads = [threading.Thread(target=client.run, daemon=True) for client in clients]
+
+	start = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	elapsed = time.perf_counter() - start
+
+	return build_report(args, stats, elapsed)
+
+def build_report(args, stats, elapsed):
+	attempted = args.clients * args.runs
+	completed = stats.runs_ok + stats.runs_failed
+	report = {
+		"clients": args.clients,
+		"runs_per_client": args.runs,
+		"elapsed_seconds": round(elapsed, 3),
+		"runs_ok": stats.runs_ok,
+		"runs_failed": stats.runs_failed,
+		"runs_not_completed": attempted - completed,
+		"error_rate": round((attempted - stats.runs_ok) / attempted, 4) if attempted else 0,
+		"errors": stats.errors,
+		"runs_per_second": round(stats.runs_ok / elapsed, 3) if elapsed > 0 else 0,
+		"received_mb_per_second": round(stats.bytes_received / elapsed / 1e6, 3) if elapsed > 0 else 0,
+		"sent_mb_per_second": round(stats.bytes_sent / elapsed / 1e6, 3) if elapsed > 0 else 0,
+		"files_received": stats.files_received,
+		"phases": {},
+	}
+	for phase in PHASES:
+		samples = stats.phases[phase]
+		if not samples:
+			continue
+		report["phases"][phase] = {
+			"count": len(samples),
+			"p50": round(percentile(samples, 50), 4),
+			"p95": round(percentile(samples, 95), 4),
+			"p99": round(percentile(samples, 99), 4),
+			"max": round(max(samples), 4),
+		}
+	return report
+
+def print_report(report):
+	print("clients: {clients}  runs/client: {runs_per_client}  elapsed: {elapsed_seconds}s".format(**report))
+	print("runs ok: {runs_ok}  failed: {runs_failed}  not completed: {runs_not_completed}  error rate: {error_rate:.2%}".format(**report))
+	if report["errors"]:
+		print("errors: " + ", ".join("{}={}".format(k, v) for k, v in sorted(report["errors"].items())))
+	print("throughput: {runs_per_second} runs/s  received {received_mb_per_second} MB/s  sent {sent_mb_per_second} MB/s".format(**report))
+	print("{:<10}{:>8}{:>10}{:>10}{:>10}{:>10}".format("phase", "count", "p50", "p95", "p99", "max"))
+	for phase, values in report["phases"].items():
+		print("{:<10}{:>8}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}".format(phase, values["count"], values["p50"], values["p95"], values["p99"], values["max"]))
+
+def main():
+	args = parse_args()
+	report = run_load(args)
+	if args.json:
+		print(json.dumps(report, indent=4))
+	else:
+		print_report(report)
+
+if __name__ == "__main__":
+	main()
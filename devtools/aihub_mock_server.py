@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the AIHub server, speaks enough of the protocol for the GIMP
+client (and devtools/aihub_load.py) to connect, upload files, run workflows and
+receive results without ComfyUI or a GPU.
+
+Latencies, payload sizes and failures come from a json scenario file, see
+devtools/mock_scenario.json, and every random decision uses a seeded generator
+so the same scenario gives the same timings on any machine.
+
+	python3 devtools/aihub_mock_server.py --port 8000 --scenario devtools/mock_scenario.json
+"""
+
+import argparse
+import base64
+import copy
+import hashlib
+import json
+import os
+import queue
+import random
+import socket
+import socketserver
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+
+# the vendored websocket package and framing.py live in the plug-in folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from websocket._abnf import ABNF, frame_buffer # noqa: E402
+from framing import FRAMED_FILES_PROTOCOL, encode_framed_message, decode_framed_message # noqa: E402
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+DEFAULT_SCENARIO = {
+	"seed": 1,
+	# how many runs the server executes at the same time, a real server has one per GPU
+	"workers": 1,
+	"framed_files": True,
+	"models": [],
+	"loras": [],
+	"samplers": ["euler", "euler_ancestral", "dpmpp_2m"],
+	"schedulers": ["normal", "karras"],
+	"workflows": {
+		"mock_img2img": {
+			"id": "mock_img2img",
+			"label": "Mock image to image",
+			"description": "Stand-in workflow served by the AIHub mock server",
+			"context": "image",
+			"category": "mock",
+			"expose": {
+				"image": {
+					"type": "AIHubExposeImage",
+					"data": {"label": "Image", "type": "merged_image", "index": 0},
+				},
+				"steps": {
+					"type": "AIHubExposeSteps",
+					"data": {"label": "Steps", "value": 20, "min": 1, "max": 150, "index": 1},
+				},
+				"seed": {
+					"type": "AIHubExposeSeed",
+					"data": {"label": "Seed", "value": 0, "index": 2},
+				},
+			},
+		},
+	},
+	"upload": {
+		"ack_delay_seconds": 0.0,
+		"success_delay_seconds": 0.0,
+		# bytes per second the server "processes" the upload at, 0 for instant
+		"bytes_per_second": 0,
+		"error_rate": 0.0,
+		"skip_known_files": True,
+	},
+	"runs": {
+		# used for every workflow, a key with the workflow id overrides any of these fields
+		"default": {
+			"queue_seconds": 0.0,
+			"jitter": 0.0,
+			"steps": [
+				{"node_name": "KSampler", "total": 20, "step_seconds": 0.05},
+			],
+			"files": [
+				{
+					"file_name": "result.png",
+					"file_action": "APPEND",
+					"action": "NEW_LAYER",
+					"width": 512,
+					"height": 512,
+					"name": "Mock result",
+				},
+			],
+			"batch": 1,
+			"config_values": {},
+			"use_as_frames": None,
+			"error_rate": 0.0,
+			"error_message": "Injected failure",
+			"drop_connection_rate": 0.0,
+		},
+	},
+}
+
+def merge_dicts(base, override):
+	result = copy.deepcopy(base)
+	for key, value in override.items():
+		if isinstance(value, dict) and isinstance(result.get(key, None), dict):
+			result[key] = merge_dicts(result[key], value)
+		else:
+			result[key] = copy.deepcopy(value)
+	return result
+
+def load_scenario(path):
+	if path is None:
+		return copy.deepcopy(DEFAULT_SCENARIO)
+	with open(path, "r") as f:
+		return merge_dicts(DEFAULT_SCENARIO, json.load(f))
+
+def make_png(width, height, color=(128, 128, 128, 255)):
+	"""
+	A solid colour RGBA png, enough for the client to load it as a layer
+	"""
+	def chunk(chunk_type, data):
+		body = chunk_type + data
+		return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xffffffff)
+	row = b"\x00" + bytes(color) * width
+	raw = row * height
+	return b"".join([
+		b"\x89PNG\r\n\x1a\n",
+		chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+		chunk(b"IDAT", zlib.compress(raw, 1)),
+		chunk(b"IEND", b""),
+	])
+
+def make_payload(file_spec, rng):
+	if "width" in file_spec and "height" in file_spec:
+		color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255), 255)
+		return make_png(int(file_spec["width"]), int(file_spec["height"]), color)
+	return rng.randbytes(int(file_spec.get("size", 1024)))
+
+class ConnectionClosed(Exception):
+	pass
+
+class MockConnection:
+	def __init__(self, server, sock, framed):
+		self.server = server
+		self.sock = sock
+		self.framed = framed
+		self.send_lock = threading.Lock()
+		self.closed = False
+		self.pending_upload = None
+		self.runs = {}
+
+	def recv_exact(self, bufsize):
+		data = self.sock.recv(bufsize)
+		if not data:
+			raise ConnectionClosed()
+		return data
+
+	def send_frame(self, opcode, data):
+		frame = ABNF(1, 0, 0, 0, opcode, 0, data).format()
+		with self.send_lock:
+			if self.closed:
+				raise ConnectionClosed()
+			try:
+				self.sock.sendall(frame)
+			except OSError:
+				self.closed = True
+				raise ConnectionClosed()
+
+	def send_json(self, message):
+		self.send_frame(ABNF.OPCODE_TEXT, json.dumps(message).encode("utf-8"))
+
+	def send_bytes(self, data):
+		self.send_frame(ABNF.OPCODE_BINARY, data)
+
+	def drop(self):
+		# simulate a crashed server or a network failure, no close frame
+		with self.send_lock:
+			self.closed = True
+			try:
+				self.sock.shutdown(socket.SHUT_RDWR)
+			except OSError:
+				pass
+
+	def serve(self):
+		scenario = self.server.scenario
+		self.send_json({
+			"type": "INFO_LIST",
+			"workflows": scenario["workflows"],
+			"models": scenario["models"],
+			"loras": scenario["loras"],
+			"samplers": scenario["samplers"],
+			"schedulers": scenario["schedulers"],
+			"framed_files": FRAMED_FILES_PROTOCOL if self.framed else None,
+		})
+
+		frames = frame_buffer(self.recv_exact, True)
+		while not self.closed:
+			frame = frames.recv_frame()
+			if frame.opcode == ABNF.OPCODE_CLOSE:
+				self.send_frame(ABNF.OPCODE_CLOSE, frame.data[:2])
+				break
+			elif frame.opcode == ABNF.OPCODE_PING:
+				self.send_frame(ABNF.OPCODE_PONG, frame.data)
+			elif frame.opcode == ABNF.OPCODE_TEXT:
+				self.on_text(json.loads(frame.data.decode("utf-8")))
+			elif frame.opcode == ABNF.OPCODE_BINARY:
+				self.on_binary(frame.data)
+
+	def on_text(self, message):
+		message_type = message.get("type", None)
+		if message_type == "FILE_UPLOAD":
+			self.on_file_upload(message, None)
+		elif message_type == "WORKFLOW_OPERATION":
+			if "cancel" in message:
+				run = self.runs.get(message["cancel"], None)
+				if run is not None:
+					run["cancelled"] = True
+			else:
+				self.server.enqueue_run(self, message)
+		else:
+			self.send_json({"type": "ERROR", "message": "Unknown message type {}".format(message_type)})
+
+	def on_binary(self, data):
+		if self.framed and self.pending_upload is None:
+			header, payload = decode_framed_message(data)
+			if header.get("type", None) == "FILE_UPLOAD":
+				self.on_file_upload(header, payload)
+				return
+			self.send_json({"type": "ERROR", "message": "Unexpected framed message"})
+			return
+		if self.pending_upload is None:
+			self.send_json({"type": "ERROR", "message": "Binary data received without FILE_UPLOAD"})
+			return
+		header = self.pending_upload
+		self.pending_upload = None
+		self.finish_upload(header, data)
+
+	def on_file_upload(self, header, payload):
+		upload = self.server.scenario["upload"]
+		rng = self.server.rng_for("upload", self.server.next_index("upload"))
+		filename = header.get("filename", uuid.uuid4().hex)
+
+		if rng.random() < upload["error_rate"]:
+			self.send_json({"type": "ERROR", "message": "Injected upload failure"})
+			return
+
+		if header.get("if_not_exists", False) and upload["skip_known_files"] and self.server.has_upload(filename):
+			self.send_json({"type": "FILE_UPLOAD_SKIP", "file": self.server.upload_path(filename)})
+			return
+
+		if payload is None:
+			time.sleep(upload["ack_delay_seconds"])
+			self.pending_upload = header
+			self.send_json({"type": "UPLOAD_ACK"})
+		else:
+			self.finish_upload(header, payload)
+
+	def finish_upload(self, header, payload):
+		upload = self.server.scenario["upload"]
+		delay = upload["success_delay_seconds"]
+		if upload["bytes_per_second"]:
+			delay += len(payload) / upload["bytes_per_second"]
+		time.sleep(delay)
+		filename = header.get("filename", uuid.uuid4().hex)
+		self.server.add_upload(filename, len(payload))
+		self.send_json({"type": "FILE_UPLOAD_SUCCESS", "file": self.server.upload_path(filename)})
+
+	def send_file(self, file_message, payload):
+		if self.framed:
+			self.send_bytes(encode_framed_message(file_message, payload))
+		else:
+			self.send_json(file_message)
+			self.send_bytes(payload)
+
+class MockServer(socketserver.ThreadingTCPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def __init__(self, host, port, scenario, verbose=False):
+		self.scenario = scenario
+		self.verbose = verbose
+		self.uploads = {}
+		self.uploads_lock = threading.Lock()
+		self.run_queue = queue.Queue()
+		self.queued_runs = []
+		self.queued_runs_lock = threading.Lock()
+		# how many runs and uploads were numbered so far, see rng_for
+		self.counters = {}
+		self.counters_lock = threading.Lock()
+		self.stats = {"connections": 0, "runs": 0, "failed_runs": 0, "bytes_sent": 0}
+		self.stats_lock = threading.Lock()
+		super().__init__((host, port), MockRequestHandler)
+
+		for _ in range(max(1, int(scenario["workers"]))):
+			threading.Thread(target=self.run_worker, daemon=True).start()
+
+	def log(self, *args):
+		if self.verbose:
+			print(*args, flush=True)
+
+	def count(self, key, amount=1):
+		with self.stats_lock:
+			self.stats[key] += amount
+
+	def rng_for(self, name, index):
+		# one generator per purpose so that, for instance, the number of uploads does
+		# not change which runs fail, and one per run or upload so workers running at
+		# once do not take numbers from each other and the seed decides the outcome
+		return random.Random("{}:{}:{}".format(self.scenario["seed"], name, index))
+
+	def next_index(self, name):
+		with self.counters_lock:
+			index = self.counters.get(name, 0)
+			self.counters[name] = index + 1
+			return index
+
+	def has_upload(self, filename):
+		with self.uploads_lock:
+			return filename in self.uploads
+
+	def add_upload(self, filename, size):
+		with self.uploads_lock:
+			self.uploads[filename] = size
+
+	def upload_path(self, filename):
+		return "uploads/{}".format(filename)
+
+	def get_run_spec(self, workflow_id):
+		runs = self.scenario["runs"]
+		spec = runs["default"]
+		if workflow_id in runs:
+			spec = merge_dicts(spec, runs[workflow_id])
+		return spec
+
+	def enqueue_run(self, connection, message):
+		workflow_id = message.get("workflow_id", None)
+		if workflow_id not in self.scenario["workflows"]:
+			connection.send_json({"type": "ERROR", "message": "Unknown workflow {}".format(workflow_id)})
+			return
+		run = {
+			"id": uuid.uuid4().hex,
+			# numbered in the order they arrive, which decides their random numbers
+			"index": self.next_index("runs"),
+			"workflow_id": workflow_id,
+			"expose": message.get("expose", {}),
+			"connection": connection,
+			"cancelled": False,
+		}
+		connection.runs[run["id"]] = run
+		with self.queued_runs_lock:
+			before_this = len(self.queued_runs)
+			self.queued_runs.append(run)
+		connection.send_json({"type": "WORKFLOW_AWAIT", "id": run["id"], "workflow_id": workflow_id, "before_this": before_this})
+		self.run_queue.put(run)
+
+	def run_worker(self):
+		while True:
+			run = self.run_queue.get()
+			with self.queued_runs_lock:
+				if run in self.queued_runs:
+					self.queued_runs.remove(run)
+			try:
+				self.execute_run(run)
+			except ConnectionClosed:
+				pass
+			except Exception as e:
+				print("Error executing mock run:", e, flush=True)
+
+	def execute_run(self, run):
+		connection = run["connection"]
+		spec = self.get_run_spec(run["workflow_id"])
+		rng = self.rng_for("runs", run["index"])
+
+		def sleep(seconds):
+			jitter = spec["jitter"]
+			if jitter:
+				seconds = seconds * (1 + rng.uniform(-jitter, jitter))
+			time.sleep(max(0, seconds))
+
+		def finish(error, error_message=None):
+			connection.runs.pop(run["id"], None)
+			self.count("runs")
+			if error:
+				self.count("failed_runs")
+			connection.send_json({"type": "WORKFLOW_FINISHED", "id": run["id"], "workflow_id": run["workflow_id"], "error": error, "error_message": error_message})
+
+		if connection.closed:
+			return
+
+		sleep(spec["queue_seconds"])
+		connection.send_json({"type": "WORKFLOW_START", "id": run["id"], "workflow_id": run["workflow_id"]})
+		self.log("run started", run["id"], run["workflow_id"])
+
+		fail_at_step = None
+		if rng.random() < spec["error_rate"]:
+			fail_at_step = rng.randint(0, max(0, sum(step["total"] for step in spec["steps"]) - 1))
+		drop_at_step = None
+		if rng.random() < spec["drop_connection_rate"]:
+			drop_at_step = rng.randint(0, max(0, sum(step["total"] for step in spec["steps"]) - 1))
+
+		step_index = 0
+		for step in spec["steps"]:
+			for progress in range(1, step["total"] + 1):
+				if run["cancelled"]:
+					finish(True, "Cancelled by user")
+					return
+				if step_index == drop_at_step:
+					self.log("dropping connection", run["id"])
+					connection.drop()
+					return
+				if step_index == fail_at_step:
+					finish(True, spec["error_message"])
+					return
+				sleep(step["step_seconds"])
+				connection.send_json({"type": "WORKFLOW_STATUS", "id": run["id"], "node_name": step["node_name"], "progress": progress, "total": step["total"]})
+				step_index += 1
+
+		for field, value in spec["config_values"].items():
+			connection.send_json({"type": "SET_CONFIG_VALUE", "field": field, "value": value})
+
+		files_rng = self.rng_for("files", run["index"])
+		for file_spec in spec["files"]:
+			batch = int(file_spec.get("batch", spec["batch"]))
+			if batch > 1:
+				connection.send_json({"type": "PREPARE_BATCH", "file_name": file_spec["file_name"], "file_action": file_spec.get("file_action", "APPEND")})
+			for batch_index in range(batch):
+				# the scenario spec is flat, on the wire the file details go under "action"
+				# like the real server sends them
+				file_action = {
+					"file_name": file_spec["file_name"],
+					"file_action": file_spec.get("file_action", "APPEND"),
+					"action": file_spec.get("action", "NEW_LAYER"),
+					"name": file_spec.get("name", "Mock result"),
+					"pos_x": file_spec.get("pos_x", 0),
+					"pos_y": file_spec.get("pos_y", 0),
+				}
+				if batch > 1:
+					file_action["batch_index"] = batch_index
+				file_message = {
+					"type": "FILE",
+					"action": file_action,
+				}
+				payload = make_payload(file_spec, files_rng)
+				sleep(file_spec.get("delay_seconds", 0))
+				connection.send_file(file_message, payload)
+				self.count("bytes_sent", len(payload))
+
+		if spec["use_as_frames"] is not None:
+			connection.send_json(dict(spec["use_as_frames"], type="USE_AS_FRAMES"))
+
+		finish(False)
+		self.log("run finished", run["id"])
+
+class MockRequestHandler(socketserver.BaseRequestHandler):
+	def read_http_request(self):
+		data = b""
+		while b"\r\n\r\n" not in data:
+			chunk = self.request.recv(4096)
+			if not chunk:
+				return None, {}
+			data += chunk
+			if len(data) > 65536:
+				return None, {}
+		head = data.split(b"\r\n\r\n", 1)[0].decode("latin-1")
+		lines = head.split("\r\n")
+		headers = {}
+		for line in lines[1:]:
+			if ":" in line:
+				key, value = line.split(":", 1)
+				headers[key.strip().lower()] = value.strip()
+		return lines[0], headers
+
+	def handle(self):
+		request_line, headers = self.read_http_request()
+		if request_line is None:
+			return
+
+		if headers.get("upgrade", "").lower() != "websocket":
+			# workflow images and anything else over plain http, the client copes with a 404
+			self.request.sendall(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+			return
+
+		key = headers.get("sec-websocket-key", "")
+		accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("latin-1")).digest()).decode("latin-1")
+		self.request.sendall((
+			"HTTP/1.1 101 Switching Protocols\r\n"
+			"Upgrade: websocket\r\n"
+			"Connection: Upgrade\r\n"
+			"Sec-WebSocket-Accept: {}\r\n\r\n"
+		).format(accept).encode("latin-1"))
+
+		framed = self.server.scenario["framed_files"] and headers.get("framing", None) == FRAMED_FILES_PROTOCOL
+		connection = MockConnection(self.server, self.request, framed)
+		self.server.count("connections")
+		self.server.log("client connected", self.client_address, "framed" if framed else "")
+		try:
+			connection.serve()
+		except (ConnectionClosed, OSError):
+			pass
+		finally:
+			connection.closed = True
+			self.server.log("client disconnected", self.client_address)
+
+def start_mock_server(host="127.0.0.1", port=0, scenario=None, verbose=False):
+	"""
+	Starts the server in a background thread and returns it, port 0 picks a free
+	port that can be read back from server.server_address
+	"""
+	server = MockServer(host, port, scenario or copy.deepcopy(DEFAULT_SCENARIO), verbose)
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+def main():
+	parser = argparse.ArgumentParser(description="AIHub protocol stand-in server")
+	parser.add_argument("--host", default="127.0.0.1")
+	parser.add_argument("--port", type=int, default=8000)
+	parser.add_argument("--scenario", help="json file with the latencies, sizes and failures to simulate")
+	parser.add_argument("--seed", type=int, help="overrides the scenario seed")
+	parser.add_argument("--workers", type=int, help="overrides how many runs execute at the same time")
+	parser.add_argument("--no-framing", action="store_true", help="do not accept framed file transfers")
+	parser.add_argument("-v", "--verbose", action="store_true")
+	args = parser.parse_args()
+
+	scenario = load_scenario(args.scenario)
+	if args.seed is not None:
+		scenario["seed"] = args.seed
+	if args.workers is not None:
+		scenario["workers"] = args.workers
+	if args.no_framing:
+		scenario["framed_files"] = False
+
+	server = MockServer(args.host, args.port, scenario, args.verbose)
+	print("AIHub mock server listening on ws://{}:{}/ws".format(*server.server_address), flush=True)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		print(json.dumps(server.stats))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Time it takes to branch a timeline with every method of projectstorage.clone_tree_cow
+against a plain shutil.copytree, on a synthetic timeline made of video frames and a
+few big intermediate files, and how much new disk space every branch uses.
+
+	python3 devtools/bench_branching.py --size-gb 5 --folder /path/on/the/disk/to/test
+
+The folder has to be on the filesystem the projects live on, reflinks only work on
+btrfs, xfs and the like, and /tmp is often a tmpfs that can not do them.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from projectstorage import clone_tree_cow # noqa: E402
+
+BLOCK_SIZE = 1024 * 1024
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Timeline branching time against the branching method")
+	parser.add_argument("--size-gb", type=float, default=5.0, help="total size of the synthetic timeline")
+	parser.add_argument("--big-files", type=int, default=8, help="intermediate files that hold half of the size")
+	parser.add_argument("--frames", type=int, default=2000, help="small files that hold the other half")
+	parser.add_argument("--folder", default=None, help="where to build the timeline, defaults to the temporary folder")
+	parser.add_argument("--methods", default="copytree,copy,reflink,auto", help="comma separated methods to try")
+	parser.add_argument("--json", action="store_true", help="print the results as json")
+	return parser.parse_args()
+
+def write_file(filepath, size, seed):
+	# every file gets different contents so nothing can be deduplicated behind our back
+	block = (seed.to_bytes(8, "little") * (BLOCK_SIZE // 8))
+	with open(filepath, "wb") as f:
+		remaining = size
+		while remaining > 0:
+			f.write(block[:min(BLOCK_SIZE, remaining)])
+			remaining -= BLOCK_SIZE
+
+def make_timeline(folder, args):
+	total_size = int(args.size_gb * 1024 * 1024 * 1024)
+	files_folder = os.path.join(folder, "files")
+	frames_folder = os.path.join(files_folder, "frames")
+	os.makedirs(frames_folder)
+
+	big_file_size = total_size // 2 // max(1, args.big_files)
+	for i in range(args.big_files):
+		write_file(os.path.join(files_folder, f"intermediate_{i}.safetensors"), big_file_size, i)
+
+	frame_size = total_size // 2 // max(1, args.frames)
+	for i in range(args.frames):
+		write_file(os.path.join(frames_folder, f"frame_{i + 1:08d}.png"), frame_size, args.big_files + i)
+
+	with open(os.path.join(folder, "config.json"), "w") as f:
+		json.dump({}, f)
+	return args.big_files + args.frames + 1
+
+def get_free_bytes(folder):
+	usage = shutil.disk_usage(folder)
+	return usage.free
+
+def bench_method(method, source_folder, destination_folder):
+	free_before = get_free_bytes(source_folder)
+	start = time.perf_counter()
+	if method == "copytree":
+		shutil.copytree(source_folder, destination_folder, dirs_exist_ok=True)
+		counts = None
+	else:
+		counts = clone_tree_cow(source_folder, destination_folder, method)
+	seconds = time.perf_counter() - start
+	if hasattr(os, "sync"):
+		# the free space only moves once the data is flushed
+		os.sync()
+	used_bytes = max(0, free_before - get_free_bytes(source_folder))
+	return {
+		"method": method,
+		"seconds": round(seconds, 3),
+		"used_mb": round(used_bytes / 1024 / 1024, 1),
+		"counts": counts,
+	}
+
+def main():
+	args = parse_args()
+	folder = tempfile.mkdtemp(prefix="aihub_bench_branching_", dir=args.folder)
+	try:
+		source_folder = os.path.join(folder, "timelines", "parent")
+		start = time.perf_counter()
+		file_count = make_timeline(source_folder, args)
+		setup_seconds = time.perf_counter() - start
+
+		results = []
+		for i, method in enumerate(args.methods.split(",")):
+			destination_folder = os.path.join(folder, "timelines", f"branch_{i}")
+			results.append(bench_method(method, source_folder, destination_folder))
+			shutil.rmtree(destination_folder, ignore_errors=True)
+	finally:
+		shutil.rmtree(folder, ignore_errors=True)
+
+	if args.json:
+		print(json.dumps(results, indent=4))
+		return
+
+	print("{:.1f} GB timeline in {} files, written in {:.1f}s".format(args.size_gb, file_count, setup_seconds))
+	print("{:>10}{:>12}{:>12}   {}".format("method", "seconds", "used MB", "files by method"))
+	for result in results:
+		counts = "-" if result["counts"] is None else ", ".join("{} {}".format(count, name) for name, count in result["counts"].items() if count > 0)
+		print("{:>10}{:>12.3f}{:>12.1f}   {}".format(result["method"], result["seconds"], result["used_mb"], counts))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Time it takes to fill the project dialog file grid with N files and to apply a batch of
+updates to it, for the filegrid.FileGrid model backed grid against the Gtk.FlowBox of
+hand built widgets the dialog used before, both in an offscreen window.
+
+	python3 devtools/bench_project_grid.py --files 5000 --updates 500
+
+Needs PyGObject with Gtk 3 and a display (xvfb-run works), no GIMP.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import gi
+gi.require_version("Gtk", "3.0")
+from gi.repository import Gtk # type: ignore # noqa: E402
+from gi.repository.GdkPixbuf import Pixbuf, Colorspace # type: ignore # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filegrid import FileGrid # noqa: E402
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Project dialog file grid fill and update times")
+	parser.add_argument("--files", type=int, default=5000, help="files in the grid")
+	parser.add_argument("--updates", type=int, default=500, help="files added or updated one by one after the fill")
+	parser.add_argument("--grids", default="flowbox,filegrid", help="comma separated grids to try, the flowbox one takes minutes past a few thousand files")
+	parser.add_argument("--seed", type=int, default=1)
+	parser.add_argument("--json", action="store_true", help="print the results as json")
+	return parser.parse_args()
+
+def make_thumbnail(color):
+	pixbuf = Pixbuf.new(Colorspace.RGB, False, 8, 100, 100)
+	pixbuf.fill(color)
+	return pixbuf
+
+def process_events():
+	while Gtk.events_pending():
+		Gtk.main_iteration_do(False)
+
+def count_widgets(widget):
+	count = 1
+	if isinstance(widget, Gtk.Container):
+		for child in widget.get_children():
+			count += count_widgets(child)
+	return count
+
+class FlowBoxGrid:
+	"""
+	What the dialog did before, one EventBox/Box/Image/Label per file, found by walking the
+	children and inserted in order by walking them again
+	"""
+	def __init__(self, thumbnail):
+		self.thumbnail = thumbnail
+		self.widget = Gtk.FlowBox()
+		self.widget.set_column_spacing(10)
+		self.widget.set_row_spacing(10)
+
+	def add_or_update(self, name, file_path):
+		for file_element in self.widget.get_children():
+			label = file_element.get_child().get_child().get_children()[1]
+			if label.get_text() == name:
+				file_element.get_child().get_child().get_children()[0].set_from_pixbuf(self.thumbnail)
+				return
+		event_box = Gtk.EventBox()
+		box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+		box.pack_start(Gtk.Image.new_from_pixbuf(self.thumbnail), False, False, 0)
+		box.pack_start(Gtk.Label(label=name), False, False, 0)
+		event_box.add(box)
+		for i, file_element in enumerate(self.widget.get_children()):
+			if name < file_element.get_child().get_child().get_children()[1].get_text():
+				self.widget.insert(event_box, i)
+				break
+		else:
+			self.widget.add(event_box)
+		event_box.show_all()
+
+	def set_files(self, files):
+		for name, file_path in files.items():
+			self.add_or_update(name, file_path)
+
+def bench_grid(name, grid, widget, files, updates):
+	window = Gtk.OffscreenWindow()
+	window.set_default_size(600, 800)
+	window.add(widget)
+	window.show_all()
+	process_events()
+
+	start = time.perf_counter()
+	grid.set_files(files)
+	process_events()
+	fill_seconds = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for update_name, update_path in updates:
+		grid.add_or_update(update_name, update_path)
+	process_events()
+	update_seconds = time.perf_counter() - start
+
+	widgets = count_widgets(window)
+	window.destroy()
+	process_events()
+	return {
+		"grid": name,
+		"fill_seconds": round(fill_seconds, 3),
+		"update_seconds": round(update_seconds, 3),
+		"widgets": widgets,
+	}
+
+def main():
+	args = parse_args()
+	random.seed(args.seed)
+	thumbnail = make_thumbnail(0x3366ccff)
+	placeholder = make_thumbnail(0x999999ff)
+
+	names = [f"file_{i:06d}.png" for i in range(args.files)]
+	# the files arrive in no particular order, like os.listdir gives them
+	random.shuffle(names)
+	files = {name: os.path.join("/nonexistent", name) for name in names}
+	# half of the updates touch existing files and half are new files
+	updates = []
+	for i in range(args.updates):
+		if i % 2 == 0:
+			update_name = random.choice(names)
+		else:
+			update_name = f"new_{i:06d}.png"
+		updates.append((update_name, os.path.join("/nonexistent", update_name)))
+
+	results = []
+
+	grids = args.grids.split(",")
+	if "flowbox" in grids:
+		flowbox_grid = FlowBoxGrid(thumbnail)
+		results.append(bench_grid("flowbox", flowbox_grid, flowbox_grid.widget, files, updates))
+
+	if "filegrid" in grids:
+		thumbnails_asked = []
+		def get_thumbnail(file_path, on_ready):
+			thumbnails_asked.append(file_path)
+			return thumbnail
+		file_grid = FileGrid(get_thumbnail, lambda file_path: placeholder, lambda file_path: None, lambda file_path, event: None, height=800)
+		result = bench_grid("filegrid", file_grid, file_grid.widget, files, updates)
+		# only the rows that scrolled into view ever ask for their thumbnail
+		result["thumbnails_asked"] = len(thumbnails_asked)
+		results.append(result)
+
+	if args.json:
+		print(json.dumps(results, indent=4))
+		return
+
+	print("{} files, {} updates".format(args.files, args.updates))
+	print("{:>10}{:>12}{:>12}{:>10}{:>12}".format("grid", "fill s", "update s", "widgets", "thumbnails"))
+	for result in results:
+		print("{:>10}{:>12.3f}{:>12.3f}{:>10}{:>12}".format(
+			result["grid"],
+			result["fill_seconds"],
+			result["update_seconds"],
+			result["widgets"],
+			result.get("thumbnails_asked", "-"),
+		))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Wall-clock time of a tiled run against the number of tiles, using the mock server as
+the backend so it runs anywhere. Every tile costs a fixed overhead plus a time
+proportional to its megapixels, and the server runs as many tiles at the same time as
+it has workers, like a server with that many GPUs would.
+
+	python3 devtools/bench_tiling.py --width 6000 --height 4000 --workers 4
+
+Blending is measured too when numpy is installed.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aihub_mock_server import DEFAULT_SCENARIO, make_png, merge_dicts, start_mock_server # noqa: E402
+from tiling import TiledRun, blend_tiles, can_blend_tiles, compute_tiles, np # noqa: E402
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Tiled run wall-clock time against tile count")
+	parser.add_argument("--width", type=int, default=6000)
+	parser.add_argument("--height", type=int, default=4000)
+	parser.add_argument("--tile-sizes", default="6000,4096,2048,1536,1024,768", help="comma separated tile sizes to try")
+	parser.add_argument("--overlap", type=int, default=128)
+	parser.add_argument("--workers", type=int, default=4, help="runs the mock server executes at the same time")
+	parser.add_argument("--parallel", type=int, default=None, help="tiles queued at the same time, defaults to the workers")
+	parser.add_argument("--overhead-seconds", type=float, default=0.3, help="fixed cost of every run (model load, vae...)")
+	parser.add_argument("--seconds-per-megapixel", type=float, default=0.25)
+	parser.add_argument("--no-framing", action="store_true")
+	parser.add_argument("--json", action="store_true", help="print the results as json")
+	return parser.parse_args()
+
+def decode_mock_png(data):
+	# the mock server only writes 8 bit RGBA pngs with no row filters
+	width = int.from_bytes(data[16:20], "big")
+	height = int.from_bytes(data[20:24], "big")
+	pos = 8
+	idat = b""
+	while pos < len(data):
+		length = int.from_bytes(data[pos:pos + 4], "big")
+		if data[pos + 4:pos + 8] == b"IDAT":
+			idat += data[pos + 8:pos + 8 + length]
+		pos += 12 + length
+	rows = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, width * 4 + 1)
+	return rows[:, 1:].reshape(height, width, 4)
+
+def bench_tile_size(args, tile_size, folder):
+	tiles = compute_tiles(args.width, args.height, tile_size, args.overlap)
+	tile_width = tiles[0]["width"]
+	tile_height = tiles[0]["height"]
+	exec_seconds = args.overhead_seconds + args.seconds_per_megapixel * tile_width * tile_height / 1e6
+
+	scenario = merge_dicts(DEFAULT_SCENARIO, {
+		"workers": args.workers,
+		"framed_files": not args.no_framing,
+		"runs": {
+			"default": {
+				"steps": [{"node_name": "KSampler", "total": 10, "step_seconds": exec_seconds / 10}],
+				"files": [{"file_name": "result.png", "action": "NEW_LAYER", "width": tile_width, "height": tile_height}],
+			},
+		},
+	})
+	server = start_mock_server(scenario=scenario)
+	try:
+		tile_files = []
+		for tile in tiles:
+			tile_file = os.path.join(folder, "tile_{}_{}.png".format(tile_size, tile["index"]))
+			with open(tile_file, "wb") as f:
+				f.write(make_png(tile_width, tile_height, (tile["index"] % 256, 64, 128, 255)))
+			tile_files.append(tile_file)
+
+		tiled_run = TiledRun(
+			"ws://{}:{}/ws".format(*server.server_address),
+			{"api-key": "bench", "client": "bench-tiling", "locale": "en"},
+			None,
+			"mock_img2img",
+			{"image": {"type": "merged_image"}},
+			"image",
+			tiles,
+			tile_files,
+			max_parallel=args.parallel or args.workers,
+			framed_files_requested=not args.no_framing,
+		)
+		start = time.perf_counter()
+		results = tiled_run.run()
+		run_seconds = time.perf_counter() - start
+
+		blend_seconds = None
+		if can_blend_tiles():
+			start = time.perf_counter()
+			tile_pixels = [decode_mock_png(files[0][1]) for files in results]
+			blend_tiles(args.width, args.height, tiles, tile_pixels)
+			blend_seconds = time.perf_counter() - start
+	finally:
+		server.shutdown()
+		server.server_close()
+
+	return {
+		"tile_size": tile_size,
+		"tiles": len(tiles),
+		"tile_exec_seconds": round(exec_seconds, 3),
+		"sequential_exec_seconds": round(exec_seconds * len(tiles), 3),
+		"run_seconds": round(run_seconds, 3),
+		"blend_seconds": round(blend_seconds, 3) if blend_seconds is not None else None,
+	}
+
+def main():
+	args = parse_args()
+	folder = tempfile.mkdtemp(prefix="aihub_bench_tiling_")
+	try:
+		results = [bench_tile_size(args, int(size), folder) for size in args.tile_sizes.split(",")]
+	finally:
+		shutil.rmtree(folder, ignore_errors=True)
+
+	if args.json:
+		print(json.dumps(results, indent=4))
+		return
+
+	print("{}x{} image, overlap {}, {} workers".format(args.width, args.height, args.overlap, args.workers))
+	if not can_blend_tiles():
+		print("numpy is not installed, blending is not measured")
+	print("{:>10}{:>8}{:>14}{:>14}{:>12}{:>12}".format("tile size", "tiles", "tile exec s", "sequential s", "run s", "blend s"))
+	for result in results:
+		print("{:>10}{:>8}{:>14.3f}{:>14.3f}{:>12.3f}{:>12}".format(
+			result["tile_size"],
+			result["tiles"],
+			result["tile_exec_seconds"],
+			result["sequential_exec_seconds"],
+			result["run_seconds"],
+			"-" if result["blend_seconds"] is None else "{:.3f}".format(result["blend_seconds"]),
+		))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,286 @@
+import os
+import time
+
+from gi.repository import Gtk, Gdk, GLib, Gio # type: ignore
+from gi.repository.GdkPixbuf import Pixbuf # type: ignore
+
+COLUMN_NAME = 0
+COLUMN_PATH = 1
+COLUMN_PIXBUF = 2
+# whether the thumbnail was asked for already, rows start with the placeholder icon
+COLUMN_LOADED = 3
+
+# changes in a watched folder are applied once it has been quiet for this long, so a batch
+# of files written by a run becomes one update, but never later than MONITOR_MAX_DELAY_MS
+# after the first change
+MONITOR_DEBOUNCE_MS = 250
+MONITOR_MAX_DELAY_MS = 2000
+MONITOR_EVENTS = {
+	Gio.FileMonitorEvent.CREATED,
+	Gio.FileMonitorEvent.DELETED,
+	Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+	Gio.FileMonitorEvent.MOVED_IN,
+	Gio.FileMonitorEvent.MOVED_OUT,
+	Gio.FileMonitorEvent.RENAMED,
+}
+
+class FileGrid:
+	"""
+	Grid of files with their thumbnails, the files are rows of a Gtk.ListStore kept sorted by
+	name and found through a name to row index, the Gtk.IconView only draws the rows that are on
+	screen and the thumbnails are only asked for once their row scrolls into view
+
+	get_thumbnail(file_path, on_ready) returns the thumbnail if it is at hand, otherwise None and
+	calls on_ready(pixbuf) later, get_placeholder(file_path) returns the icon to show meanwhile,
+	on_activate(file_path) is called on double click and on_context_menu(file_path, event) on
+	right click
+	"""
+	def __init__(self, get_thumbnail, get_placeholder, on_activate, on_context_menu, height=400):
+		self.get_thumbnail = get_thumbnail
+		self.get_placeholder = get_placeholder
+		self.on_activate = on_activate
+		self.on_context_menu = on_context_menu
+		# ListStore iters stay valid for as long as their row exists
+		self.rows = {}
+		self.load_scheduled = False
+
+		self.watched_folder = None
+		self.watched_exclude = None
+		self.monitor = None
+		# names that changed in the watched folder since the last update
+		self.changed_names = set()
+		self.changes_source = None
+		self.first_change_time = None
+
+		self.store = Gtk.ListStore(str, str, Pixbuf, bool)
+		self.store.set_sort_column_id(COLUMN_NAME, Gtk.SortType.ASCENDING)
+
+		self.view = Gtk.IconView(model=self.store)
+		self.view.set_pixbuf_column(COLUMN_PIXBUF)
+		self.view.set_text_column(COLUMN_NAME)
+		self.view.set_item_width(110)
+		self.view.set_column_spacing(10)
+		self.view.set_row_spacing(10)
+		self.view.set_selection_mode(Gtk.SelectionMode.SINGLE)
+		self.view.connect("item-activated", self.on_item_activated)
+		self.view.connect("button-press-event", self.on_button_press)
+		self.view.connect("size-allocate", self.on_view_changed)
+
+		self.widget = Gtk.ScrolledWindow()
+		self.widget.set_policy(Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
+		self.widget.set_size_request(200, height)
+		self.widget.add(self.view)
+		self.widget.get_vadjustment().connect("value-changed", self.on_view_changed)
+
+	def __len__(self):
+		return len(self.rows)
+
+	def __contains__(self, name):
+		return name in self.rows
+
+	def get_file_path(self, name):
+		row = self.rows.get(name, None)
+		if row is None:
+			return None
+		return self.store.get_value(row, COLUMN_PATH)
+
+	def add_row(self, name, file_path):
+		self.rows[name] = self.store.insert_with_values(
+			-1,
+			[COLUMN_NAME, COLUMN_PATH, COLUMN_PIXBUF, COLUMN_LOADED],
+			[name, file_path, self.get_placeholder(file_path), False],
+		)
+
+	def add_or_update(self, name, file_path):
+		"""
+		Adds the file, or if it is there already marks its thumbnail to be made again since
+		the file changed, the old thumbnail stays until the new one is ready
+		"""
+		row = self.rows.get(name, None)
+		if row is None:
+			self.add_row(name, file_path)
+		else:
+			self.store.set(row, [COLUMN_PATH, COLUMN_LOADED], [file_path, False])
+		self.schedule_load_visible()
+
+	def remove(self, name):
+		row = self.rows.pop(name, None)
+		if row is not None:
+			self.store.remove(row)
+
+	def rename(self, name, new_name, new_file_path):
+		row = self.rows.pop(name, None)
+		if row is None:
+			return
+		self.store.set(row, [COLUMN_NAME, COLUMN_PATH], [new_name, new_file_path])
+		self.rows[new_name] = row
+
+	def clear(self):
+		self.rows = {}
+		self.store.clear()
+
+	def set_files(self, files):
+		"""
+		Makes the grid show exactly the given files, files is a dict of name to path, rows of
+		files that are still there keep their thumbnail
+		"""
+		if len(self.rows) == 0:
+			# nothing to keep, so the rows are added with the view detached instead of
+			# having it relayout after every one of them
+			self.view.set_model(None)
+			for name in sorted(files.keys()):
+				self.add_row(name, files[name])
+			self.view.set_model(self.store)
+		else:
+			for name in [name for name in self.rows.keys() if name not in files]:
+				self.remove(name)
+			for name, file_path in files.items():
+				row = self.rows.get(name, None)
+				if row is None:
+					self.add_row(name, file_path)
+				else:
+					# the file may have been written again, its thumbnail is looked up again
+					# when it comes into view, which is only a stat if it did not change
+					self.store.set(row, [COLUMN_PATH, COLUMN_LOADED], [file_path, False])
+		self.schedule_load_visible()
+
+	def reload(self, name):
+		file_path = self.get_file_path(name)
+		if file_path is not None:
+			self.add_or_update(name, file_path)
+
+	def watch_folder(self, folder, exclude=None):
+		"""
+		Shows the files of the folder and keeps the grid in step with it through a file
+		monitor, the folder is only listed when it is not the one being watched already
+		"""
+		folder = os.path.abspath(folder)
+		if self.monitor is not None and self.watched_folder == folder:
+			return
+		self.stop_watching()
+		self.set_files(list_folder_files(folder, exclude))
+		try:
+			# watching a folder that does not exist yet is fine, it is picked up once created
+			self.monitor = Gio.File.new_for_path(folder).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+		except GLib.Error as e:
+			print("Error watching folder {}:".format(folder), e)
+			return
+		self.monitor.connect("changed", self.on_folder_changed)
+		self.watched_folder = folder
+		self.watched_exclude = exclude
+
+	def stop_watching(self):
+		if self.monitor is not None:
+			self.monitor.cancel()
+			self.monitor = None
+		if self.changes_source is not None:
+			GLib.source_remove(self.changes_source)
+			self.changes_source = None
+		self.watched_folder = None
+		self.watched_exclude = None
+		self.changed_names = set()
+		self.first_change_time = None
+
+	def on_folder_changed(self, monitor, file, other_file, event_type):
+		if monitor is not self.monitor or event_type not in MONITOR_EVENTS:
+			return
+		for changed in (file, other_file):
+			if changed is None:
+				continue
+			changed_path = changed.get_path()
+			# events for the folder itself or for files in subfolders are of no interest
+			if changed_path is None or os.path.dirname(changed_path) != self.watched_folder:
+				continue
+			name = os.path.basename(changed_path)
+			if self.watched_exclude is None or not self.watched_exclude(name):
+				self.changed_names.add(name)
+		if len(self.changed_names) == 0:
+			return
+
+		now = time.monotonic()
+		if self.first_change_time is None:
+			self.first_change_time = now
+		if self.changes_source is not None:
+			if (now - self.first_change_time) * 1000 >= MONITOR_MAX_DELAY_MS:
+				# changes keep coming, let the pending update happen
+				return
+			GLib.source_remove(self.changes_source)
+		self.changes_source = GLib.timeout_add(MONITOR_DEBOUNCE_MS, self.apply_folder_changes)
+
+	def apply_folder_changes(self):
+		self.changes_source = None
+		self.first_change_time = None
+		changed_names = self.changed_names
+		self.changed_names = set()
+		# the events only tell which names to look at, what is on disk now decides, so
+		# events that arrive out of order or cancel each other do no harm
+		for name in changed_names:
+			file_path = os.path.join(self.watched_folder, name)
+			if os.path.isfile(file_path):
+				self.add_or_update(name, file_path)
+			else:
+				self.remove(name)
+		return False
+
+	def on_view_changed(self, *args):
+		self.schedule_load_visible()
+
+	def schedule_load_visible(self):
+		# scrolling and resizing fire many times per frame, the rows are looked at once
+		if self.load_scheduled:
+			return
+		self.load_scheduled = True
+		GLib.idle_add(self.load_visible)
+
+	def load_visible(self):
+		self.load_scheduled = False
+		visible_range = self.view.get_visible_range()
+		if visible_range is None or not visible_range[0]:
+			return False
+		start = visible_range[1].get_indices()[0]
+		end = visible_range[2].get_indices()[0]
+		for index in range(start, min(end + 1, len(self.store))):
+			row = self.store.get_iter(Gtk.TreePath.new_from_indices([index]))
+			if self.store.get_value(row, COLUMN_LOADED):
+				continue
+			self.store.set_value(row, COLUMN_LOADED, True)
+			name = self.store.get_value(row, COLUMN_NAME)
+			file_path = self.store.get_value(row, COLUMN_PATH)
+			thumbnail = self.get_thumbnail(file_path, lambda pixbuf, name=name, file_path=file_path: self.set_thumbnail(name, file_path, pixbuf))
+			if thumbnail is not None:
+				self.store.set_value(row, COLUMN_PIXBUF, thumbnail)
+		return False
+
+	def set_thumbnail(self, name, file_path, pixbuf):
+		# the row may be gone or point to another file by the time the thumbnail is ready
+		row = self.rows.get(name, None)
+		if row is None or pixbuf is None or self.store.get_value(row, COLUMN_PATH) != file_path:
+			return
+		self.store.set_value(row, COLUMN_PIXBUF, pixbuf)
+
+	def on_item_activated(self, view, path):
+		self.on_activate(self.store[path][COLUMN_PATH])
+
+	def on_button_press(self, view, event):
+		if event.type != Gdk.EventType.BUTTON_PRESS or event.button != Gdk.BUTTON_SECONDARY:
+			return False
+		path = view.get_path_at_pos(int(event.x), int(event.y))
+		if path is None:
+			return False
+		view.unselect_all()
+		view.select_path(path)
+		self.on_context_menu(self.store[path][COLUMN_PATH], event)
+		return True
+
+def list_folder_files(folder, exclude=None):
+	"""
+	Name to path of the files in the folder, exclude(name) tells the files to leave out
+	"""
+	files = {}
+	if not os.path.isdir(folder):
+		return files
+	with os.scandir(folder) as entries:
+		for entry in entries:
+			if entry.is_file() and (exclude is None or not exclude(entry.name)):
+				files[entry.name] = entry.path
+	return files
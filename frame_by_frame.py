@@ -9,6 +9,7 @@ import urllib.request
 import zipfile
 import subprocess
 from shutil import copyfile
+from scratch import get_scratch_session
 
 import gettext
 _ = gettext.gettext
@@ -400,7 +401,7 @@ class FrameByFrameVideoVideoViewer(Gtk.Dialog):
                         os.remove(os.path.join(self.images_path, f))
                 if self.images_path is None:
                     # make a temporary folder in a temp directory
-                    self.images_path = os.path.join(GLib.get_tmp_dir(), f"{os.path.basename(self.file_path)}_frames")
+                    self.images_path = get_scratch_session().new_entry(f"{os.path.basename(self.file_path)}_frames", large=True)
                 # make the images path if it doesn't exist
                 if not os.path.exists(self.images_path):
                     os.makedirs(self.images_path, exist_ok=True)
@@ -551,6 +552,8 @@ class FrameByFrameVideoVideoViewer(Gtk.Dialog):
                 os.rmdir(self.images_path)
             except OSError:
                 pass
+        # drops the scratch entry of the frames folder
+        get_scratch_session().release(self.images_path, delete=True)
 
     def on_close(self, callback):
         self.connect("response", lambda dialog, response: callback() or self.destroy() or self.cleanup_tmp())
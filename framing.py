@@ -0,0 +1,34 @@
+import json
+import struct
+
+# value sent by the client in the "framing" handshake header, and expected back as
+# "framed_files" in the INFO_LIST message when the server supports it
+FRAMED_FILES_PROTOCOL = "length-prefixed-json"
+
+# a framed message is a single binary frame made of
+#   4 bytes big endian unsigned length of the header
+#   the header, utf-8 json, the same object that would have been sent as a text message
+#   the payload, raw bytes until the end of the frame
+FRAME_HEADER_LENGTH_FORMAT = ">I"
+FRAME_HEADER_LENGTH_SIZE = struct.calcsize(FRAME_HEADER_LENGTH_FORMAT)
+
+def encode_framed_message(header: dict, payload) -> bytes:
+	header_bytes = json.dumps(header).encode("utf-8")
+	return b"".join([struct.pack(FRAME_HEADER_LENGTH_FORMAT, len(header_bytes)), header_bytes, payload])
+
+def decode_framed_message(data):
+	"""
+	Splits a framed message into its json header and its payload, the payload is
+	a memoryview over the original data so it can be written without copying it
+	"""
+	view = memoryview(data)
+	if len(view) < FRAME_HEADER_LENGTH_SIZE:
+		raise ValueError("Framed message is too short")
+	(header_length,) = struct.unpack(FRAME_HEADER_LENGTH_FORMAT, view[:FRAME_HEADER_LENGTH_SIZE])
+	header_end = FRAME_HEADER_LENGTH_SIZE + header_length
+	if header_end > len(view):
+		raise ValueError("Framed message header length exceeds the message size")
+	header = json.loads(bytes(view[FRAME_HEADER_LENGTH_SIZE:header_end]).decode("utf-8"))
+	if not isinstance(header, dict):
+		raise ValueError("Framed message header is not an object")
+	return header, view[header_end:]
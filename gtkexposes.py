@@ -1,11 +1,19 @@
 import struct
 import urllib
 from label import AIHubLabel
+from framing import encode_framed_message
 from workspace import get_aihub_common_property_value, update_aihub_common_property_value
 from gi.repository import Gimp, Gtk, GLib, Gio, Gdk # type: ignore
+from gi.repository import Gegl # type: ignore
 from gi.repository.GdkPixbuf import Pixbuf # type: ignore
 from gi.repository.GdkPixbuf import InterpType # type: ignore
 import hashlib
+from collections import OrderedDict
+from imagerevision import get_image_revision, get_layer_revision
+from proxycache import PROXY_CACHE, get_file_proxy_key, get_image_proxy_key
+from resolution import NO_SCALE, get_scale_factor, scale_size, scale_coordinate, snap_crop_box
+from maskencode import MASK_ENCODINGS, MASK_RLE_MAGIC, MASK_RLE_ENCODING, encode_mask, get_mask_extension
+from scratch import get_scratch_session
 import random
 import ssl
 
@@ -97,17 +105,31 @@ class AIHubExposeBase:
 					break
 			return config
 
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
+		return None
+
+	def get_run_stats_key(self, resolution_mode=None):
+		# the part of the value that affects how long a run takes, used to group
+		# the run history, most exposes do not matter for that so they return None
 		return None
 
 	def get_widget(self):
 		pass
 
-	def upload_binary(self, ws, relegator=None, half_size=False):
+	def upload_binary(self, ws, relegator=None, resolution_mode=None):
 		# upload a binary before getting the value, if any this function is called
 		# when the value is requested by the run function
 		return True
 
+	def send_file_upload_request(self, ws, binary_header, file_data):
+		# when the server supports framed files we send the header and the data in the same
+		# binary frame, the server then answers straight away with FILE_UPLOAD_SUCCESS or
+		# FILE_UPLOAD_SKIP, otherwise we send the header and wait for UPLOAD_ACK to send the data
+		if self.apinfo is not None and self.apinfo.get("framed_files", False):
+			ws.send_bytes(encode_framed_message(binary_header, file_data))
+		else:
+			ws.send(json.dumps(binary_header))
+
 	def is_default_value(self):
 		return self.get_value() == self.data["value"]
 	
@@ -164,11 +186,33 @@ class AIHubExposeBase:
 		# this function is called when the current image in GIMP changes
 		pass
 
+	def image_model_changed(self, model):
+		# this function is called when the list of open images is replaced with a new
+		# model, because images were opened, closed or their thumbnails changed
+		self.image_model = model
+
 	def on_refresh(self):
 		# this function is called when the ui is refocused and images may have changed
 		# in gimp
 		pass
 
+	def on_images_invalidated(self, image_ids):
+		# this function is called with the ids of the images that changed since the last
+		# check, by default we refresh only if our current image is one of them
+		if self.current_image is not None and self.current_image.get_id() in image_ids:
+			self.on_refresh()
+
+	def get_scale_factor(self, resolution_mode):
+		# the factor our upload is scaled by for the resolution mode, None if we do not
+		# upload an image
+		return None
+
+	def get_shown_image_ids(self):
+		# the ids of the images whose changes matter to us, only those are polled
+		if self.current_image is not None:
+			return {self.current_image.get_id()}
+		return set()
+
 	def check_validity(self, value):
 		# this function should be used to override and check the validity
 		# of the current value, and just mark the UI as invalid if so
@@ -210,33 +254,296 @@ class AIHubExposeBase:
 	def destroy(self):
 		pass
 	
-def save_image_file(gimp_image, file_path, half_size=False):
-	if half_size:
-		# we need to create a new image with half size
+def save_image_file(gimp_image, file_path, scale_factor=NO_SCALE, mask_options=None):
+	# masks are always read from a copy so we never touch the image of the user
+	make_copy = scale_factor != NO_SCALE or mask_options is not None
+	if make_copy:
+		# we need to create a new image at the scaled size
 		new_image = Gimp.Image.new(gimp_image.get_width(), gimp_image.get_height(), gimp_image.get_base_type())
 
 		# now we need to scale each layer and add it to the new image
 		new_layer = Gimp.Layer.new_from_visible(gimp_image, new_image)
 		new_image.insert_layer(new_layer, None, 0)
 
-		new_width = gimp_image.get_width() // 2
-		new_height = gimp_image.get_height() // 2
+		if scale_factor != NO_SCALE:
+			new_width = scale_size(gimp_image.get_width(), scale_factor[0])
+			new_height = scale_size(gimp_image.get_height(), scale_factor[1])
 
-		new_image.scale(new_width, new_height)
+			new_image.scale(new_width, new_height)
 	else:
 		new_image = gimp_image
 
 	gimp_image = new_image
 
-	# create a new gfile to save the image
+	# masks may end up with another extension than the one asked for
+	file_path = save_upload_image(gimp_image, file_path, mask_options)
 	gfile = Gio.File.new_for_path(file_path)
-	Gimp.file_save(Gimp.RunMode.NONINTERACTIVE, gimp_image, gfile, None)
 
-	if half_size:
+	if make_copy:
 		gimp_image.delete()
 
 	return (gfile, )
 
+def get_upload_extension(mask_options):
+	# the extension of the file save_upload_image writes, masks are never webp
+	if mask_options is None:
+		return ".webp"
+	return get_mask_extension(mask_options.get("encoding", "png"))
+
+def save_upload_image(gimp_image, file_path, mask_options=None):
+	"""
+	Saves the image to upload, returns the path it was written to
+	"""
+	if mask_options is None:
+		Gimp.file_save(Gimp.RunMode.NONINTERACTIVE, gimp_image, Gio.File.new_for_path(file_path), None)
+		return file_path
+	return save_mask_file(gimp_image, file_path, mask_options)
+
+def save_mask_file(gimp_image, file_path, mask_options):
+	"""
+	Saves the image as a single channel mask, read straight from the pixels of the
+	image and encoded by maskencode, this is much smaller and faster than a RGBA webp,
+	the extension follows the encoding that was used, so an auto mask that turns out
+	to be hard edged is moved to .aihm, returns the path it was written to
+	"""
+	# a layer from the projection is exactly the size of the image, it is never inserted
+	projection = Gimp.Layer.new_from_visible(gimp_image, gimp_image)
+	try:
+		width = projection.get_width()
+		height = projection.get_height()
+		rect = Gegl.Rectangle.new(0, 0, width, height)
+		if mask_options.get("channel", "luminance") == "alpha":
+			data = projection.get_buffer().get(rect, 1.0, "Y'A u8", Gegl.AbyssPolicy.NONE)[1::2]
+		else:
+			data = projection.get_buffer().get(rect, 1.0, "Y' u8", Gegl.AbyssPolicy.NONE)
+	finally:
+		projection.delete()
+
+	encoded, encoding = encode_mask(data, width, height, mask_options.get("encoding", "png"))
+	with open(file_path, "wb") as f:
+		f.write(encoded)
+	encoded_file_path = os.path.splitext(file_path)[0] + get_mask_extension(encoding)
+	if encoded_file_path != file_path:
+		get_scratch_session().rename(file_path, encoded_file_path)
+	return encoded_file_path
+
+def save_scaled_file(source_file_path, file_path, scale_factor):
+	# we need to load the image and resize it by the scale factor and save it to the given file
+	# use gimp to resize
+	loaded_image = Gimp.file_load(Gimp.RunMode.NONINTERACTIVE, Gio.File.new_for_path(source_file_path))
+	try:
+		new_width = scale_size(loaded_image.get_width(), scale_factor[0])
+		new_height = scale_size(loaded_image.get_height(), scale_factor[1])
+		loaded_image.scale(new_width, new_height)
+
+		Gimp.file_save(Gimp.RunMode.NONINTERACTIVE, loaded_image, Gio.File.new_for_path(file_path), None)
+	finally:
+		loaded_image.delete()
+
+# rendered previews for the internal image load types, shared between all the exposes
+IMAGE_PREVIEW_CACHE = OrderedDict()
+IMAGE_PREVIEW_CACHE_MAX_SIZE = 32
+# previews requested but not rendered yet, with the exposes waiting for each of them
+IMAGE_PREVIEW_PENDING = {}
+
+# load types that only send the bounding box of the selection plus a margin around it
+SELECTION_LOAD_TYPES = ["merged_image_selection_bounds", "selection_mask_bounds"]
+DEFAULT_SELECTION_MARGIN = 64
+
+def get_selection_crop_box(image, margin=DEFAULT_SELECTION_MARGIN):
+	bounds = Gimp.Selection.bounds(image)
+	non_empty, x1, y1, x2, y2 = bounds[-5:]
+	if not non_empty:
+		# without a selection the whole image is used
+		x1, y1, x2, y2 = 0, 0, image.get_width(), image.get_height()
+	return snap_crop_box(x1, y1, x2, y2, margin, image.get_width(), image.get_height())
+
+def make_selection_crop_image(image, load_type, crop_box, scale_factor=NO_SCALE):
+	"""
+	Makes a new image with only the crop box of the merged image, or of the selection
+	mask, the caller is the one that has to delete it
+	"""
+	x, y, width, height = crop_box
+	if load_type == "selection_mask_bounds":
+		new_image = Gimp.Image.new(image.get_width(), image.get_height(), Gimp.ImageBaseType.GRAY)
+		new_layer = Gimp.Layer.new_from_drawable(image.get_selection(), new_image)
+	else:
+		new_image = Gimp.Image.new(image.get_width(), image.get_height(), image.get_base_type())
+		new_layer = Gimp.Layer.new_from_visible(image, new_image)
+	new_image.insert_layer(new_layer, None, 0)
+	new_layer.set_offsets(0, 0)
+	new_layer.set_opacity(100.0)
+	new_layer.set_visible(True)
+	new_image.crop(width, height, x, y)
+	if scale_factor != NO_SCALE:
+		new_image.scale(scale_size(width, scale_factor[0]), scale_size(height, scale_factor[1]))
+	return new_image
+
+def get_layer_path(image, layer):
+	# positions from the top level down to the layer, a duplicate has the same structure but new ids
+	path = []
+	item = layer
+	while item is not None:
+		path.insert(0, image.get_item_position(item))
+		item = item.get_parent()
+	return path
+
+def find_layer_by_path(image, path):
+	layers = image.get_layers()
+	layer = None
+	for position in path:
+		if position < 0 or position >= len(layers):
+			return None
+		layer = layers[position]
+		layers = layer.get_children() if layer.is_group() else []
+	return layer
+
+def make_image_without_layer(image, layer):
+	"""
+	Makes an offscreen duplicate of the image with the layer hidden, so the image of the
+	user is never touched nor redrawn, the caller is the one that has to delete it
+	"""
+	new_image = image.duplicate()
+	# nobody is going to undo anything in here
+	new_image.undo_disable()
+	if layer is not None:
+		hidden_layer = find_layer_by_path(new_image, get_layer_path(image, layer))
+		if hidden_layer is not None:
+			hidden_layer.set_visible(False)
+	return new_image
+
+def get_image_preview_key(image, layer, load_type, width, height, crop_box=None):
+	layer_id = None
+	layer_offsets = None
+	if layer is not None:
+		layer_id = layer.get_id()
+		offsets = layer.get_offsets()
+		layer_offsets = (offsets.offset_x, offsets.offset_y)
+	return (image.get_id(), layer_id, layer_offsets, load_type, width, height, crop_box, get_image_revision(image))
+
+def request_image_preview(key, image, layer, load_type, width, height, expose, crop_box=None):
+	# many exposes refresh at once, so instead of rendering right away we wait until the
+	# main loop is idle and render each distinct preview only once for all of them
+	if key in IMAGE_PREVIEW_PENDING:
+		IMAGE_PREVIEW_PENDING[key].append(expose)
+		return
+	IMAGE_PREVIEW_PENDING[key] = [expose]
+
+	def do_render():
+		waiting_exposes = IMAGE_PREVIEW_PENDING.pop(key, [])
+		pixbuf = None
+		rendered = False
+		try:
+			if image.is_valid() and (layer is None or layer.is_valid()):
+				pixbuf = render_image_preview(image, layer, load_type, width, height, crop_box)
+				rendered = True
+		except Exception as e:
+			print("Error rendering image preview:", e)
+			pixbuf = None
+
+		# only a preview that really rendered is kept, a failed one is tried again on the
+		# next refresh instead of staying empty until the image changes
+		if rendered:
+			IMAGE_PREVIEW_CACHE[key] = pixbuf
+			while len(IMAGE_PREVIEW_CACHE) > IMAGE_PREVIEW_CACHE_MAX_SIZE:
+				IMAGE_PREVIEW_CACHE.popitem(last=False)
+
+		for expose in waiting_exposes:
+			expose.on_image_preview_rendered(key, pixbuf)
+		return False
+
+	GLib.idle_add(do_render)
+
+def render_image_preview(image, layer, load_type, width, height, crop_box=None):
+	"""
+	Renders the preview for the internal image load types, returns None when there
+	is nothing to show, eg. the layer does not intersect the image
+	"""
+	pixbuf = None
+	if load_type == "merged_image":
+		pixbuf = image.get_thumbnail(width,height,Gimp.PixbufTransparency.KEEP_ALPHA)
+	elif load_type == "current_layer":
+		pixbuf = layer.get_thumbnail(width,height,Gimp.PixbufTransparency.KEEP_ALPHA)
+	elif (
+		load_type == "merged_image_current_layer_intersection" or
+		load_type == "merged_image_current_layer_intersection_without_current_layer" or
+		load_type == "current_layer_at_image_intersection"
+	):
+		# first we need to calculate the intersection of the current layer with the image
+		# to get x1, y1, x2, y2
+		if layer is not None:
+			# now we need to calculate x1, y1, x2, y2
+			layer_offsets = layer.get_offsets()
+			x1 = max(0, layer_offsets.offset_x)
+			y1 = max(0, layer_offsets.offset_y)
+			x2 = min(image.get_width(), layer_offsets.offset_x + layer.get_width())
+			y2 = min(image.get_height(), layer_offsets.offset_y + layer.get_height())
+			# now we need to crop the new layer to the intersection
+			new_width = x2 - x1
+			new_height = y2 - y1
+			# for some reason the resize function takes negative offsets
+			offset_x = -x1
+			offset_y = -y1
+
+			if new_width <= 0 or new_height <= 0 or offset_x > 0 or offset_y > 0:
+				# no intersection
+				return None
+
+			new_image = Gimp.Image.new(image.get_width(), image.get_height(), image.get_base_type())
+
+			# first we must create a new layer from visible
+			new_layer = None
+			if load_type == "current_layer_at_image_intersection":
+				new_layer = Gimp.Layer.new_from_drawable(layer, new_image)
+				new_image.insert_layer(new_layer, None, 0)
+				#copy the same offsets
+				original_offsets = layer.get_offsets()
+				new_layer.set_offsets(original_offsets.offset_x, original_offsets.offset_y)
+				new_layer.set_opacity(100.0)
+				new_layer.set_visible(True)
+
+				# we need to call the procedure gimp-layer-resize-to-image-size
+				procedure = Gimp.get_pdb().lookup_procedure('gimp-layer-resize-to-image-size')
+				config = procedure.create_config()
+				config.set_property('layer', new_layer)
+				procedure.run(config)
+			elif load_type == "merged_image_current_layer_intersection_without_current_layer":
+				composite_image = make_image_without_layer(image, layer)
+				try:
+					new_layer = Gimp.Layer.new_from_visible(composite_image, new_image)
+				finally:
+					composite_image.delete()
+				new_image.insert_layer(new_layer, None, 0)
+				new_layer.set_offsets(0,0)
+				new_layer.set_opacity(100.0)
+				new_layer.set_visible(True)
+			else:
+				new_layer = Gimp.Layer.new_from_visible(image, new_image)
+				new_image.insert_layer(new_layer, None, 0)
+				new_layer.set_offsets(0,0)
+				new_layer.set_opacity(100.0)
+				new_layer.set_visible(True)
+			
+			new_layer.resize(new_width, new_height, offset_x, offset_y)
+			pixbuf = new_layer.get_thumbnail(width,height,Gimp.PixbufTransparency.KEEP_ALPHA)
+			new_image.remove_layer(new_layer)
+			new_layer.delete()
+			new_image.delete()
+	elif load_type in SELECTION_LOAD_TYPES and crop_box is not None:
+		new_image = make_selection_crop_image(image, load_type, crop_box)
+		try:
+			pixbuf = new_image.get_thumbnail(width,height,Gimp.PixbufTransparency.KEEP_ALPHA)
+		finally:
+			new_image.delete()
+	elif load_type == "merged_image_without_current_layer":
+		# rendered from an offscreen copy, hiding the layer in the image of the user would redraw the canvas
+		composite_image = make_image_without_layer(image, layer)
+		try:
+			pixbuf = composite_image.get_thumbnail(width,height,Gimp.PixbufTransparency.KEEP_ALPHA)
+		finally:
+			composite_image.delete()
+	return pixbuf
+
 class AIHubExposeImage(AIHubExposeBase):
 	def get_special_priority(self):
 		return 100
@@ -252,6 +559,9 @@ class AIHubExposeImage(AIHubExposeBase):
 		self.select_from_layer_button = None
 		self.select_combo: Gtk.ComboBox = None
 		self.image_preview: Gtk.Image = None
+		self.image_preview_key = None
+		# x, y, width and height of what we send for the selection load types
+		self.selection_crop_box = None
 		self.selected_filename: str = None
 		self.selected_image = None
 		self.selected_layer = None
@@ -297,21 +607,7 @@ class AIHubExposeImage(AIHubExposeBase):
 				self.select_from_layer_button.set_tooltip_text(known_tooltip)
 
 			if self.image_model is not None:
-				# we need to add the option for no selection, but make a copy of the model first
-				# because we don't want to modify the original model
-				model = self.image_model
-				if self.data.get("optional", False):
-					# Get column types from the original model
-					n_columns = self.image_model.get_n_columns()
-					column_types = [self.image_model.get_column_type(i) for i in range(n_columns)]
-					new_model = Gtk.ListStore(*column_types)
-					# Copy all rows from the original model
-					for row in model:
-						new_model.append(list(row))
-					model = new_model
-					# we want to insert at the top the none option
-					model.insert(0, [ -1, _("No image selected"), None ])
-
+				model = self.get_select_combo_model(self.image_model)
 				self.select_combo.set_model(model)
 				if model is not None and len(model) > 0:
 					self.select_combo.set_active(0)
@@ -396,30 +692,35 @@ class AIHubExposeImage(AIHubExposeBase):
 			self.box.pack_start(self.total_frame_widget_label, False, False, 0)
 			self.box.pack_start(self.total_frames_widget, False, False, 0)
 
-	def upload_binary(self, ws, relegator=None, half_size=False):
+	def upload_binary(self, ws, relegator=None, resolution_mode=None):
 		self.uploaded_file_path = None
 
 		if (self.info_only_mode):
 			return True
 		
+		load_type = self.data.get("type", "upload")
+		if self.is_using_internal_file() and load_type in SELECTION_LOAD_TYPES:
+			# the selection may have changed since the last refresh, and the scale of the
+			# upload goes by the size of the crop
+			self.update_selection_crop_box()
+		scale_factor = self.get_scale_factor(resolution_mode)
+
 		# first lets get the file that we are going to upload
 		file_to_upload = None
+		mask_options = self.get_mask_options()
+		mask_key = tuple(sorted(mask_options.items())) if mask_options is not None else None
+		upload_extension = get_upload_extension(mask_options)
 		if (not self.is_using_internal_file()):
 			if (self.selected_filename is not None and os.path.exists(self.selected_filename)):
 				file_to_upload = self.selected_filename
 
-				if half_size:
-					# we need to load the image and resize it to half size and save it to a temporary file
-					# use gimp to resize
-					loaded_image = Gimp.file_load(Gimp.RunMode.NONINTERACTIVE, Gio.File.new_for_path(self.selected_filename))
-					new_width = loaded_image.get_width() // 2
-					new_height = loaded_image.get_height() // 2
-					loaded_image.scale(new_width, new_height)
-
-					file_to_upload = os.path.join(GLib.get_tmp_dir(), f"aihub_temp_image_halfsize_{random.randint(0, 1000000)}.webp")
-
-					Gimp.file_save(Gimp.RunMode.NONINTERACTIVE, loaded_image, Gio.File.new_for_path(file_to_upload), None)
-					loaded_image.delete()
+				if scale_factor != NO_SCALE:
+					# the scaled copy is cached until the file changes
+					source_file_path = self.selected_filename
+					file_to_upload = PROXY_CACHE.get_or_create(
+						get_file_proxy_key(source_file_path, scale_factor),
+						lambda proxy_path: save_scaled_file(source_file_path, proxy_path, scale_factor),
+					)
 						
 			elif (self.select_combo.get_active() != -1 and self.select_combo.get_model() is not None):
 				tree_iter = self.select_combo.get_active_iter()
@@ -432,11 +733,23 @@ class AIHubExposeImage(AIHubExposeBase):
 							return True
 						return False
 					gimp_image = Gimp.Image.get_by_id(id_of_image)
-					if gimp_image is not None:
+					# the scaled copy is cached until the image changes, images with unsaved
+					# changes have no key and are exported every time
+					proxy_key = None
+					if gimp_image is not None and scale_factor != NO_SCALE:
+						proxy_key = get_image_proxy_key(gimp_image, scale_factor, mask_key)
+					if proxy_key is not None:
+						file_to_upload = PROXY_CACHE.get_or_create(
+							proxy_key,
+							lambda proxy_path: save_image_file(gimp_image, proxy_path, scale_factor=scale_factor, mask_options=mask_options)[0].get_path(),
+							extension=upload_extension,
+						)
+					elif gimp_image is not None:
 						# save the image to a temporary file
-						file_to_upload = os.path.join(GLib.get_tmp_dir(), f"aihub_temp_image_{id_of_image}.webp")
+						file_to_upload = get_scratch_session().new_entry(f"aihub_temp_image_{id_of_image}{upload_extension}")
 
-						(gfile, ) = save_image_file(gimp_image, file_to_upload, half_size=half_size)
+						(gfile, ) = save_image_file(gimp_image, file_to_upload, scale_factor=scale_factor, mask_options=mask_options)
+						file_to_upload = gfile.get_path()
 			else:
 				# nothing selected
 				if self.data.get("optional", False):
@@ -444,22 +757,45 @@ class AIHubExposeImage(AIHubExposeBase):
 					return True
 				return False
 		else:
-			load_type = self.data.get("type", "upload")
+			# scaled exports of saved images are cached per image file, load type and layer
+			# so they are reused by the other exposes of the run and by the next runs, the
+			# selection mask is not part of the image so it is never cached, and neither
+			# are images with unsaved changes, for those the key is None
+			proxy_key = None
+			if scale_factor != NO_SCALE and self.selected_image is not None and load_type != "selection_mask_bounds":
+				layer_key = None
+				if self.selected_layer is not None:
+					# nested layers are not part of the image revision so we add this one ourselves
+					layer_key = get_layer_revision(self.selected_layer)
+				proxy_key = get_image_proxy_key(self.selected_image, scale_factor, load_type, layer_key, self.selection_crop_box, mask_key)
+				if proxy_key is not None:
+					file_to_upload = PROXY_CACHE.get(proxy_key)
+
+			if file_to_upload is not None:
+				# reusing the cached proxy
+				pass
+			elif self.selected_image is not None and load_type in SELECTION_LOAD_TYPES and self.selection_crop_box is not None:
+				id_of_image = self.selected_image.get_id()
+				file_to_upload = get_scratch_session().new_entry(f"aihub_temp_image_{id_of_image}_{load_type}{upload_extension}")
+				new_image = make_selection_crop_image(self.selected_image, load_type, self.selection_crop_box, scale_factor)
+				try:
+					file_to_upload = save_upload_image(new_image, file_to_upload, mask_options)
+				finally:
+					new_image.delete()
 			# an image has been selected but not a layer
-			if self.selected_image is not None and self.selected_layer is None:
+			elif self.selected_image is not None and self.selected_layer is None:
 				# save the image to a temporary file
 				id_of_image = self.selected_image.get_id()
-				file_to_upload = os.path.join(GLib.get_tmp_dir(), f"aihub_temp_image_{id_of_image}.webp")
+				file_to_upload = get_scratch_session().new_entry(f"aihub_temp_image_{id_of_image}{upload_extension}")
 				# create a new gfile to save the image
-				(gfile, ) = save_image_file(self.selected_image, file_to_upload, half_size=half_size)
+				(gfile, ) = save_image_file(self.selected_image, file_to_upload, scale_factor=scale_factor, mask_options=mask_options)
+				file_to_upload = gfile.get_path()
 			# an image and a layer have been selected
 			elif self.selected_image is not None and self.selected_layer is not None and load_type == "current_layer":
 				# save the layer to a temporary file
 				id_of_image = self.selected_image.get_id()
 				# make a file to print the time for debugging
-				file_to_upload = os.path.join(GLib.get_tmp_dir(), f"aihub_temp_layer_{id_of_image}_{self.selected_layer.get_id()}.webp")
-				# create a new gfile to save the image
-				gfile = Gio.File.new_for_path(file_to_upload)
+				file_to_upload = get_scratch_session().new_entry(f"aihub_temp_layer_{id_of_image}_{self.selected_layer.get_id()}{upload_extension}")
 
 				# Take the layer and only the layer and make a copy and save it to the new file
 				# because Gimp.file_save needs an image, not a layer
@@ -472,14 +808,14 @@ class AIHubExposeImage(AIHubExposeBase):
 				new_layer.set_opacity(100.0)
 				new_layer.set_visible(True)
 
-				if half_size:
-					new_width = new_image.get_width() // 2
-					new_height = new_image.get_height() // 2
+				if scale_factor != NO_SCALE:
+					new_width = scale_size(new_image.get_width(), scale_factor[0])
+					new_height = scale_size(new_image.get_height(), scale_factor[1])
 					new_image.scale(new_width, new_height)
 
 				Gimp.displays_flush()
 				try:
-					Gimp.file_save(Gimp.RunMode.NONINTERACTIVE, new_image, gfile, None)
+					file_to_upload = save_upload_image(new_image, file_to_upload, mask_options)
 					Gimp.displays_flush()
 				except Exception as e:
 					raise e
@@ -492,12 +828,10 @@ class AIHubExposeImage(AIHubExposeBase):
 				load_type == "merged_image_current_layer_intersection_without_current_layer"
 			):
 				id_of_image = self.selected_image.get_id()
-				file_to_upload = os.path.join(GLib.get_tmp_dir(), f"aihub_temp_layer_{id_of_image}_{load_type}_{self.selected_layer.get_id()}.webp")
-				gfile = Gio.File.new_for_path(file_to_upload)
+				file_to_upload = get_scratch_session().new_entry(f"aihub_temp_layer_{id_of_image}_{load_type}_{self.selected_layer.get_id()}{upload_extension}")
 				
 				new_image = Gimp.Image.new(self.selected_image.get_width(), self.selected_image.get_height(), self.selected_image.get_base_type())
 				new_layer = None
-				was_visible = False
 				if load_type == "current_layer_at_image_intersection":
 					new_layer = Gimp.Layer.new_from_drawable(self.selected_layer, new_image)
 					new_layer.set_visible(True)
@@ -511,10 +845,11 @@ class AIHubExposeImage(AIHubExposeBase):
 					new_layer = Gimp.Layer.new_from_visible(self.selected_image, new_image)
 					new_image.insert_layer(new_layer, None, 0)
 				elif load_type == "merged_image_current_layer_intersection_without_current_layer":
-					if self.selected_layer.get_visible():
-						was_visible = True
-						self.selected_layer.set_visible(False)
-					new_layer = Gimp.Layer.new_from_visible(self.selected_image, new_image)
+					composite_image = make_image_without_layer(self.selected_image, self.selected_layer)
+					try:
+						new_layer = Gimp.Layer.new_from_visible(composite_image, new_image)
+					finally:
+						composite_image.delete()
 					new_image.insert_layer(new_layer, None, 0)
 
 				new_layer.set_offsets(0,0)
@@ -537,18 +872,16 @@ class AIHubExposeImage(AIHubExposeBase):
 
 				new_image.resize(new_width, new_height, offset_x, offset_y)
 
-				if half_size:
-					new_width = new_image.get_width() // 2
-					new_height = new_image.get_height() // 2
+				if scale_factor != NO_SCALE:
+					new_width = scale_size(new_image.get_width(), scale_factor[0])
+					new_height = scale_size(new_image.get_height(), scale_factor[1])
 					new_image.scale(new_width, new_height)
 
 				try:
-					Gimp.file_save(Gimp.RunMode.NONINTERACTIVE, new_image, gfile, None)
+					file_to_upload = save_upload_image(new_image, file_to_upload, mask_options)
 				except Exception as e:
 					raise e
 				finally:
-					if was_visible and load_type == "merged_image_current_layer_intersection_without_current_layer":
-						self.selected_layer.set_visible(True)
 					new_image.remove_layer(new_layer)
 					new_layer.delete()
 					new_image.delete()
@@ -556,29 +889,26 @@ class AIHubExposeImage(AIHubExposeBase):
 			elif self.selected_image is not None and self.selected_layer is not None and load_type == "merged_image_without_current_layer":
 				# save the layer to a temporary file
 				id_of_image = self.selected_image.get_id()
-				file_to_upload = os.path.join(GLib.get_tmp_dir(), f"aihub_temp_layer_{id_of_image}_{load_type}_{self.selected_layer.get_id()}.webp")
+				file_to_upload = get_scratch_session().new_entry(f"aihub_temp_layer_{id_of_image}_{load_type}_{self.selected_layer.get_id()}{upload_extension}")
 
-				# hide the layer if not already visible
-				was_visible = False
-				if self.selected_layer.get_visible():
-					was_visible = True
-					self.selected_layer.set_visible(False)
-				
+				# exported from an offscreen copy with the layer hidden, the image of the user is not touched
+				composite_image = make_image_without_layer(self.selected_image, self.selected_layer)
 				try:
-					(gfile, ) = save_image_file(self.selected_image, file_to_upload, half_size=half_size)
+					(gfile, ) = save_image_file(composite_image, file_to_upload, scale_factor=scale_factor, mask_options=mask_options)
+					file_to_upload = gfile.get_path()
 				except Exception as e:
 					raise e
 				finally:
-					# restore the visibility
-					if was_visible:
-						self.selected_layer.set_visible(True)
-						Gimp.displays_flush()
+					composite_image.delete()
 			else:
 				# no image selected
 				if self.data.get("optional", False):
 					# optional, so we can skip, mark it as successful
 					return True
 				return False
+
+			if proxy_key is not None and PROXY_CACHE.get(proxy_key) is None:
+				file_to_upload = PROXY_CACHE.put(proxy_key, file_to_upload)
 			
 		# now we need to make a calculation for a hash of the file to upload
 		hash_md5 = hashlib.md5()
@@ -602,6 +932,10 @@ class AIHubExposeImage(AIHubExposeBase):
 					pos += 8 + length + 4
 			else:
 				hash_md5.update(data)
+
+		# the export is in memory now, so its scratch file can be evicted
+		if file_to_upload != self.selected_filename:
+			get_scratch_session().release(file_to_upload)
 				
 		upload_file_hash = hash_md5.hexdigest()
 
@@ -612,10 +946,13 @@ class AIHubExposeImage(AIHubExposeBase):
 			"workflow_id": self.workflow_id,
 			"if_not_exists": True
 		}
+		# run length encoded masks are not images, the server needs to know how to decode them
+		if file_data.startswith(MASK_RLE_MAGIC):
+			binary_header["encoding"] = MASK_RLE_ENCODING
 
 		relegator.reset()
 
-		ws.send(json.dumps(binary_header))
+		self.send_file_upload_request(ws, binary_header, file_data)
 
 		if not relegator.wait(10):
 			self.error_label.show()
@@ -677,10 +1014,14 @@ class AIHubExposeImage(AIHubExposeBase):
 				self.success_label.hide()
 				self.error_label.set_text(_("Error sending file data: {}").format(str(e)))
 				return False
-		elif (response_data["type"] == "FILE_UPLOAD_SKIP"):
+		elif (response_data["type"] == "FILE_UPLOAD_SKIP" or response_data["type"] == "FILE_UPLOAD_SUCCESS"):
 			self.error_label.hide()
 			self.success_label.show()
-			self.success_label.set_text(_("File already exists on server, upload skipped"))
+			if response_data["type"] == "FILE_UPLOAD_SUCCESS":
+				# framed upload, the file data went together with the header
+				self.success_label.set_text(_("File uploaded successfully"))
+			else:
+				self.success_label.set_text(_("File already exists on server, upload skipped"))
 
 			filename = response_data.get("file", None)
 			self.uploaded_file_path = filename
@@ -700,7 +1041,8 @@ class AIHubExposeImage(AIHubExposeBase):
 		# load types are ["current_layer","merged_image",
 		# "merged_image_without_current_layer","merged_image_current_layer_intersection",
 		# "merged_image_current_layer_intersection_without_current_layer",
-		# "current_layer_at_image_intersection", "upload",]
+		# "current_layer_at_image_intersection", "merged_image_selection_bounds",
+		# "selection_mask_bounds", "upload",]
 		if (
 			load_type == "current_layer" or
 			load_type == "merged_image_without_current_layer" or
@@ -781,8 +1123,35 @@ class AIHubExposeImage(AIHubExposeBase):
 			self.value_width = self.selected_image.get_width() if self.selected_image is not None else 0
 			self.value_height = self.selected_image.get_height() if self.selected_image is not None else 0
 
+			if load_type in SELECTION_LOAD_TYPES:
+				self.update_selection_crop_box()
+
 		self.load_image_preview()
 
+	def update_selection_crop_box(self):
+		# only the bounding box of the selection plus the margin is sent, and the result
+		# goes back at the same position
+		self.selection_crop_box = None
+		if self.selected_image is None:
+			return
+		margin = self.data.get("selection_margin", DEFAULT_SELECTION_MARGIN)
+		self.selection_crop_box = get_selection_crop_box(self.selected_image, margin)
+		self.value_pos_x, self.value_pos_y, self.value_width, self.value_height = self.selection_crop_box
+
+	def get_mask_options(self):
+		# masks are uploaded as a single grey channel instead of a full RGBA image, the
+		# run length encoding has to be opted in by the workflow since the server has to decode it
+		load_type = self.data.get("type", "upload")
+		if not self.data.get("mask", load_type == "selection_mask_bounds"):
+			return None
+		encoding = self.data.get("mask_encoding", "png")
+		if encoding not in MASK_ENCODINGS:
+			encoding = "png"
+		return {
+			"encoding": encoding,
+			"channel": self.data.get("mask_channel", "luminance"),
+		}
+
 	def on_select_from_layer_button_clicked(self, widget):
 		# first thing we are simply going to do is to is the same process as merged_image_current_layer_intersection
 		# to export this image to a file
@@ -793,7 +1162,7 @@ class AIHubExposeImage(AIHubExposeBase):
 				id_of_image = self.current_image.get_id()
 				id_of_layer = selected_layer.get_id()
 				random_number = random.randint(1000, 9999)
-				file_to_upload = os.path.join(GLib.get_tmp_dir(), f"aihub_temp_file_{id_of_image}_layer_extract_{id_of_layer}_{random_number}.webp")
+				file_to_upload = get_scratch_session().new_entry(f"aihub_temp_file_{id_of_image}_layer_extract_{id_of_layer}_{random_number}.webp")
 				gfile = Gio.File.new_for_path(file_to_upload)
 				
 				new_image = Gimp.Image.new(self.current_image.get_width(), self.current_image.get_height(), self.current_image.get_base_type())
@@ -838,7 +1207,8 @@ class AIHubExposeImage(AIHubExposeBase):
 	def on_file_chooser_clicked(self, widget):
 		self.uploaded_file_path = None
 		if (self.selected_filename is not None):
-			# clear the selection
+			# clear the selection, files extracted from a layer are not needed anymore
+			get_scratch_session().release(self.selected_filename, delete=True)
 			self.selected_filename = None
 			if self.is_frame:
 				self.select_button.set_label(_("Select a frame from the video"))
@@ -899,103 +1269,31 @@ class AIHubExposeImage(AIHubExposeBase):
 	def load_image_preview(self):
 		if self.is_using_internal_file():
 			load_type = self.data.get("type", "upload")
-			if self.selected_image is not None:
+			if self.selected_image is not None and self.value_width > 0 and self.value_height > 0:
+				height_from_ratio = int(self.value_height * (400 / self.value_width))
 				try:
-					height_from_ratio = int(self.value_height * (400 / self.value_width))
-					pixbuf = None
-					if load_type == "merged_image":
-						pixbuf = self.selected_image.get_thumbnail(400,height_from_ratio,Gimp.PixbufTransparency.KEEP_ALPHA)
-						self.namelabel.set_text(self.selected_image.get_name())
-					elif load_type == "current_layer":
-						pixbuf = self.selected_layer.get_thumbnail(400,height_from_ratio,Gimp.PixbufTransparency.KEEP_ALPHA)
-						self.namelabel.set_text(self.selected_layer.get_name())
-					elif (
-						load_type == "merged_image_current_layer_intersection" or
-						load_type == "merged_image_current_layer_intersection_without_current_layer" or
-						load_type == "current_layer_at_image_intersection"
-					):
-						# first we need to calculate the intersection of the current layer with the image
-						# to get x1, y1, x2, y2
+					if load_type == "current_layer" or load_type == "current_layer_at_image_intersection":
 						if self.selected_layer is not None:
-							should_toggle_visibility = load_type == "merged_image_current_layer_intersection_without_current_layer"
-							original_visible_state = self.selected_layer.get_visible()
-
-							if should_toggle_visibility and original_visible_state:
-								self.selected_layer.set_visible(False)
-
-							# now we need to calculate x1, y1, x2, y2
-							layer_offsets = self.selected_layer.get_offsets()
-							x1 = max(0, layer_offsets.offset_x)
-							y1 = max(0, layer_offsets.offset_y)
-							x2 = min(self.selected_image.get_width(), layer_offsets.offset_x + self.selected_layer.get_width())
-							y2 = min(self.selected_image.get_height(), layer_offsets.offset_y + self.selected_layer.get_height())
-							# now we need to crop the new layer to the intersection
-							new_width = x2 - x1
-							new_height = y2 - y1
-							# for some reason the resize function takes negative offsets
-							offset_x = -x1
-							offset_y = -y1
-
-							if new_width <= 0 or new_height <= 0 or offset_x > 0 or offset_y > 0:
-								# no intersection
-								self.image_preview.clear()
-								return
-							
-							new_image = Gimp.Image.new(self.selected_image.get_width(), self.selected_image.get_height(), self.selected_image.get_base_type())
-
-							# first we must create a new layer from visible
-							new_layer = None
-							if load_type == "current_layer_at_image_intersection":
-								new_layer = Gimp.Layer.new_from_drawable(self.selected_layer, new_image)
-								new_image.insert_layer(new_layer, None, 0)
-								#copy the same offsets
-								original_offsets = self.selected_layer.get_offsets()
-								new_layer.set_offsets(original_offsets.offset_x, original_offsets.offset_y)
-								new_layer.set_opacity(100.0)
-								new_layer.set_visible(True)
-
-								# we need to call the procedure gimp-layer-resize-to-image-size
-								procedure = Gimp.get_pdb().lookup_procedure('gimp-layer-resize-to-image-size')
-								config = procedure.create_config()
-								config.set_property('layer', new_layer)
-								procedure.run(config)
-							else:
-								new_layer = Gimp.Layer.new_from_visible(self.selected_image, new_image)
-								new_image.insert_layer(new_layer, None, 0)
-								new_layer.set_offsets(0,0)
-								new_layer.set_opacity(100.0)
-								new_layer.set_visible(True)
-							
-							new_layer.resize(new_width, new_height, offset_x, offset_y)
-							pixbuf = new_layer.get_thumbnail(400,height_from_ratio,Gimp.PixbufTransparency.KEEP_ALPHA)
-							new_image.remove_layer(new_layer)
-							new_layer.delete()
-							new_image.delete()
-
-							if should_toggle_visibility and original_visible_state:
-								self.selected_layer.set_visible(True)
-
-							if load_type == "current_layer_at_image_intersection":
-								self.namelabel.set_text(self.selected_layer.get_name())
-							else:
-								self.namelabel.set_text(self.selected_image.get_name())
-					elif load_type == "merged_image_without_current_layer":
-						# hide the layer if not already visible
-						was_visible = False
-						if self.selected_layer is not None and self.selected_layer.get_visible():
-							was_visible = True
-							self.selected_layer.set_visible(False)
-						pixbuf = self.selected_image.get_thumbnail(400,height_from_ratio,Gimp.PixbufTransparency.KEEP_ALPHA)
-						# restore the visibility
-						if self.selected_layer is not None and was_visible:
-							self.selected_layer.set_visible(True)
-							# bug in GIMP 3.0.10 where the thumbnail is not updated if the layer is made visible again
-							pixbuf2 = self.selected_image.get_thumbnail(400,height_from_ratio,Gimp.PixbufTransparency.KEEP_ALPHA)
+							self.namelabel.set_text(self.selected_layer.get_name())
+					else:
 						self.namelabel.set_text(self.selected_image.get_name())
-					self.image_preview.set_from_pixbuf(pixbuf)
+
+					# previews are shared by every expose that shows the same thing, and only
+					# rendered again when the image changes
+					self.image_preview_key = get_image_preview_key(self.selected_image, self.selected_layer, load_type, 400, height_from_ratio, self.selection_crop_box)
 				except Exception as e:
+					# the image or the layer was closed since the last refresh
+					print("Error loading image preview:", e)
+					self.image_preview_key = None
 					self.image_preview.clear()
+					return
+				if self.image_preview_key in IMAGE_PREVIEW_CACHE:
+					IMAGE_PREVIEW_CACHE.move_to_end(self.image_preview_key)
+					self.on_image_preview_rendered(self.image_preview_key, IMAGE_PREVIEW_CACHE[self.image_preview_key])
+				else:
+					request_image_preview(self.image_preview_key, self.selected_image, self.selected_layer, load_type, 400, height_from_ratio, self, self.selection_crop_box)
 			else:
+				self.image_preview_key = None
 				self.image_preview.clear()
 		else:
 			if (self.selected_filename is not None and os.path.exists(self.selected_filename)):
@@ -1061,6 +1359,15 @@ class AIHubExposeImage(AIHubExposeBase):
 				self.value_pos_x = 0
 				self.value_pos_y = 0
 	
+	def on_image_preview_rendered(self, key, pixbuf):
+		# the selection may have changed while the preview was waiting to be rendered
+		if key != self.image_preview_key:
+			return
+		if pixbuf is None:
+			self.image_preview.clear()
+		else:
+			self.image_preview.set_from_pixbuf(pixbuf)
+
 	def get_value_base(self):
 		dictValue = None
 		if (self.selected_filename is not None and os.path.exists(self.selected_filename)):
@@ -1088,8 +1395,24 @@ class AIHubExposeImage(AIHubExposeBase):
 			dictValue["frame"] = self.frame_widget.get_value_as_int()
 			dictValue["total_frames"] = self.total_frames_widget.get_value_as_int()
 		return dictValue
+
+	def get_scale_factor(self, resolution_mode):
+		# every upload is scaled from its own size, so a layer or a crop that fits the
+		# budget is sent as it is and the sides of what is sent land on multiples of 64,
+		# selection crops are already cut down to what matters so only a budget that
+		# they go over shrinks them
+		if resolution_mode is None:
+			return NO_SCALE
+		budget_only = self.is_using_internal_file() and self.data.get("type", "upload") in SELECTION_LOAD_TYPES
+		return get_scale_factor(resolution_mode, self.value_width, self.value_height, budget_only=budget_only)
+
+	def get_run_stats_key(self, resolution_mode=None):
+		# the size of what we send is what makes the run slower or faster
+		scale_factor = self.get_scale_factor(resolution_mode)
+		return [scale_size(self.value_width, scale_factor[0]), scale_size(self.value_height, scale_factor[1])]
 	
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
+		scale_factor = self.get_scale_factor(resolution_mode)
 		base_value = self.get_value_base()
 		# remove _local_file from the value
 		if base_value is not None and "_local_file" in base_value:
@@ -1097,15 +1420,15 @@ class AIHubExposeImage(AIHubExposeBase):
 		if base_value is not None and self.info_only_mode:
 			del base_value["local_file"]
 
-		if half_size:
-			if "pos_x" in base_value and half_size_coords:
-				base_value["pos_x"] = base_value["pos_x"] // 2
-			if "pos_y" in base_value and half_size_coords:
-				base_value["pos_y"] = base_value["pos_y"] // 2
+		if scale_factor != NO_SCALE:
+			if "pos_x" in base_value and scale_coords:
+				base_value["pos_x"] = scale_coordinate(base_value["pos_x"], scale_factor[0])
+			if "pos_y" in base_value and scale_coords:
+				base_value["pos_y"] = scale_coordinate(base_value["pos_y"], scale_factor[1])
 			if "value_width" in base_value:
-				base_value["value_width"] = base_value["value_width"] // 2
+				base_value["value_width"] = scale_size(base_value["value_width"], scale_factor[0])
 			if "value_height" in base_value:
-				base_value["value_height"] = base_value["value_height"] // 2
+				base_value["value_height"] = scale_size(base_value["value_height"], scale_factor[1])
 
 		return base_value
 	
@@ -1116,19 +1439,7 @@ class AIHubExposeImage(AIHubExposeBase):
 			# update the model of the select combo
 			# if the model is different from the current one
 			if (self.select_combo.get_model() != model and model is not None):
-				if self.data.get("optional", False):
-					# Get column types from the original model
-					n_columns = model.get_n_columns()
-					column_types = [model.get_column_type(i) for i in range(n_columns)]
-					new_model = Gtk.ListStore(*column_types)
-
-					# Copy all rows from the original model
-					for row in model:
-						new_model.append(list(row))
-					# we want to insert at the top the none option
-					new_model.insert(0, [ -1, _("No image selected"), None ])
-					model = new_model
-					
+				model = self.get_select_combo_model(model)
 				self.select_combo.set_model(model)
 				if model is not None and len(model) > 0:
 					self.select_combo.set_active(0)
@@ -1138,6 +1449,45 @@ class AIHubExposeImage(AIHubExposeBase):
 
 		self.check_validity(self.get_value())
 
+	def get_select_combo_model(self, model):
+		if not self.data.get("optional", False):
+			return model
+
+		# we need to add the option for no selection, but make a copy of the model first
+		# because we don't want to modify the original model
+		# Get column types from the original model
+		n_columns = model.get_n_columns()
+		column_types = [model.get_column_type(i) for i in range(n_columns)]
+		new_model = Gtk.ListStore(*column_types)
+
+		# Copy all rows from the original model
+		for row in model:
+			new_model.append(list(row))
+		# we want to insert at the top the none option
+		new_model.insert(0, [ -1, _("No image selected"), None ])
+		return new_model
+
+	def image_model_changed(self, model):
+		super().image_model_changed(model)
+
+		if self.is_using_internal_file() or model is None:
+			return
+
+		# keep the same image selected in the new model, if it is still open
+		previous_image_id = None
+		tree_iter = self.select_combo.get_active_iter()
+		if tree_iter is not None:
+			previous_image_id = self.select_combo.get_model()[tree_iter][0]
+
+		model = self.get_select_combo_model(model)
+		self.select_combo.set_model(model)
+		for index, row in enumerate(model):
+			if row[0] == previous_image_id:
+				self.select_combo.set_active(index)
+				return
+		if len(model) > 0:
+			self.select_combo.set_active(0)
+
 	def after_ui_built(self, workflow_elements_all):
 		self.check_validity(self.get_value())
 		if (self.is_using_internal_file()):
@@ -1160,6 +1510,27 @@ class AIHubExposeImage(AIHubExposeBase):
 		self.load_image_data_for_internal()
 		self.check_validity(self.get_value())
 
+	def on_images_invalidated(self, image_ids):
+		if self.is_using_internal_file():
+			super().on_images_invalidated(image_ids)
+			return
+
+		# the image we show is the one picked in our own combo, not the current one
+		if self.selected_filename is None and self.select_combo is not None:
+			tree_iter = self.select_combo.get_active_iter()
+			if tree_iter is not None and self.select_combo.get_model()[tree_iter][0] in image_ids:
+				self.load_image_preview()
+				self.check_validity(self.get_value())
+
+	def get_shown_image_ids(self):
+		if self.is_using_internal_file():
+			return super().get_shown_image_ids()
+		if self.selected_filename is None and self.select_combo is not None:
+			tree_iter = self.select_combo.get_active_iter()
+			if tree_iter is not None and self.select_combo.get_model()[tree_iter][0] != -1:
+				return {self.select_combo.get_model()[tree_iter][0]}
+		return set()
+
 	def check_validity(self, value):
 		if (not self.is_using_internal_file()):
 			if (self.selected_filename is None and self.select_combo.get_active() == -1):
@@ -1308,7 +1679,7 @@ class AIHubExposeFileBase(AIHubExposeBase):
 			"local_file": self.uploaded_file_path,
 		}
 	
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		base_value = self.get_value_base()
 		# remove _local_file from the value
 		if base_value is not None and "_local_file" in base_value:
@@ -1329,7 +1700,7 @@ class AIHubExposeFileBase(AIHubExposeBase):
 			return True
 		return self.selected_filename is not None and os.path.exists(self.selected_filename)
 	
-	def upload_binary(self, ws, relegator=None, half_size=False):
+	def upload_binary(self, ws, relegator=None, resolution_mode=None):
 		self.uploaded_file_path = None
 
 		if self.selected_filename is None and self.data.get("optional", False):
@@ -1357,7 +1728,7 @@ class AIHubExposeFileBase(AIHubExposeBase):
 
 		relegator.reset()
 
-		ws.send(json.dumps(binary_header))
+		self.send_file_upload_request(ws, binary_header, file_data)
 
 		if not relegator.wait(10):
 			return _("Error uploading file {}: Timeout waiting for server response").format(self.selected_filename)
@@ -1392,8 +1763,8 @@ class AIHubExposeFileBase(AIHubExposeBase):
 				return _("Error uploading file {}: Unexpected server response").format(self.selected_filename)
 			except Exception as e:
 				return _("Error uploading file {}: {}").format(self.selected_filename, str(e))
-		elif (response_data["type"] == "FILE_UPLOAD_SKIP"):
-			# file already exists on server
+		elif (response_data["type"] == "FILE_UPLOAD_SKIP" or response_data["type"] == "FILE_UPLOAD_SUCCESS"):
+			# file already exists on server, or it was sent in the same frame as the header
 			filename = response_data.get("file", None)
 			self.uploaded_file_path = filename
 			if self.uploaded_file_path is None:
@@ -1554,7 +1925,7 @@ class AIHubExposeInteger(AIHubExposeBase):
 		# ensure to add spacing from the top some margin top
 		self.box.set_margin_top(10)
 
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		return self.widget.get_value_as_int()
 
 	def get_widget(self):
@@ -1745,7 +2116,7 @@ class AIHubExposeSeed(AIHubExposeBase):
 			"value": self.widget_value.get_active_id()
 		}
 	
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		current_selection = self.widget_value.get_active_id()
 		if current_selection == "random":
 			random_value = random.randint(0, (2**32) - 1)
@@ -1864,7 +2235,7 @@ class AIHubExposeFloat(AIHubExposeBase):
 		
 		return True
 
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		return self.widget.get_value()
 
 	def get_widget(self):
@@ -1967,6 +2338,9 @@ class AIHubExposeSteps(AIHubExposeInteger):
 			self.on_change(self.get_value())
 			self.check_validity(self.get_value())
 
+	def get_run_stats_key(self, resolution_mode=None):
+		return self.get_value()
+
 class AIHubExposeBoolean(AIHubExposeBase):
 	def __init__(self, id, data, workflow_context, workflow_id, workflow, project_current_timeline_path, project_saved_path, apinfo):
 		super().__init__(id, data, workflow_context, workflow_id, workflow, project_current_timeline_path, project_saved_path, apinfo)
@@ -1996,7 +2370,7 @@ class AIHubExposeBoolean(AIHubExposeBase):
 		# ensure to add spacing from the top some margin top
 		self.box.set_margin_top(10)
 
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		return self.widget.get_active()
 
 	def get_widget(self):
@@ -2078,7 +2452,7 @@ class AIHubExposeString(AIHubExposeBase):
 		# ensure to add spacing from the top some margin top
 		self.box.set_margin_top(10)
 
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		if (self.is_multiline):
 			return self.widget.get_buffer().get_text(
 				self.widget.get_buffer().get_start_iter(),
@@ -2217,7 +2591,7 @@ class AIHubExposeStringSelection(AIHubExposeBase):
 		self.box.pack_start(self.error_label.get_widget(), False, False, 0)
 		self.box.pack_start(self.widget, True, True, 0)
 
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		return self.widget.get_active_id()
 
 	def get_widget(self):
@@ -2278,7 +2652,7 @@ class AIHubExposeProjectFileBase(AIHubExposeBase):
 
 		self.uploaded_file_path: str = None
 
-	def upload_binary(self, ws, relegator=None, half_size=False):
+	def upload_binary(self, ws, relegator=None, resolution_mode=None):
 		self.uploaded_file_path = None
 
 		file_name = self.data.get("file_name", None)
@@ -2340,7 +2714,7 @@ class AIHubExposeProjectFileBase(AIHubExposeBase):
 
 		relegator.reset()
 
-		ws.send(json.dumps(binary_header))
+		self.send_file_upload_request(ws, binary_header, file_data)
 
 		if not relegator.wait(10):
 			return _("Error uploading file {}: Timeout waiting for server response").format(file_to_upload)
@@ -2375,8 +2749,8 @@ class AIHubExposeProjectFileBase(AIHubExposeBase):
 				return _("Error uploading file {}: Unexpected server response").format(file_to_upload)
 			except Exception as e:
 				return _("Error uploading file {}: {}").format(file_to_upload, str(e))
-		elif (response_data["type"] == "FILE_UPLOAD_SKIP"):
-			# file already exists on server
+		elif (response_data["type"] == "FILE_UPLOAD_SKIP" or response_data["type"] == "FILE_UPLOAD_SUCCESS"):
+			# file already exists on server, or it was sent in the same frame as the header
 			filename = response_data.get("file", None)
 			self.uploaded_file_path = filename
 			if self.uploaded_file_path is None:
@@ -2385,7 +2759,7 @@ class AIHubExposeProjectFileBase(AIHubExposeBase):
 
 		return _("Error uploading file {}: Unexpected server response").format(file_to_upload)
 	
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		return {
 			"local_file": self.uploaded_file_path,
 		}
@@ -2396,7 +2770,7 @@ class AIHubExposeProjectFilesBase(AIHubExposeBase):
 
 		self.uploaded_file_paths: list[str] = []
 
-	def upload_binary(self, ws, relegator=None, half_size=False):
+	def upload_binary(self, ws, relegator=None, resolution_mode=None):
 		file_name = self.data.get("file_name", None)
 		indexes = self.data.get("indexes", "")
 		files_to_upload = []
@@ -2486,7 +2860,7 @@ class AIHubExposeProjectFilesBase(AIHubExposeBase):
 
 			relegator.reset()
 
-			ws.send(json.dumps(binary_header))
+			self.send_file_upload_request(ws, binary_header, file_data)
 
 			if not relegator.wait(10):
 				return _("Error uploading file {}: Timeout waiting for server response").format(file_to_upload)
@@ -2523,8 +2897,8 @@ class AIHubExposeProjectFilesBase(AIHubExposeBase):
 					return _("Error uploading file {}: Unexpected server response").format(file_to_upload)
 				except Exception as e:
 					return _("Error uploading file {}: {}").format(file_to_upload, str(e))
-			elif (response_data["type"] == "FILE_UPLOAD_SKIP"):
-				# file already exists on server
+			elif (response_data["type"] == "FILE_UPLOAD_SKIP" or response_data["type"] == "FILE_UPLOAD_SUCCESS"):
+				# file already exists on server, or it was sent in the same frame as the header
 				filename = response_data.get("file", None)
 				if filename is None:
 					return _("Error uploading file {}: Server did not return uploaded file path").format(file_to_upload)
@@ -2533,42 +2907,42 @@ class AIHubExposeProjectFilesBase(AIHubExposeBase):
 
 			return _("Error uploading file {}: Unexpected server response").format(file_to_upload)
 	
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		return {
 			# server expects a comma separated list of file paths
 			"local_files": self.uploaded_file_paths,
 		}
 
 class AIHubExposeProjectConfigBase(AIHubExposeBase):
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		value = self.read_project_config_json(self.data["field"])
 		if value is None:
 			value = self.data["default"]
 		return value
 
 class AIHubExposeProjectConfigString(AIHubExposeProjectConfigBase):
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		parent_value = super().get_value()
 		if not isinstance(parent_value, str):
 			return self.data["default"]
 		return parent_value
 	
 class AIHubExposeProjectConfigInteger(AIHubExposeProjectConfigBase):
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		parent_value = super().get_value()
 		if not isinstance(parent_value, int):
 			return self.data["default"]
 		return parent_value
 	
 class AIHubExposeProjectConfigBoolean(AIHubExposeProjectConfigBase):
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		parent_value = super().get_value()
 		if not isinstance(parent_value, bool):
 			return self.data["default"]
 		return parent_value
 	
 class AIHubExposeProjectConfigFloat(AIHubExposeProjectConfigBase):
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		parent_value = super().get_value()
 		if not isinstance(parent_value, float):
 			return self.data["default"]
@@ -2670,7 +3044,7 @@ class AIHubExposeLora(AIHubExposeBase):
 		self.strength = widget.get_value()
 		self.on_change(self.get_value())
 
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		return {
 			"strength": self.slider.get_value(),
 			"enabled": self.enabled,
@@ -3033,7 +3407,12 @@ class AIHubExposeModel(AIHubExposeBase):
 			# cancel pressed destroy the dialog
 			dialog.destroy()
 		
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_run_stats_key(self, resolution_mode=None):
+		if self.model is None:
+			return None
+		return self.model.get("id", None)
+
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		if self.model is None:
 			return None
 		
@@ -3465,7 +3844,7 @@ class AIHubExposeImageBatch(AIHubExposeBase):
 	def get_widget(self):
 		return self.box
 
-	def get_value(self, half_size=False, half_size_coords=False):
+	def get_value(self, resolution_mode=None, scale_coords=False):
 		return {
 			"local_files": [expose.get_value().get("local_file", None) for expose in self.list_of_exposes],
 			"metadata": json.dumps(self.get_metadata())
@@ -3480,9 +3859,9 @@ class AIHubExposeImageBatch(AIHubExposeBase):
 			metadata.append(metadata_entry)
 		return metadata
 	
-	def upload_binary(self, ws, relegator=None, half_size=False):
+	def upload_binary(self, ws, relegator=None, resolution_mode=None):
 		for expose in self.list_of_exposes:
-			result = expose.upload_binary(ws, relegator, half_size=half_size)
+			result = expose.upload_binary(ws, relegator, resolution_mode=resolution_mode)
 			if result is not True:
 				return result
 		return True
@@ -3510,6 +3889,34 @@ class AIHubExposeImageBatch(AIHubExposeBase):
 			for expose in expose_list:
 				expose.current_image_changed(image, model)
 
+	def image_model_changed(self, model):
+		super().image_model_changed(model)
+
+		for expose in self.list_of_exposes:
+			expose.image_model_changed(model)
+
+		for expose_list in self.list_of_expose_metadata_subexposes:
+			for expose in expose_list:
+				expose.image_model_changed(model)
+
+	def on_images_invalidated(self, image_ids):
+		for expose in self.list_of_exposes:
+			expose.on_images_invalidated(image_ids)
+
+		for expose_list in self.list_of_expose_metadata_subexposes:
+			for expose in expose_list:
+				expose.on_images_invalidated(image_ids)
+
+	def get_shown_image_ids(self):
+		image_ids = super().get_shown_image_ids()
+		for expose in self.list_of_exposes:
+			image_ids.update(expose.get_shown_image_ids())
+
+		for expose_list in self.list_of_expose_metadata_subexposes:
+			for expose in expose_list:
+				image_ids.update(expose.get_shown_image_ids())
+		return image_ids
+
 EXPOSES = {
 	"AIHubExposeInteger": AIHubExposeInteger,
 	"AIHubExposeFloat": AIHubExposeFloat,
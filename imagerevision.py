@@ -0,0 +1,41 @@
+import time
+
+# GIMP does not expose the dirty counter or the undo position of an image to plug-ins,
+# so while an image has unsaved changes we let its revision move forward on its own every
+# this many seconds, that way caches keyed on the revision refresh at most that often
+DIRTY_IMAGE_REVISION_SECONDS = 5.0
+
+def get_layer_revision(layer):
+	offsets = layer.get_offsets()
+	return (
+		layer.get_id(),
+		layer.get_visible(),
+		round(layer.get_opacity(), 2),
+		offsets.offset_x,
+		offsets.offset_y,
+		layer.get_width(),
+		layer.get_height(),
+	)
+
+def get_image_revision(image, dirty_buckets=True):
+	"""
+	Returns a cheap token that changes whenever the image is likely to look different,
+	it only reads properties of the image and its top level layers so it is fast enough
+	to be called on every refresh for every open image
+
+	With dirty_buckets disabled the token only reflects the structure of the image, it
+	does not move forward on its own while the image is dirty
+	"""
+	if image is None or not image.is_valid():
+		return None
+
+	dirty = image.is_dirty()
+	return (
+		image.get_id(),
+		image.get_name(),
+		image.get_width(),
+		image.get_height(),
+		dirty,
+		int(time.monotonic() // DIRTY_IMAGE_REVISION_SECONDS) if dirty and dirty_buckets else None,
+		tuple(get_layer_revision(layer) for layer in image.get_layers()),
+	)
@@ -0,0 +1,134 @@
+import re
+import struct
+import zlib
+
+# numpy is optional, it makes finding the runs of big masks a lot faster
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+MASK_ENCODINGS = ["png", "rle", "auto"]
+
+# header of the run length encoded masks, see encode_mask_rle
+MASK_RLE_MAGIC = b"AIHM"
+MASK_RLE_VERSION = 1
+MASK_RLE_ENCODING = "aihm-rle"
+MASK_RLE_EXTENSION = ".aihm"
+
+def get_mask_extension(encoding):
+	"""
+	Extension of a mask file with the given encoding, auto masks are png until they are
+	known to be hard edged
+	"""
+	if encoding in ("rle", MASK_RLE_ENCODING):
+		return MASK_RLE_EXTENSION
+	return ".png"
+
+def encode_gray_png(data, width, height, level=6):
+	"""
+	Encodes width x height bytes of 8 bit grey as a single channel png
+	"""
+	def chunk(chunk_type, chunk_data):
+		body = chunk_type + chunk_data
+		return struct.pack(">I", len(chunk_data)) + body + struct.pack(">I", zlib.crc32(body) & 0xffffffff)
+
+	# every row starts with its filter type, 0 is none
+	if np is not None:
+		rows = np.frombuffer(data, dtype=np.uint8, count=width * height).reshape(height, width)
+		raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), rows]).tobytes()
+	else:
+		raw = b"".join(b"\x00" + data[row * width:(row + 1) * width] for row in range(height))
+
+	return b"".join([
+		b"\x89PNG\r\n\x1a\n",
+		chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)),
+		chunk(b"IDAT", zlib.compress(raw, level)),
+		chunk(b"IEND", b""),
+	])
+
+def is_hard_edged(data):
+	"""
+	Whether the mask is only fully off (0) and fully on (255) pixels
+	"""
+	return len(bytes(data).translate(None, b"\x00\xff")) == 0
+
+def get_mask_runs(data):
+	"""
+	Lengths of the alternating runs of off and on pixels, always starting with an off
+	run which may be empty, pixels above 127 count as on
+	"""
+	if np is not None:
+		on = np.frombuffer(data, dtype=np.uint8) > 127
+		if len(on) == 0:
+			return []
+		changes = np.flatnonzero(on[1:] != on[:-1]) + 1
+		bounds = np.concatenate(([0], changes, [len(on)]))
+		runs = np.diff(bounds).tolist()
+		if on[0]:
+			runs.insert(0, 0)
+		return runs
+
+	binary = bytes(data).translate(bytes(0 if i <= 127 else 1 for i in range(256)))
+	runs = [len(match.group(0)) for match in re.finditer(b"\x00+|\x01+", binary)]
+	if len(binary) > 0 and binary[0] == 1:
+		runs.insert(0, 0)
+	return runs
+
+def encode_varint(value):
+	encoded = bytearray()
+	while True:
+		byte = value & 0x7f
+		value >>= 7
+		if value:
+			encoded.append(byte | 0x80)
+		else:
+			encoded.append(byte)
+			return bytes(encoded)
+
+def encode_mask_rle(data, width, height):
+	"""
+	Encodes a hard edged mask as the AIHM magic, a version byte, the width and height as
+	big endian uint32 and then the runs of get_mask_runs as LEB128 varints
+	"""
+	header = MASK_RLE_MAGIC + struct.pack(">BII", MASK_RLE_VERSION, width, height)
+	return header + b"".join(encode_varint(run) for run in get_mask_runs(data))
+
+def decode_mask_rle(encoded):
+	"""
+	Returns (width, height, data) for a mask made by encode_mask_rle
+	"""
+	if encoded[:4] != MASK_RLE_MAGIC:
+		raise ValueError("Not an AIHM mask")
+	version, width, height = struct.unpack(">BII", encoded[4:13])
+	if version != MASK_RLE_VERSION:
+		raise ValueError("Unsupported AIHM mask version {}".format(version))
+
+	data = bytearray()
+	value = 0
+	position = 13
+	while position < len(encoded):
+		run = 0
+		shift = 0
+		while True:
+			byte = encoded[position]
+			position += 1
+			run |= (byte & 0x7f) << shift
+			shift += 7
+			if not byte & 0x80:
+				break
+		data += (b"\xff" if value else b"\x00") * run
+		value = 1 - value
+
+	if len(data) != width * height:
+		raise ValueError("AIHM mask has {} pixels instead of {}".format(len(data), width * height))
+	return width, height, bytes(data)
+
+def encode_mask(data, width, height, encoding="png"):
+	"""
+	Encodes the mask with the given encoding, auto uses the run length encoding for
+	hard edged masks and png otherwise, returns (encoded bytes, encoding used)
+	"""
+	if encoding == "rle" or (encoding == "auto" and is_hard_edged(data)):
+		return encode_mask_rle(data, width, height), MASK_RLE_ENCODING
+	return encode_gray_png(data, width, height), "png"
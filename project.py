@@ -1,13 +1,19 @@
 import os
-from gi.repository import Gimp, Gtk, GLib, Gdk # type: ignore
+from gi.repository import Gimp, Gtk, GLib, Gdk, GObject # type: ignore
 from gi.repository.GdkPixbuf import Pixbuf # type: ignore
 from gi.repository import Gio # type: ignore
 import threading
 from frame_by_frame import FrameByFrameVideoVideoViewer
-from shutil import copyfile, rmtree
+from shutil import copyfile
+from projectstorage import break_hardlink, get_blob_store
+from provenance import get_provenance_index
+from thumbnails import THUMBNAIL_SIZE, get_thumbnail_cache, get_thumbnail_key, release_thumbnail_cache
+from filegrid import FileGrid
 
 import sys
 import subprocess
+import json
+import time
 
 import gettext
 textdomain = "gimp30-python"
@@ -70,6 +76,42 @@ EXTENSIONS_THUMBNAILS = {
 
 EXTENSIONS_THUMBNAILS_CACHE = {}
 
+def get_placeholder_thumbnail(extension_with_dot):
+    # the icon for the kind of file, shown while the real thumbnail is being made
+    global UNKNOWN_THUMBNAIL
+    if extension_with_dot in EXTENSIONS_THUMBNAILS_CACHE:
+        return EXTENSIONS_THUMBNAILS_CACHE[extension_with_dot]
+    if extension_with_dot in EXTENSIONS_THUMBNAILS:
+        thumbnail = Pixbuf.new_from_file_at_scale(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "icons", EXTENSIONS_THUMBNAILS[extension_with_dot]),
+            100,
+            100,
+            True
+        )
+        EXTENSIONS_THUMBNAILS_CACHE[extension_with_dot] = thumbnail
+        return thumbnail
+    if UNKNOWN_THUMBNAIL is None:
+        # create an icon pixbuf for the unknown thumbnail
+        UNKNOWN_THUMBNAIL = Pixbuf.new_from_file_at_scale(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "icons",
+                "unknown.png"
+            ),
+            100,
+            100,
+            True
+        )
+    return UNKNOWN_THUMBNAIL
+
+def get_file_placeholder_thumbnail(file_path):
+    return get_placeholder_thumbnail(os.path.splitext(file_path)[1].lower())
+
+# dirty images have no cheap way to tell whether they changed, so their thumbnails are
+# remade on a timer instead of on every focus, one image every this many seconds, they
+# only live in the grid since the changes may never be saved
+DIRTY_THUMBNAIL_INTERVAL_SECONDS = 15
+
 SUPPORTED_IMAGE_EXTENSIONS = [
     ".png",
     ".jpg",
@@ -99,6 +141,13 @@ SUPPORTED_VIDEO_EXTENSIONS = [
 ]
 
 def open_file_with_default_app(path):
+    # the other app may write the file in place, it must not change the blob that the
+    # file shares with other timelines, see projectstorage.py
+    if os.path.isfile(path):
+        try:
+            break_hardlink(path)
+        except Exception as e:
+            print("Error unsharing file before opening it:", e)
     if sys.platform.startswith("linux"):  # could be "linux", "linux2", "linux3", ...
         subprocess.run(["xdg-open", path])
     elif sys.platform == "darwin":
@@ -132,6 +181,10 @@ class ProjectDialog(Gtk.Dialog):
         self.is_deleting = False
 
         self.images_opened = []
+        self.dirty_thumbnail_index = 0
+        # xcf path to the thumbnail with the unsaved changes of its open image
+        self.unsaved_thumbnails = {}
+        self.dirty_thumbnail_source = GLib.timeout_add_seconds(DIRTY_THUMBNAIL_INTERVAL_SECONDS, self.refresh_dirty_image_thumbnails)
 
         self.custom_project_file_folder = os.path.join(self.project_folder, "project_files")
 
@@ -171,20 +224,123 @@ class ProjectDialog(Gtk.Dialog):
         menu_item_import = Gtk.MenuItem(label=_("Import image from file"))
         menu_item_import.connect("activate", self.on_menu_import_file)
         menu.append(menu_item_import)
+        menu.append(Gtk.SeparatorMenuItem())
+        menu_item_disk_usage = Gtk.MenuItem(label=_("Disk usage by timeline"))
+        menu_item_disk_usage.connect("activate", self.on_menu_disk_usage)
+        menu.append(menu_item_disk_usage)
 
         menu_button.set_popup(menu)
         menu.show_all()
 
         Gtk.Window.connect(self, "focus-in-event", on_focus_dialog)
         Gtk.Window.connect(self, "focus-in-event", self.refresh_non_dirty_images)
+        self.connect("destroy", self.stop_background_updates)
 
         self.set_keep_above(True)
 
+        self.build_search_ui()
+
         # Add more widgets to display and edit project data as needed
         self.rebuild_timeline_ui()
         self.update_project_file_list()
         self.show_all()
 
+    def build_search_ui(self):
+        # finds the files received by past runs by their workflow, values and file name
+        search_label = Gtk.Label(label=_("Search generated files:"))
+        search_label.set_margin_top(10)
+        self.internal_box.pack_start(search_label, False, False, 0)
+
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.set_placeholder_text(_("eg. seed=1234 lora_name"))
+        self.search_entry.set_tooltip_text(_("Words match the start of any word in the values, workflow or file name, key=value matches a value exactly"))
+        self.search_entry.set_margin_start(10)
+        self.search_entry.set_margin_end(50)
+        self.search_entry.connect("search-changed", self.on_search_changed)
+        self.internal_box.pack_start(self.search_entry, False, False, 0)
+
+        # file name, timeline name, workflow, date, path, timeline id, values tooltip
+        self.search_results_store = Gtk.ListStore(str, str, str, str, str, str, str)
+        self.search_results_view = Gtk.TreeView(model=self.search_results_store)
+        for index, title in enumerate([_("File"), _("Timeline"), _("Workflow"), _("Received")]):
+            column = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=index)
+            column.set_resizable(True)
+            self.search_results_view.append_column(column)
+        self.search_results_view.set_tooltip_column(6)
+        self.search_results_view.connect("row-activated", self.on_search_result_activated)
+        self.search_results_view.connect("button-press-event", self.on_search_result_button_press)
+
+        self.search_results_scrolled_window = Gtk.ScrolledWindow()
+        self.search_results_scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        self.search_results_scrolled_window.set_size_request(200, 200)
+        self.search_results_scrolled_window.set_margin_start(10)
+        self.search_results_scrolled_window.set_margin_end(50)
+        self.search_results_scrolled_window.set_no_show_all(True)
+        self.search_results_scrolled_window.add(self.search_results_view)
+        self.internal_box.pack_start(self.search_results_scrolled_window, False, False, 0)
+
+    def on_search_changed(self, entry):
+        query = entry.get_text().strip()
+        self.search_results_store.clear()
+        if query == "":
+            self.search_results_scrolled_window.hide()
+            return
+
+        try:
+            results = get_provenance_index(self.project_folder).search(query)
+        except Exception as e:
+            print("Error searching the provenance index:", e)
+            results = []
+
+        timelines = self.project_file_contents.get("timelines", {})
+        for result in results:
+            # files of deleted timelines or removed by hand are not shown
+            if not os.path.exists(result["path"]):
+                continue
+            timeline_name = timelines.get(result["timeline_id"], {}).get("name", _("unknown"))
+            values_text = "\n".join(
+                "{}: {}".format(key, json.dumps(value) if isinstance(value, (dict, list)) else value)
+                for key, value in result["values"].items()
+            )
+            self.search_results_store.append([
+                result["file_name"],
+                timeline_name,
+                result["workflow_id"] or "",
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(result["received_at"])) if result["received_at"] else "",
+                result["path"],
+                result["timeline_id"] or "",
+                GLib.markup_escape_text(values_text),
+            ])
+        self.search_results_scrolled_window.show_all()
+
+    def on_search_result_activated(self, treeview, path, column):
+        open_file_with_default_app(self.search_results_store[path][4])
+
+    def on_search_result_button_press(self, treeview, event):
+        if event.type != Gdk.EventType.BUTTON_PRESS or event.button != Gdk.BUTTON_SECONDARY:
+            return False
+        path_info = treeview.get_path_at_pos(int(event.x), int(event.y))
+        if path_info is None:
+            return False
+        path = path_info[0]
+        file_path = self.search_results_store[path][4]
+        timeline_id = self.search_results_store[path][5]
+
+        menu = Gtk.Menu()
+        menu_item_open = Gtk.MenuItem(label=_("Open File"))
+        menu_item_open.connect("activate", lambda item: open_file_with_default_app(file_path))
+        menu.append(menu_item_open)
+        menu_item_save_as = Gtk.MenuItem(label=_("Save File As..."))
+        menu_item_save_as.connect("activate", lambda item: self.save_file_as(file_path))
+        menu.append(menu_item_save_as)
+        if timeline_id in self.project_file_contents.get("timelines", {}) and self.update_project_timeline is not None:
+            menu_item_timeline = Gtk.MenuItem(label=_("Go to Timeline"))
+            menu_item_timeline.connect("activate", lambda item: self.update_project_timeline(timeline_id))
+            menu.append(menu_item_timeline)
+        menu.show_all()
+        menu.popup_at_pointer(event)
+        return True
+
     def refresh(self, new_project_file_contents, new_project_current_timeline_folder):
         # Refresh the dialog with the latest project data
         self.project_file_contents = new_project_file_contents
@@ -214,6 +370,9 @@ class ProjectDialog(Gtk.Dialog):
         if not hasattr(self, 'timeline_tree_widget'):
             # one column the name, the other column the id
             self.timeline_tree_store = Gtk.TreeStore(str, str)
+            # timeline id to its row, and to the parent it was added under
+            self.timeline_tree_rows = {}
+            self.timeline_tree_parents = {}
 
             box_inside_to_force_set_margins = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
             box_inside_to_force_set_margins.set_margin_start(10)
@@ -280,71 +439,51 @@ class ProjectDialog(Gtk.Dialog):
             timeline_tree_scrolled_window.add(self.timeline_tree_widget)
             box_inside_to_force_set_margins.pack_start(timeline_tree_scrolled_window, True, True, 0)
 
-        # start adding the timelines to the tree store without clearing it
-        existing_timelines = {}
-        timeline_values = self.project_file_contents.get("timelines", {}).values()
-        # we need to add the iter to the existing_timelines dict
-        for row in self.timeline_tree_store:
-            existing_timelines[row[1]] = row.iter
-            # also add all children
-            def add_children(parent_iter):
-                child_iter = self.timeline_tree_store.iter_children(parent_iter)
-                while child_iter is not None:
-                    existing_timelines[self.timeline_tree_store[child_iter][1]] = child_iter
-                    add_children(child_iter)
-                    child_iter = self.timeline_tree_store.iter_next(child_iter)
-            add_children(row.iter)
-
-        # delete any timelines that are no longer present
-        # NO you cannot do this because of GTK bugs with tree stores
-        # for timeline_id in list(existing_timelines.keys()):
-        #    found = False
-        #    for timeline in timeline_values:
-        #        if timeline.get("id", None) == timeline_id:
-        #            found = True
-        #            break
-        #    if not found:
-        #        self.timeline_tree_store.remove(existing_timelines[timeline_id])
-        #        del existing_timelines[timeline_id]
-
-        nodes_skipped = -1
-        past_nodes_skipped = None
-        while nodes_skipped != 0:
-            if past_nodes_skipped is not None and past_nodes_skipped == nodes_skipped:
-                # we are not making any progress, break the loop
-                # some nodes are probably orphaned
-                break
-
-            past_nodes_skipped = nodes_skipped
-            nodes_skipped = 0
-            for timeline in timeline_values:
-                timeline_id = timeline.get("id", None)
-                if timeline_id is None:
-                    continue
-                if timeline_id in existing_timelines:
-                    # update the name if needed
-                    existing_iter = existing_timelines[timeline_id]
-                    timeline_name = timeline.get("name", "")
-                    if timeline_name != self.timeline_tree_store[existing_iter][0]:
-                        self.timeline_tree_store[existing_iter][0] = timeline_name
-                else:
-                    timeline_parent_id = timeline.get("parent_id", None)
-                    timeline_name = timeline.get("name", "")
-                    if timeline_parent_id is None or timeline_parent_id == "":
-                        # add as root node
-                        new_iter = self.timeline_tree_store.append(None, [timeline_name, timeline_id])
-                        existing_timelines[timeline_id] = new_iter
-                    elif timeline_parent_id in existing_timelines:
-                        parent_iter = existing_timelines[timeline_parent_id]
-                        new_iter = self.timeline_tree_store.append(parent_iter, [timeline_name, timeline_id])
-                        existing_timelines[timeline_id] = new_iter
-                    else:
-                        nodes_skipped += 1
+        # the tree is updated in place, rows of timelines that are gone or moved to another
+        # parent are removed, then one pass from the roots down adds the missing ones
+        timelines = self.project_file_contents.get("timelines", {})
+        children_by_parent = {}
+        for timeline in timelines.values():
+            timeline_id = timeline.get("id", None)
+            if timeline_id is None:
+                continue
+            children_by_parent.setdefault(timeline.get("parent_id", None) or None, []).append(timeline)
+
+        for timeline_id, row in list(self.timeline_tree_rows.items()):
+            timeline = timelines.get(timeline_id, None)
+            if timeline is None or (timeline.get("parent_id", None) or None) != self.timeline_tree_parents.get(timeline_id, None):
+                # removing a row takes its children along, they are added back below
+                if row.valid():
+                    self.timeline_tree_store.remove(self.timeline_tree_store.get_iter(row.get_path()))
+        for timeline_id, row in list(self.timeline_tree_rows.items()):
+            if not row.valid():
+                del self.timeline_tree_rows[timeline_id]
+                self.timeline_tree_parents.pop(timeline_id, None)
+
+        # timelines whose parent does not exist are never reached and not shown
+        pending = [(None, timeline) for timeline in children_by_parent.get(None, [])]
+        pending_index = 0
+        while pending_index < len(pending):
+            parent_iter, timeline = pending[pending_index]
+            pending_index += 1
+            timeline_id = timeline["id"]
+            timeline_name = timeline.get("name", "")
+            row = self.timeline_tree_rows.get(timeline_id, None)
+            if row is not None:
+                timeline_iter = self.timeline_tree_store.get_iter(row.get_path())
+                # update the name if needed
+                if timeline_name != self.timeline_tree_store[timeline_iter][0]:
+                    self.timeline_tree_store[timeline_iter][0] = timeline_name
+            else:
+                timeline_iter = self.timeline_tree_store.append(parent_iter, [timeline_name, timeline_id])
+                self.timeline_tree_rows[timeline_id] = Gtk.TreeRowReference.new(self.timeline_tree_store, self.timeline_tree_store.get_path(timeline_iter))
+                self.timeline_tree_parents[timeline_id] = timeline.get("parent_id", None) or None
+            for child in children_by_parent.get(timeline_id, []):
+                pending.append((timeline_iter, child))
 
         current_selected_timeline_id = self.project_file_contents.get("current_timeline", None)
-        if current_selected_timeline_id in existing_timelines:
-            current_iter = existing_timelines[current_selected_timeline_id]
-            path = self.timeline_tree_store.get_path(current_iter)
+        if current_selected_timeline_id in self.timeline_tree_rows:
+            path = self.timeline_tree_rows[current_selected_timeline_id].get_path()
             self.timeline_tree_widget.expand_to_path(path)
             self.timeline_tree_widget.get_selection().select_path(path)
 
@@ -393,8 +532,8 @@ class ProjectDialog(Gtk.Dialog):
         dialog.destroy()
 
     def rebuild_timeline_files(self):
-        # then we will create a Gtk FlowBox to show them with thumbnails if available
-        if not hasattr(self, 'timeline_file_list_widget'):
+        # then we will create a grid to show them with thumbnails if available
+        if not hasattr(self, 'timeline_file_grid'):
             project_timeline_label = Gtk.Label(label=_("Timeline Files:"))
             project_timeline_label.set_margin_top(20)
             project_timeline_label.set_margin_bottom(10)
@@ -403,159 +542,72 @@ class ProjectDialog(Gtk.Dialog):
             self.internal_box.pack_start(Gtk.Separator(orientation=Gtk.Orientation.HORIZONTAL), False, False, 0)
             self.internal_box.pack_start(project_timeline_label, False, False, 0)
 
-            self.timeline_file_list_widget = Gtk.FlowBox()
-            #ensure max width is only 600 pixels
-            self.timeline_file_list_widget.set_column_spacing(10)
-            self.timeline_file_list_widget.set_row_spacing(10)
-
-            self.internal_box.pack_start(self.timeline_file_list_widget, True, True, 0)
-
-        # clean up existing children
-        for child in self.timeline_file_list_widget.get_children():
-            self.timeline_file_list_widget.remove(child)
+            self.timeline_file_grid = FileGrid(
+                self.get_file_thumbnail,
+                get_file_placeholder_thumbnail,
+                open_file_with_default_app,
+                self.show_timeline_file_menu,
+            )
+            self.internal_box.pack_start(self.timeline_file_grid.widget, True, True, 0)
 
         if self.project_current_timeline_folder is None:
+            self.timeline_file_grid.stop_watching()
+            self.timeline_file_grid.clear()
             return
-        
+
+        # the folder is only listed when the timeline changed, files that runs add to it
+        # afterwards come in through the file monitor
         timeline_files_folder = os.path.join(self.project_current_timeline_folder, "files")
-        timeline_files = []
-        if os.path.exists(timeline_files_folder) and os.path.isdir(timeline_files_folder):
-            timeline_files = [
-                f for f in os.listdir(timeline_files_folder)
-                if os.path.isfile(os.path.join(timeline_files_folder, f)) and
-                not f.endswith(".thumbnail") and
-                not f.startswith("_")
-            ]
-
-        # clean up existing children
-        for child in self.timeline_file_list_widget.get_children():
-            self.timeline_file_list_widget.remove(child)
-            
-        global SUPPORTED_IMAGE_EXTENSIONS
-        global EXTENSIONS_THUMBNAILS
-        global EXTENSIONS_THUMBNAILS_CACHE
-        global UNKNOWN_THUMBNAIL
-        if UNKNOWN_THUMBNAIL is None:
-            # create an icon pixbuf for the unknown thumbnail
-            UNKNOWN_THUMBNAIL = Pixbuf.new_from_file_at_scale(
-                os.path.join(
-                    os.path.dirname(os.path.abspath(__file__)),
-                    "icons",
-                    "unknown.png"
-                ),
-                100,
-                100,
-                True
-            )
-        for timeline_file in timeline_files:
-            thumbnail = UNKNOWN_THUMBNAIL
-            extension_with_dot = os.path.splitext(timeline_file)[1].lower()
-            if extension_with_dot in SUPPORTED_IMAGE_EXTENSIONS:
-                thumbnail_path = os.path.join(timeline_files_folder, timeline_file)
-                thumbnail = Pixbuf.new_from_file_at_scale(thumbnail_path, 100, 100, True)
-            elif os.path.exists(os.path.join(timeline_files_folder, os.path.splitext(timeline_file)[0] + ".thumbnail")):
-                thumbnail_path = os.path.join(timeline_files_folder, os.path.splitext(timeline_file)[0] + ".thumbnail")
-                thumbnail = Pixbuf.new_from_file_at_scale(thumbnail_path, 100, 100, True)
-            elif extension_with_dot in EXTENSIONS_THUMBNAILS_CACHE:
-                thumbnail = EXTENSIONS_THUMBNAILS_CACHE[extension_with_dot]
-            elif extension_with_dot in EXTENSIONS_THUMBNAILS:
-                thumbnail_path = os.path.join(
-                    os.path.dirname(os.path.abspath(__file__)),
-                    "icons",
-                    EXTENSIONS_THUMBNAILS.get(extension_with_dot, "unknown.png")
-                )
-                thumbnail = Pixbuf.new_from_file_at_scale(thumbnail_path, 100, 100, True)
-                EXTENSIONS_THUMBNAILS_CACHE[extension_with_dot] = thumbnail
-
-            # first let's see if we already have this file in the list box
-            existing_file_element = None
-            for file_element in self.timeline_file_list_widget.get_children():
-                label = file_element.get_child().get_child().get_children()[1]
-                if label.get_text() == timeline_file:
-                    existing_file_element = file_element
-                    break
-            if existing_file_element is not None:
-                # If we found an existing file element, we can update it
-                existing_file_element.get_child().get_child().get_children()[0].set_from_pixbuf(thumbnail)
-            else:
-                # If not, we need to create a new row
-                # we need to be sure it is added in alphabetical order
-                new_file_element_event_box = Gtk.EventBox()
-                new_file_element = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-                new_file_element.set_margin_top(10)
-                new_file_element.set_margin_bottom(10)
-                new_file_element.set_margin_start(10)
-                new_file_element.set_margin_end(10)
-                new_file_element.pack_start(Gtk.Image.new_from_pixbuf(thumbnail), False, False, 0)
-                new_file_element.pack_start(Gtk.Label(label=timeline_file), False, False, 0)
-                new_file_element_event_box.add(new_file_element)
-
-                def on_file_double_click(widget, event, timeline_file=timeline_file):
-                    timeline_file_path = os.path.join(timeline_files_folder, timeline_file)
-                    extension_with_dot = os.path.splitext(timeline_file_path)[1].lower()
-                    
-                    if event.type == Gdk.EventType._2BUTTON_PRESS and event.button == Gdk.BUTTON_PRIMARY:
-                        open_file_with_default_app(timeline_file_path)
-                    elif event.type == Gdk.EventType.BUTTON_PRESS and event.button == Gdk.BUTTON_SECONDARY:
-                        # set the flowbox selection to this item
-                        self.timeline_file_list_widget.select_child(widget.get_parent())
-                        # Right-click detected, show context menu
-                        menu = Gtk.Menu()
-                        menu_item_open = Gtk.MenuItem(label=_("Open File"))
-                        menu_item_open.connect("activate", lambda item: open_file_with_default_app(timeline_file_path))
-                        menu.append(menu_item_open)
-
-                        menu_item_save_as = Gtk.MenuItem(label=_("Save File As..."))
-                        menu_item_save_as.connect("activate", lambda item: self.save_file_as(timeline_file_path))
-                        menu.append(menu_item_save_as)
-
-                        if extension_with_dot in SUPPORTED_GIMP_OPENABLE_IMAGE_EXTENSIONS:
-                            # NOTE does not work due to GIMP not setting the overwrite path correctly
-                            #menu_item_open_gimp = Gtk.MenuItem(label="Open in GIMP")
-                            #menu_item_open_gimp.connect("activate", lambda item: self.open_timeline_file_as_image(timeline_file_path))
-                            #menu.append(menu_item_open_gimp)
-
-                            menu_item_overwrite = Gtk.MenuItem(label=_("Overwrite with Reference Image"))
-                            menu_item_overwrite.connect("activate", lambda item: self.overwrite_timeline_file_with_reference_image(timeline_file_path))
-                            menu.append(menu_item_overwrite)
-
-                            menu_item_import = Gtk.MenuItem(label=_("Import as project XCF image"))
-                            menu_item_import.connect("activate", lambda item: self.on_import_file(timeline_file_path))
-                            menu.append(menu_item_import)
-
-                        if extension_with_dot in SUPPORTED_VIDEO_EXTENSIONS:
-                            menu_item_extract_frames = Gtk.MenuItem(label=_("Open in Frame by Frame Viewer"))
-                            menu_item_extract_frames.connect("activate", lambda item: self.open_frame_by_frame_viewer(timeline_file_path))
-                            menu.append(menu_item_extract_frames)
-
-                        menu_item_add_to_project = Gtk.MenuItem(label=_("Add to Project Files"))
-                        menu_item_add_to_project.connect("activate", lambda item: self.add_timeline_file_to_project(timeline_file_path))
-                        menu.append(menu_item_add_to_project)
-
-                        # add a horizontal separator
-                        separator = Gtk.SeparatorMenuItem()
-                        menu.append(separator)
-
-                        menu_item_delete = Gtk.MenuItem(label=_("Delete File"))
-                        menu_item_delete.connect("activate", lambda item: self.delete_timeline_file(timeline_file_path))
-                        menu.append(menu_item_delete)
-
-                        menu.show_all()
-                        menu.popup_at_pointer(event)
-
-                new_file_element_event_box.connect("button-press-event", on_file_double_click)
-
-                inserted = False
-                for i, existing_file_element in enumerate(self.timeline_file_list_widget.get_children()):
-                    existing_label = existing_file_element.get_child().get_child().get_children()[1]
-                    if timeline_file < existing_label.get_text():
-                        self.timeline_file_list_widget.insert(new_file_element_event_box, i)
-                        inserted = True
-                        break
-                if not inserted:
-                    self.timeline_file_list_widget.add(new_file_element_event_box)
-
-        self.timeline_file_list_widget.show_all()
+        self.timeline_file_grid.watch_folder(
+            timeline_files_folder,
+            lambda f: f.endswith(".thumbnail") or f.startswith("_"),
+        )
+
+    def show_timeline_file_menu(self, timeline_file_path, event):
+        extension_with_dot = os.path.splitext(timeline_file_path)[1].lower()
+
+        menu = Gtk.Menu()
+        menu_item_open = Gtk.MenuItem(label=_("Open File"))
+        menu_item_open.connect("activate", lambda item: open_file_with_default_app(timeline_file_path))
+        menu.append(menu_item_open)
+
+        menu_item_save_as = Gtk.MenuItem(label=_("Save File As..."))
+        menu_item_save_as.connect("activate", lambda item: self.save_file_as(timeline_file_path))
+        menu.append(menu_item_save_as)
+
+        if extension_with_dot in SUPPORTED_GIMP_OPENABLE_IMAGE_EXTENSIONS:
+            # NOTE does not work due to GIMP not setting the overwrite path correctly
+            #menu_item_open_gimp = Gtk.MenuItem(label="Open in GIMP")
+            #menu_item_open_gimp.connect("activate", lambda item: self.open_timeline_file_as_image(timeline_file_path))
+            #menu.append(menu_item_open_gimp)
+
+            menu_item_overwrite = Gtk.MenuItem(label=_("Overwrite with Reference Image"))
+            menu_item_overwrite.connect("activate", lambda item: self.overwrite_timeline_file_with_reference_image(timeline_file_path))
+            menu.append(menu_item_overwrite)
+
+            menu_item_import = Gtk.MenuItem(label=_("Import as project XCF image"))
+            menu_item_import.connect("activate", lambda item: self.on_import_file(timeline_file_path))
+            menu.append(menu_item_import)
+
+        if extension_with_dot in SUPPORTED_VIDEO_EXTENSIONS:
+            menu_item_extract_frames = Gtk.MenuItem(label=_("Open in Frame by Frame Viewer"))
+            menu_item_extract_frames.connect("activate", lambda item: self.open_frame_by_frame_viewer(timeline_file_path))
+            menu.append(menu_item_extract_frames)
+
+        menu_item_add_to_project = Gtk.MenuItem(label=_("Add to Project Files"))
+        menu_item_add_to_project.connect("activate", lambda item: self.add_timeline_file_to_project(timeline_file_path))
+        menu.append(menu_item_add_to_project)
+
+        # add a horizontal separator
+        separator = Gtk.SeparatorMenuItem()
+        menu.append(separator)
+
+        menu_item_delete = Gtk.MenuItem(label=_("Delete File"))
+        menu_item_delete.connect("activate", lambda item: self.delete_timeline_file(timeline_file_path))
+        menu.append(menu_item_delete)
+
+        menu.show_all()
+        menu.popup_at_pointer(event)
 
     def rename_timeline(self, timeline_id):
         timeline_in_question = self.project_file_contents.get("timelines", {}).get(timeline_id, None)
@@ -625,25 +677,78 @@ class ProjectDialog(Gtk.Dialog):
 
         GTK_BUG_WORKAROUND = self.project_file_contents # workaround for GTK messing up with the data in the project file contents
 
-        # delete from the tree store
-        if keep_children:
-            # still delete the children due to bugs in GTK we need to rebuild the entire timeline tree UI
-            # delete everything in timeline_tree_store and rebuild from scratch
-            self.timeline_tree_store.clear()
-        else:
-            # we need to delete all children from the tree store as well
-            # we delete everything because GTK is a bit buggy with tree stores
-            self.timeline_tree_store.clear()
+        # the rows of the deleted timelines are removed from the tree store, and the children
+        # kept are moved, by the rebuild that follows the project update
 
-        # delete the timeline directory and all its contents
+        # move the timeline directory to the trash, it is purged in the background
         timeline_folder = os.path.join(self.project_folder, "timelines", timeline_id)
+        blob_store = self.tools_object.get_project_blob_store()
         if os.path.exists(timeline_folder) and os.path.isdir(timeline_folder):
-            rmtree(timeline_folder)
+            blob_store.move_to_trash(timeline_folder)
+
+        try:
+            get_provenance_index(self.project_folder).remove_timeline(timeline_id)
+        except Exception as e:
+            print("Error removing timeline from the provenance index:", e)
+
+        if is_root_call:
+            # purging also frees the files that only the deleted timelines had
+            blob_store.collect_garbage_in_background()
 
         self.project_file_contents = GTK_BUG_WORKAROUND
 
         return deleted_current_timeline
 
+    def on_menu_disk_usage(self, menu_item):
+        usage = get_blob_store(self.project_folder).get_disk_usage(os.path.join(self.project_folder, "timelines"))
+        timelines = self.project_file_contents.get("timelines", {})
+
+        dialog = Gtk.Dialog(title=_("Disk Usage"), parent=self, flags=0)
+        dialog.set_keep_above(True)
+        dialog.set_default_size(500, 400)
+        content_area = dialog.get_content_area()
+        content_area.set_spacing(10)
+        content_area.set_border_width(10)
+
+        # name, files, size, own size, and the raw own size to sort by
+        store = Gtk.ListStore(str, int, str, str, GObject.TYPE_INT64)
+        for timeline_id, timeline_usage in usage.items():
+            if timeline_id is None:
+                continue
+            name = timelines.get(timeline_id, {}).get("name", None) or _("Unknown timeline {}").format(timeline_id)
+            store.append([
+                name,
+                timeline_usage["files"],
+                GLib.format_size(timeline_usage["size"]),
+                GLib.format_size(timeline_usage["own_size"]),
+                timeline_usage["own_size"],
+            ])
+        store.set_sort_column_id(4, Gtk.SortType.DESCENDING)
+
+        tree_view = Gtk.TreeView(model=store)
+        for index, title in enumerate([_("Timeline"), _("Files"), _("Size"), _("Only in this timeline")]):
+            column = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=index)
+            column.set_resizable(True)
+            tree_view.append_column(column)
+
+        scrolled_window = Gtk.ScrolledWindow()
+        scrolled_window.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.AUTOMATIC)
+        scrolled_window.add(tree_view)
+        content_area.pack_start(scrolled_window, True, True, 0)
+
+        totals = usage[None]
+        content_area.pack_start(Gtk.Label(label=_("Deleting a timeline frees the size that is only in that timeline, the rest is shared with other timelines.")), False, False, 0)
+        content_area.pack_start(Gtk.Label(label=_("All timelines use {} on disk, the blob store holds {} files ({})").format(
+            GLib.format_size(totals["own_size"]),
+            totals["files"],
+            GLib.format_size(totals["size"]),
+        )), False, False, 0)
+
+        dialog.add_button(Gtk.STOCK_CLOSE, Gtk.ResponseType.CLOSE)
+        dialog.show_all()
+        dialog.run()
+        dialog.destroy()
+
     def delete_timeline(self, timeline_id, keep_children=False):
         timeline_in_question = self.project_file_contents.get("timelines", {}).get(timeline_id, None)
         if timeline_in_question is None:
@@ -700,6 +805,8 @@ class ProjectDialog(Gtk.Dialog):
                 gimp_image = Gimp.Image.get_by_id(id_of_image)
                 if gimp_image is None:
                     raise ValueError(_("Failed to get the selected image"))
+                # the file may be shared with other timelines, GIMP writes hardlinked files in place
+                break_hardlink(timeline_file, keep_contents=False)
                 gfile = Gio.File.new_for_path(timeline_file)
                 Gimp.file_save(Gimp.RunMode.INTERACTIVE, gimp_image, gfile, None)
 
@@ -741,11 +848,7 @@ class ProjectDialog(Gtk.Dialog):
             if os.path.exists(thumbnail_path):
                 os.remove(thumbnail_path)
             
-            for i, existing_file_element in enumerate(self.timeline_file_list_widget.get_children()):
-                existing_label = existing_file_element.get_child().get_child().get_children()[1]
-                if os.path.basename(timeline_file) == existing_label.get_text():
-                    self.timeline_file_list_widget.remove(existing_file_element)
-                    break
+            self.timeline_file_grid.remove(os.path.basename(timeline_file))
 
         except Exception as e:
             error_dialog = Gtk.MessageDialog(parent=self, flags=0, message_type=Gtk.MessageType.ERROR,
@@ -806,11 +909,7 @@ class ProjectDialog(Gtk.Dialog):
                                 os.rename(old_thumbnail_path, new_thumbnail_path)
 
                             # update the project file list UI
-                            for existing_file_element in self.project_files_list_widget.get_children():
-                                existing_label = existing_file_element.get_child().get_child().get_children()[1]
-                                if os.path.basename(project_file) == existing_label.get_text():
-                                    existing_label.set_text(new_name)
-                                    break
+                            self.project_file_grid.rename(os.path.basename(project_file), new_name, new_path)
 
                         except Exception as e:
                             error_dialog = Gtk.MessageDialog(parent=self, flags=0, message_type=Gtk.MessageType.ERROR,
@@ -857,11 +956,7 @@ class ProjectDialog(Gtk.Dialog):
             if os.path.exists(thumbnail_path):
                 os.remove(thumbnail_path)
             
-            for i, existing_file_element in enumerate(self.project_files_list_widget.get_children()):
-                existing_label = existing_file_element.get_child().get_child().get_children()[1]
-                if os.path.basename(project_file) == existing_label.get_text():
-                    self.project_files_list_widget.remove(existing_file_element)
-                    break
+            self.project_file_grid.remove(os.path.basename(project_file))
 
         except Exception as e:
             error_dialog = Gtk.MessageDialog(parent=self, flags=0, message_type=Gtk.MessageType.ERROR,
@@ -1169,15 +1264,8 @@ class ProjectDialog(Gtk.Dialog):
             error_dialog.destroy()
 
     def update_project_file_list(self, update_specifically=None):
-        # first we are going to list all project files in the custom project file folder
-        project_files_in_folder = [
-            f for f in os.listdir(self.custom_project_file_folder)
-            if os.path.isfile(os.path.join(self.custom_project_file_folder, f)) and
-            not f.endswith(".thumbnail")
-        ]
-        project_files = project_files_in_folder if update_specifically is None else [os.path.basename(f) for f in update_specifically]
-        # then we will create a Gtk FlowBox to show them with thumbnails if available
-        if not hasattr(self, 'project_files_list_widget'):
+        # then we will create a grid to show them with thumbnails if available
+        if not hasattr(self, 'project_file_grid'):
             project_file_label = Gtk.Label(label=_("Project Files:"))
             project_file_label.set_margin_bottom(10)
             project_file_label.set_margin_top(20)
@@ -1186,157 +1274,80 @@ class ProjectDialog(Gtk.Dialog):
             self.internal_box.pack_start(Gtk.Separator(orientation=Gtk.Orientation.HORIZONTAL), False, False, 0)
             self.internal_box.pack_start(project_file_label, False, False, 0)
 
-            self.project_files_list_widget = Gtk.FlowBox()
-            #ensure max width is only 600 pixels
-            self.project_files_list_widget.set_column_spacing(10)
-            self.project_files_list_widget.set_row_spacing(10)
+            self.project_file_grid = FileGrid(
+                self.get_file_thumbnail,
+                get_file_placeholder_thumbnail,
+                self.on_project_file_activated,
+                self.show_project_file_menu,
+            )
+            self.internal_box.pack_start(self.project_file_grid.widget, True, True, 0)
+            update_specifically = None
+
+        if update_specifically is None:
+            # we are going to list all project files in the custom project file folder, and
+            # keep watching it for changes
+            self.project_file_grid.watch_folder(
+                self.custom_project_file_folder,
+                lambda f: f.endswith(".thumbnail"),
+            )
+        else:
+            for project_file in update_specifically:
+                self.project_file_grid.add_or_update(
+                    os.path.basename(project_file),
+                    os.path.join(self.custom_project_file_folder, os.path.basename(project_file)),
+                )
 
-            self.internal_box.pack_start(self.project_files_list_widget, True, True, 0)
-            project_files = project_files_in_folder
+    def on_project_file_activated(self, file_path):
+        if file_path.endswith(".xcf"):
+            # open the xcf file in GIMP
+            self.open_xcf_file(file_path)
+        else:
+            open_file_with_default_app(file_path)
+
+    def show_project_file_menu(self, file_path, event):
+        extension_with_dot = os.path.splitext(file_path)[1].lower()
+        menu = Gtk.Menu()
+        if file_path.endswith(".xcf"):
+            open_file_menu_item = Gtk.MenuItem(label=_("Open XCF File"))
+            open_file_menu_item.connect("activate", lambda item: self.open_xcf_file(file_path))
+            menu.append(open_file_menu_item)
+        else:
+            menu_item_open = Gtk.MenuItem(label=_("Open File"))
+            menu_item_open.connect("activate", lambda item: open_file_with_default_app(file_path))
+            menu.append(menu_item_open)
+
+            if extension_with_dot in SUPPORTED_VIDEO_EXTENSIONS:
+                menu_item_open_in_viewer = Gtk.MenuItem(label=_("Open in Frame by Frame Viewer"))
+                menu_item_open_in_viewer.connect("activate", lambda item: self.open_frame_by_frame_viewer(file_path))
+                menu.append(menu_item_open_in_viewer)
 
-        global SUPPORTED_IMAGE_EXTENSIONS
-        global EXTENSIONS_THUMBNAILS
-        global EXTENSIONS_THUMBNAILS_CACHE
-        global UNKNOWN_THUMBNAIL
-        if UNKNOWN_THUMBNAIL is None:
-            # create an icon pixbuf for the unknown thumbnail
-            UNKNOWN_THUMBNAIL = Pixbuf.new_from_file_at_scale(
-                os.path.join(
-                    os.path.dirname(os.path.abspath(__file__)),
-                    "icons",
-                    "unknown.png"
-                ),
-                100,
-                100,
-                True
-            )
-        for project_file in project_files:
-            thumbnail_path = os.path.splitext(os.path.join(self.custom_project_file_folder, project_file))[0] + ".thumbnail"
-            thumbnail = UNKNOWN_THUMBNAIL
-            extension_with_dot = os.path.splitext(project_file)[1].lower()
             if extension_with_dot in SUPPORTED_IMAGE_EXTENSIONS:
-                thumbnail = Pixbuf.new_from_file_at_scale(os.path.join(self.custom_project_file_folder, project_file), 100, 100, True)
-            elif os.path.exists(thumbnail_path):
-                thumbnail = Pixbuf.new_from_file_at_scale(thumbnail_path, 100, 100, True)
-            elif extension_with_dot in EXTENSIONS_THUMBNAILS_CACHE:
-                thumbnail = EXTENSIONS_THUMBNAILS_CACHE[extension_with_dot]
-            elif extension_with_dot in EXTENSIONS_THUMBNAILS:
-                thumbnail = Pixbuf.new_from_file_at_scale(os.path.join(os.path.dirname(os.path.abspath(__file__)), "icons", EXTENSIONS_THUMBNAILS[extension_with_dot]), 100, 100, True)
-                EXTENSIONS_THUMBNAILS_CACHE[extension_with_dot] = thumbnail
-                
-            # first let's see if we already have this file in the list box
-            existing_file_element = None
-            for file_element in self.project_files_list_widget.get_children():
-                label = file_element.get_child().get_child().get_children()[1]
-                if label.get_text() == project_file:
-                    existing_file_element = file_element
-                    break
-            if existing_file_element is not None:
-                # If we found an existing file element, we can update it
-                existing_file_element.get_child().get_child().get_children()[0].set_from_pixbuf(thumbnail)
-            else:
-                # If not, we need to create a new row
-                # we need to be sure it is added in alphabetical order
-                new_file_element_event_box = Gtk.EventBox()
-                new_file_element = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
-                new_file_element.set_margin_top(10)
-                new_file_element.set_margin_bottom(10)
-                new_file_element.set_margin_start(10)
-                new_file_element.set_margin_end(10)
-                new_file_element.pack_start(Gtk.Image.new_from_pixbuf(thumbnail), False, False, 0)
-                new_file_element.pack_start(Gtk.Label(label=project_file), False, False, 0)
-                new_file_element_event_box.add(new_file_element)
-
-                inserted = False
-                for i, existing_file_element in enumerate(self.project_files_list_widget.get_children()):
-                    existing_label = existing_file_element.get_child().get_child().get_children()[1]
-                    if project_file < existing_label.get_text():
-                        self.project_files_list_widget.insert(new_file_element_event_box, i)
-                        inserted = True
-                        break
-                if not inserted:
-                    self.project_files_list_widget.add(new_file_element_event_box)
-
-                if project_file.endswith(".xcf"):
-                    # add an event on double click to open the xcf file in GIMP
-                    def on_xcf_file_double_click(widget, event, xcf_file=os.path.join(self.custom_project_file_folder, project_file)):
-                        if event.type == Gdk.EventType._2BUTTON_PRESS and event.button == Gdk.BUTTON_PRIMARY:
-                            self.open_xcf_file(xcf_file)
-                        elif event.type == Gdk.EventType.BUTTON_PRESS and event.button == Gdk.BUTTON_SECONDARY:
-                            # set the flowbox selection to this item
-                            self.project_files_list_widget.select_child(widget.get_parent())
-                            # Right-click detected, show context menu
-                            menu = Gtk.Menu()
-
-                            open_file_menu_item = Gtk.MenuItem(label=_("Open XCF File"))
-                            open_file_menu_item.connect("activate", lambda item: self.open_xcf_file(xcf_file))
-                            menu.append(open_file_menu_item)
-
-                            # add a horizontal separator
-                            separator = Gtk.SeparatorMenuItem()
-                            menu.append(separator)
-
-                            rename_file_menu_item = Gtk.MenuItem(label=_("Rename File"))
-                            rename_file_menu_item.connect("activate", lambda item: self.rename_project_file(xcf_file))
-                            menu.append(rename_file_menu_item)
-
-                            # add a horizontal separator
-                            separator = Gtk.SeparatorMenuItem()
-                            menu.append(separator)
-
-                            menu_item_delete = Gtk.MenuItem(label=_("Delete XCF File"))
-                            menu_item_delete.connect("activate", lambda item: self.delete_project_file(xcf_file))
-                            menu.append(menu_item_delete)
-                            menu.show_all()
-                            menu.popup_at_pointer(event)
-
-                    new_file_element_event_box.connect("button-press-event", on_xcf_file_double_click)
-                else:
-                    def on_other_file_double_click(widget, event, file_path=os.path.join(self.custom_project_file_folder, project_file)):
-                        extension_with_dot = os.path.splitext(file_path)[1].lower()
-                        if event.type == Gdk.EventType._2BUTTON_PRESS and event.button == Gdk.BUTTON_PRIMARY:
-                            open_file_with_default_app(file_path)
-                        elif event.type == Gdk.EventType.BUTTON_PRESS and event.button == Gdk.BUTTON_SECONDARY:
-                            # set the flowbox selection to this item
-                            self.project_files_list_widget.select_child(widget.get_parent())
-                            # Right-click detected, show context menu
-                            menu = Gtk.Menu()
-                            menu_item_open = Gtk.MenuItem(label=_("Open File"))
-                            menu_item_open.connect("activate", lambda item: open_file_with_default_app(file_path))
-                            menu.append(menu_item_open)
-                            
-                            if extension_with_dot in SUPPORTED_VIDEO_EXTENSIONS:
-                                menu_item_open_in_viewer = Gtk.MenuItem(label=_("Open in Frame by Frame Viewer"))
-                                menu_item_open_in_viewer.connect("activate", lambda item: self.open_frame_by_frame_viewer(file_path))
-                                menu.append(menu_item_open_in_viewer)
-
-                            if extension_with_dot in SUPPORTED_IMAGE_EXTENSIONS:
-                                menu_item_import_as_xcf = Gtk.MenuItem(label=_("Create XCF Project File From this"))
-                                menu_item_import_as_xcf.connect("activate", lambda item: self.on_import_file(file_path))
-                                menu.append(menu_item_import_as_xcf)
-
-                            # add a horizontal separator
-                            separator = Gtk.SeparatorMenuItem()
-                            menu.append(separator)
-
-                            rename_file_menu_item = Gtk.MenuItem(label=_("Rename File"))
-                            rename_file_menu_item.connect("activate", lambda item: self.rename_project_file(file_path))
-                            menu.append(rename_file_menu_item)
-
-                            # add a horizontal separator
-                            separator = Gtk.SeparatorMenuItem()
-                            menu.append(separator)
-
-                            menu_item_delete = Gtk.MenuItem(label=_("Delete File"))
-                            menu_item_delete.connect("activate", lambda item: self.delete_project_file(file_path))
-                            menu.append(menu_item_delete)
-                            menu.show_all()
-                            menu.popup_at_pointer(event)
-                    new_file_element_event_box.connect("button-press-event", on_other_file_double_click)
-
-        self.project_files_list_widget.show_all()
+                menu_item_import_as_xcf = Gtk.MenuItem(label=_("Create XCF Project File From this"))
+                menu_item_import_as_xcf.connect("activate", lambda item: self.on_import_file(file_path))
+                menu.append(menu_item_import_as_xcf)
+
+        # add a horizontal separator
+        separator = Gtk.SeparatorMenuItem()
+        menu.append(separator)
+
+        rename_file_menu_item = Gtk.MenuItem(label=_("Rename File"))
+        rename_file_menu_item.connect("activate", lambda item: self.rename_project_file(file_path))
+        menu.append(rename_file_menu_item)
+
+        # add a horizontal separator
+        separator = Gtk.SeparatorMenuItem()
+        menu.append(separator)
+
+        menu_item_delete = Gtk.MenuItem(label=_("Delete XCF File") if file_path.endswith(".xcf") else _("Delete File"))
+        menu_item_delete.connect("activate", lambda item: self.delete_project_file(file_path))
+        menu.append(menu_item_delete)
+        menu.show_all()
+        menu.popup_at_pointer(event)
 
     def generate_preview_thumbnail_image(self, image):
+        # the file next to the xcf must show what is saved in it
+        if image.is_dirty():
+            return False
         xcf_file = image.get_xcf_file()
         if xcf_file is None:
             return False
@@ -1414,28 +1425,74 @@ class ProjectDialog(Gtk.Dialog):
 
         self.images_opened = valid_images
 
-    def update_timeline_thumbnail(self, timeline_file):
-        # check if the image extension is SUPPORTED_IMAGE_EXTENSIONS
-        extension_with_dot = os.path.splitext(timeline_file)[1].lower()
+    def get_file_thumbnail(self, file_path, on_ready):
+        """
+        Returns the thumbnail of a file if it is at hand, otherwise None and it is made in
+        the background and handed to on_ready, files without a thumbnail get the icon for
+        their kind
+        """
+        unsaved_thumbnail = self.unsaved_thumbnails.get(os.path.abspath(file_path), None)
+        if unsaved_thumbnail is not None:
+            return unsaved_thumbnail
+
+        extension_with_dot = os.path.splitext(file_path)[1].lower()
+        source_path = None
         if extension_with_dot in SUPPORTED_IMAGE_EXTENSIONS:
-            # now we need to update the timeline file image
-            # for that we need to build a pixbuf from the image
-            image_pixbuf = Pixbuf.new_from_file_at_scale(timeline_file, 100, 100, True)
-            if image_pixbuf is not None:
-                # now we need to find the corresponding timeline file element
-                # in our ui
-                for file_element in self.timeline_file_list_widget.get_children():
-                    label = file_element.get_child().get_child().get_children()[1]
-                    if label.get_text() == os.path.basename(timeline_file):
-                        file_element.get_child().get_child().get_children()[0].set_from_pixbuf(image_pixbuf)
-                        break
+            source_path = file_path
+        elif os.path.exists(os.path.splitext(file_path)[0] + ".thumbnail"):
+            source_path = os.path.splitext(file_path)[0] + ".thumbnail"
+
+        if source_path is None:
+            return get_placeholder_thumbnail(extension_with_dot)
+
+        thumbnail_cache = get_thumbnail_cache(self.project_folder)
+        thumbnail = thumbnail_cache.get_cached(source_path)
+        if thumbnail is not None:
+            return thumbnail
+
+        requested_key = get_thumbnail_key(source_path, thumbnail_cache.size)
+        def on_thumbnail_ready(source_path, pixbuf):
+            # the file may have changed again while this one was being made, then a newer
+            # request takes care of it
+            if pixbuf is None or get_thumbnail_key(source_path, thumbnail_cache.size) != requested_key:
+                return
+            on_ready(pixbuf)
+        thumbnail_cache.request(source_path, on_thumbnail_ready)
+        return None
+
+    def update_timeline_thumbnail(self, timeline_file):
+        # the file was just saved, so its thumbnail key changed and a new one is made
+        self.timeline_file_grid.reload(os.path.basename(timeline_file))
+
+    def get_image_revision(self, img):
+        """
+        Cheap token that changes whenever the saved file of a clean open image changes,
+        None when the image has to be looked at anyway
+        """
+        image = img["image"]
+        if image.is_dirty():
+            return None
+        file_path = img["file_path"]
+        if img["xcf"] is True and image.get_xcf_file() is not None:
+            file_path = image.get_xcf_file().get_path() or file_path
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return (file_path, stat.st_mtime_ns, stat.st_size)
 
     def refresh_non_dirty_images(self, widget=None, event=None):
         self.remove_invalid_images()
+        self.forget_unsaved_thumbnails(self.get_dirty_xcf_images())
         clean_images = [img for img in self.images_opened if not img["image"].is_dirty()]
         updated_xcf_files = []
         global SUPPORTED_IMAGE_EXTENSIONS
         for img in clean_images:
+            # the thumbnail was made from this very file already
+            revision = self.get_image_revision(img)
+            if revision is not None and revision == img.get("thumbnail_revision", None):
+                continue
+            img["thumbnail_revision"] = revision
             if img["xcf"] is not True:
                 self.update_timeline_thumbnail(img["file_path"])
                 continue
@@ -1445,6 +1502,41 @@ class ProjectDialog(Gtk.Dialog):
         if len(updated_xcf_files) > 0:
             self.update_project_file_list(updated_xcf_files)
 
+    def refresh_dirty_image_thumbnails(self):
+        if self.dirty_thumbnail_source is None:
+            return False
+        self.remove_invalid_images()
+        dirty_xcf_images = self.get_dirty_xcf_images()
+        self.forget_unsaved_thumbnails(dirty_xcf_images)
+        if len(dirty_xcf_images) == 0:
+            return True
+
+        # one image per tick so many open images do not stall the dialog
+        self.dirty_thumbnail_index = (self.dirty_thumbnail_index + 1) % len(dirty_xcf_images)
+        img = dirty_xcf_images[self.dirty_thumbnail_index]
+        # the grid now shows unsaved changes, so the thumbnail is looked at again once the
+        # image is clean even if the file did not change
+        img["thumbnail_revision"] = None
+        thumbnail_pixbuf = img["image"].get_thumbnail(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Gimp.PixbufTransparency.KEEP_ALPHA)
+        if thumbnail_pixbuf is not None:
+            xcf_file_path = os.path.abspath(img["image"].get_xcf_file().get_path())
+            self.unsaved_thumbnails[xcf_file_path] = thumbnail_pixbuf
+            self.update_project_file_list([xcf_file_path])
+        return True
+
+    def get_dirty_xcf_images(self):
+        return [
+            img for img in self.images_opened
+            if img["xcf"] is True and img["image"].is_dirty() and img["image"].get_xcf_file() is not None
+        ]
+
+    def forget_unsaved_thumbnails(self, dirty_xcf_images):
+        # images that were saved, reverted or closed go back to the thumbnail of their file
+        dirty_paths = set(os.path.abspath(img["image"].get_xcf_file().get_path()) for img in dirty_xcf_images)
+        for xcf_file_path in [path for path in self.unsaved_thumbnails.keys() if path not in dirty_paths]:
+            del self.unsaved_thumbnails[xcf_file_path]
+            self.update_project_file_list([xcf_file_path])
+
     def cleanup_opened_files(self):
         self.remove_invalid_images()
         for img in self.images_opened:
@@ -1496,6 +1588,20 @@ class ProjectDialog(Gtk.Dialog):
 
     def cleanup(self):
         if threading.current_thread() is threading.main_thread():
+            self.stop_background_updates()
             self.cleanup_opened_files()
         else:
-            GLib.idle_add(self.cleanup_opened_files)
\ No newline at end of file
+            GLib.idle_add(self.stop_background_updates)
+            GLib.idle_add(self.cleanup_opened_files)
+
+    def stop_background_updates(self, widget=None):
+        if self.dirty_thumbnail_source is not None:
+            GLib.source_remove(self.dirty_thumbnail_source)
+            self.dirty_thumbnail_source = None
+        if hasattr(self, 'timeline_file_grid'):
+            self.timeline_file_grid.stop_watching()
+        if hasattr(self, 'project_file_grid'):
+            self.project_file_grid.stop_watching()
+        if self.project_folder is not None:
+            release_thumbnail_cache(self.project_folder)
+        return False
\ No newline at end of file
@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+
+from gi.repository import GLib # type: ignore
+
+# the .aihubproj file is only rewritten once this many changes piled up in the journal,
+# every other change is a single line appended to it
+JOURNAL_COMPACT_EVERY = 64
+JOURNAL_EXTENSION = ".journal"
+
+def get_journal_path(project_file):
+	return project_file + JOURNAL_EXTENSION
+
+def fsync_folder(folder):
+	# makes the rename itself durable, not possible on windows
+	if os.name == "nt":
+		return
+	fd = os.open(folder, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+def write_json_atomic(filepath, contents):
+	"""
+	Writes the json to a temporary file next to the target, flushes it to disk and renames
+	it over the target, so a crash leaves either the old or the new file but never half of one
+	"""
+	folder = os.path.dirname(os.path.abspath(filepath))
+	temp_path = os.path.join(folder, "." + os.path.basename(filepath) + ".tmp")
+	with open(temp_path, "w") as f:
+		json.dump(contents, f, indent=4)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(temp_path, filepath)
+	fsync_folder(folder)
+
+def diff_project_contents(old_contents, new_contents):
+	"""
+	The change from one version of the project to the next as a journal entry, top level
+	keys and single timelines that changed are set, removed keys are listed in unset and
+	removed timelines are None
+	"""
+	entry = {"set": {}, "unset": [], "timelines": {}}
+	for key, value in new_contents.items():
+		if key != "timelines" and (key not in old_contents or old_contents[key] != value):
+			entry["set"][key] = value
+	for key in old_contents.keys():
+		if key != "timelines" and key not in new_contents:
+			entry["unset"].append(key)
+
+	old_timelines = old_contents.get("timelines", {})
+	new_timelines = new_contents.get("timelines", {})
+	for timeline_id, timeline in new_timelines.items():
+		if old_timelines.get(timeline_id, None) != timeline:
+			entry["timelines"][timeline_id] = timeline
+	for timeline_id in old_timelines.keys():
+		if timeline_id not in new_timelines:
+			entry["timelines"][timeline_id] = None
+
+	if len(entry["set"]) == 0 and len(entry["unset"]) == 0 and len(entry["timelines"]) == 0:
+		return None
+	return entry
+
+def apply_journal_entry(contents, entry):
+	# entries only set values, so applying one twice is harmless
+	for key, value in entry.get("set", {}).items():
+		contents[key] = value
+	for key in entry.get("unset", []):
+		contents.pop(key, None)
+	timelines = contents.setdefault("timelines", {})
+	for timeline_id, timeline in entry.get("timelines", {}).items():
+		if timeline is None:
+			timelines.pop(timeline_id, None)
+		else:
+			timelines[timeline_id] = timeline
+
+def load_project_file(project_file):
+	"""
+	Reads the project snapshot and replays its journal on top, returns the contents and
+	how many entries were replayed, a last line cut short by a crash is ignored
+	"""
+	with open(project_file, "r") as f:
+		contents = json.load(f)
+	if not isinstance(contents, dict):
+		return contents, 0
+
+	replayed = 0
+	journal_path = get_journal_path(project_file)
+	if os.path.exists(journal_path):
+		with open(journal_path, "r") as f:
+			for line in f:
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					print("Ignoring incomplete project journal entry")
+					break
+				apply_journal_entry(contents, entry)
+				replayed += 1
+	return contents, replayed
+
+class ProjectFileWriter:
+	"""
+	Persists the project contents, all the changes made within one main loop iteration are
+	written together as one line appended to the journal, and every JOURNAL_COMPACT_EVERY
+	lines the journal is folded into the .aihubproj file
+	"""
+	def __init__(self, project_file, contents, on_error=None):
+		self.project_file = project_file
+		self.journal_path = get_journal_path(project_file)
+		self.contents = contents
+		self.on_error = on_error
+		# what is on disk right now, to diff against
+		self.persisted = json.loads(json.dumps(contents))
+		self.journal_entries = 0
+		self.flush_scheduled = False
+		self.closed = False
+		self.lock = threading.Lock()
+
+	def schedule_write(self, contents=None):
+		with self.lock:
+			# the project contents dict is sometimes replaced instead of modified
+			if contents is not None:
+				self.contents = contents
+			if self.flush_scheduled:
+				return
+			self.flush_scheduled = True
+		GLib.idle_add(self.on_idle_flush)
+
+	def on_idle_flush(self):
+		try:
+			self.flush()
+		except Exception as e:
+			print("Error writing project file:", e)
+			if self.on_error is not None:
+				self.on_error(e)
+		return False
+
+	def flush(self):
+		with self.lock:
+			self.flush_scheduled = False
+			if self.closed:
+				return
+			current = json.loads(json.dumps(self.contents))
+			entry = diff_project_contents(self.persisted, current)
+			if entry is None:
+				return
+			with open(self.journal_path, "a") as f:
+				f.write(json.dumps(entry) + "\n")
+				f.flush()
+				os.fsync(f.fileno())
+			self.persisted = current
+			self.journal_entries += 1
+			if self.journal_entries >= JOURNAL_COMPACT_EVERY:
+				self.compact_locked()
+
+	def compact(self):
+		with self.lock:
+			self.compact_locked()
+
+	def compact_locked(self):
+		# the snapshot goes first, if we crash before the journal is removed replaying
+		# it again on top of the new snapshot changes nothing
+		write_json_atomic(self.project_file, self.persisted)
+		if os.path.exists(self.journal_path):
+			os.remove(self.journal_path)
+		self.journal_entries = 0
+
+	def close(self):
+		"""
+		Writes whatever is pending and folds the journal into the snapshot
+		"""
+		self.flush()
+		with self.lock:
+			if not self.closed:
+				self.compact_locked()
+			self.closed = True
@@ -0,0 +1,461 @@
+import errno
+import hashlib
+import os
+import shutil
+import stat
+import threading
+import uuid
+
+# fcntl only exists on unix, reflinks are skipped elsewhere
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+# ioctl from linux/fs.h that makes the destination share the extents of the source,
+# supported by btrfs, xfs, bcachefs and a few others
+FICLONE = 0x40049409
+
+# how a branched timeline gets the files of its parent
+# auto: reflink, then hardlink, then copy
+# reflink: reflink, then copy
+# copy: always a full copy, like before
+BRANCH_METHODS = ["auto", "reflink", "copy"]
+DEFAULT_BRANCH_METHOD = "auto"
+
+# errors that mean the filesystem (or the pair of paths) can not do it, rather than a real failure
+UNSUPPORTED_ERRNOS = {
+	errno.EOPNOTSUPP,
+	errno.ENOTSUP,
+	errno.EXDEV,
+	errno.EINVAL,
+	errno.ENOTTY,
+	errno.ENOSYS,
+	errno.EPERM,
+	errno.EMLINK,
+}
+
+def reflink_file(source_path, destination_path):
+	"""
+	Makes the destination a copy on write clone of the source, returns False when the
+	filesystem does not support it, in which case nothing is left behind
+	"""
+	if fcntl is None:
+		return False
+	try:
+		with open(source_path, "rb") as source, open(destination_path, "wb") as destination:
+			fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+	except OSError as e:
+		if os.path.exists(destination_path):
+			os.remove(destination_path)
+		if e.errno in UNSUPPORTED_ERRNOS:
+			return False
+		raise e
+	shutil.copystat(source_path, destination_path)
+	return True
+
+def hardlink_file(source_path, destination_path):
+	try:
+		os.link(source_path, destination_path)
+	except OSError as e:
+		if e.errno in UNSUPPORTED_ERRNOS:
+			return False
+		raise e
+	return True
+
+def clone_tree_cow(source_folder, destination_folder, method=DEFAULT_BRANCH_METHOD):
+	"""
+	Copies a folder like shutil.copytree(dirs_exist_ok=True) but every file is a reflink or a
+	hardlink of the original when possible, so the cost depends on the amount of files and
+	not on their size
+
+	Hardlinked files share their contents (and their read only mode) with the source, whoever
+	writes one of them in place has to call break_hardlink first, returns how many files were
+	cloned with each method
+	"""
+	counts = {"reflink": 0, "hardlink": 0, "copy": 0}
+	# once a method fails for a file it is going to fail for the rest of the tree too
+	try_reflink = method in ("auto", "reflink")
+	try_hardlink = method == "auto"
+
+	for current_folder, folders, files in os.walk(source_folder):
+		relative_folder = os.path.relpath(current_folder, source_folder)
+		target_folder = os.path.normpath(os.path.join(destination_folder, relative_folder))
+		os.makedirs(target_folder, exist_ok=True)
+		shutil.copystat(current_folder, target_folder)
+
+		for filename in files:
+			source_path = os.path.join(current_folder, filename)
+			destination_path = os.path.join(target_folder, filename)
+			if os.path.lexists(destination_path):
+				os.remove(destination_path)
+
+			if os.path.islink(source_path):
+				os.symlink(os.readlink(source_path), destination_path)
+				counts["copy"] += 1
+				continue
+
+			if try_reflink:
+				if reflink_file(source_path, destination_path):
+					counts["reflink"] += 1
+					continue
+				try_reflink = False
+
+			if try_hardlink:
+				if hardlink_file(source_path, destination_path):
+					counts["hardlink"] += 1
+					continue
+				try_hardlink = False
+
+			shutil.copy2(source_path, destination_path)
+			counts["copy"] += 1
+
+	return counts
+
+# blobs (and so every timeline file linked to them) are read only, programs that write
+# files in place would otherwise change every timeline that shares the blob
+READ_ONLY_MODE = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+def make_read_only(path):
+	os.chmod(path, READ_ONLY_MODE)
+
+def make_writable(path):
+	mode = stat.S_IMODE(os.stat(path).st_mode)
+	if not mode & stat.S_IWUSR:
+		os.chmod(path, mode | stat.S_IWUSR)
+
+def remove_file(path):
+	# windows refuses to remove read only files
+	try:
+		os.remove(path)
+	except PermissionError:
+		make_writable(path)
+		os.remove(path)
+
+def is_hardlinked(path):
+	try:
+		return os.stat(path).st_nlink > 1
+	except FileNotFoundError:
+		return False
+
+def break_hardlink(path, keep_contents=True):
+	"""
+	Makes the file at path its own and writable before it gets written in place, so the
+	other timelines that share it keep their version, returns True if the file was shared,
+	it has to be called before handing the path to anything that may write to it
+
+	Set keep_contents to False when the file is about to be fully overwritten, then the
+	link is simply removed instead of copying data that is going to be thrown away
+	"""
+	if not is_hardlinked(path):
+		# a timeline file whose blob was collected is still read only
+		if os.path.isfile(path):
+			make_writable(path)
+		return False
+
+	if not keep_contents:
+		remove_file(path)
+		return True
+
+	folder, filename = os.path.split(path)
+	temp_path = os.path.join(folder, f".{filename}.{uuid.uuid4().hex}.tmp")
+	try:
+		shutil.copy2(path, temp_path)
+		make_writable(temp_path)
+		os.replace(temp_path, path)
+	except Exception as e:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		raise e
+	return True
+
+# files of every timeline are hardlinks into <project>_files/blobs, named after the sha256
+# of their contents, so the same output is only stored once no matter how many timelines
+# have it, a blob that is only linked from the store itself is not used anymore, blobs
+# are read only and break_hardlink makes a timeline file its own before it is written
+BLOB_FOLDER_NAME = "blobs"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# deleted timelines are renamed in here right away and purged in the background, whatever
+# is left when the project is closed gets purged the next time it is opened
+TRASH_FOLDER_NAME = ".trash"
+# how often the purge reports its progress
+PURGE_PROGRESS_EVERY_FILES = 200
+
+def hash_file(path):
+	sha256 = hashlib.sha256()
+	with open(path, "rb") as f:
+		while True:
+			chunk = f.read(HASH_CHUNK_SIZE)
+			if not chunk:
+				break
+			sha256.update(chunk)
+	return sha256.hexdigest()
+
+def replace_with_link(source_path, destination_path):
+	# the link is made next to the destination first so the destination is never missing
+	folder, filename = os.path.split(destination_path)
+	temp_path = os.path.join(folder, f".{filename}.{uuid.uuid4().hex}.tmp")
+	os.link(source_path, temp_path)
+	try:
+		os.replace(temp_path, destination_path)
+	except Exception as e:
+		os.remove(temp_path)
+		raise e
+
+class BlobStore:
+	"""
+	Content addressed store shared by all the timelines of a project, the timelines keep
+	hardlinks to the blobs so for everything else they are still plain files
+	"""
+	def __init__(self, project_folder):
+		self.project_folder = project_folder
+		self.folder = os.path.join(project_folder, BLOB_FOLDER_NAME)
+		# linking a blob and collecting it must not happen at the same time
+		self.lock = threading.Lock()
+		self.trash_folder = os.path.join(project_folder, TRASH_FOLDER_NAME)
+		self.gc_thread = None
+		self.gc_pending = None
+		# called from the background thread with (purged files, total files) while purging the trash
+		self.on_purge_progress = None
+
+	def get_blob_path(self, digest):
+		return os.path.join(self.folder, digest[:2], digest)
+
+	def put_bytes(self, data):
+		"""
+		Stores the data if it is not stored yet and returns the path of its blob, the caller
+		has to hold the lock until the blob is linked somewhere
+		"""
+		blob_path = self.get_blob_path(hashlib.sha256(data).hexdigest())
+		if not os.path.exists(blob_path):
+			os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+			temp_path = f"{blob_path}.{uuid.uuid4().hex}.tmp"
+			with open(temp_path, "wb") as f:
+				f.write(data)
+			make_read_only(temp_path)
+			os.replace(temp_path, blob_path)
+		return blob_path
+
+	def write_bytes(self, filepath, data):
+		"""
+		Writes the data at filepath as a link to its blob, an existing file there is unlinked
+		first so the other timelines that share it are not affected
+		"""
+		with self.lock:
+			try:
+				blob_path = self.put_bytes(data)
+				replace_with_link(blob_path, filepath)
+				return filepath
+			except OSError as e:
+				if e.errno not in UNSUPPORTED_ERRNOS:
+					raise e
+		# the filesystem can not hardlink, keep a plain file
+		break_hardlink(filepath, keep_contents=False)
+		with open(filepath, "wb") as f:
+			f.write(data)
+		return filepath
+
+	def get_blob_inodes(self):
+		inodes = set()
+		if not os.path.isdir(self.folder):
+			return inodes
+		for current_folder, folders, files in os.walk(self.folder):
+			for filename in files:
+				file_stat = os.stat(os.path.join(current_folder, filename))
+				inodes.add((file_stat.st_dev, file_stat.st_ino))
+		return inodes
+
+	def adopt_tree(self, folder):
+		"""
+		Moves the files of the folder that are not in the store yet into it, duplicates
+		become links to the same blob, used for timelines made before the store existed
+		"""
+		blob_inodes = self.get_blob_inodes()
+		adopted = 0
+		for current_folder, folders, files in os.walk(folder):
+			for filename in files:
+				filepath = os.path.join(current_folder, filename)
+				if os.path.islink(filepath) or filename.endswith(".tmp"):
+					continue
+				file_stat = os.stat(filepath)
+				if (file_stat.st_dev, file_stat.st_ino) in blob_inodes:
+					continue
+				digest = hash_file(filepath)
+				blob_path = self.get_blob_path(digest)
+				try:
+					with self.lock:
+						if os.path.exists(blob_path):
+							replace_with_link(blob_path, filepath)
+						else:
+							os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+							os.link(filepath, blob_path)
+							make_read_only(blob_path)
+				except OSError as e:
+					if e.errno in UNSUPPORTED_ERRNOS:
+						return adopted
+					raise e
+				blob_stat = os.stat(blob_path)
+				blob_inodes.add((blob_stat.st_dev, blob_stat.st_ino))
+				adopted += 1
+		return adopted
+
+	def collect_garbage(self):
+		"""
+		Deletes the blobs that no timeline links to anymore, returns how many and their size
+		"""
+		removed_count = 0
+		removed_size = 0
+		if not os.path.isdir(self.folder):
+			return removed_count, removed_size
+		for current_folder, folders, files in os.walk(self.folder):
+			for filename in files:
+				blob_path = os.path.join(current_folder, filename)
+				with self.lock:
+					try:
+						blob_stat = os.stat(blob_path)
+						if blob_stat.st_nlink > 1 and not filename.endswith(".tmp"):
+							# blobs stored before they were made read only
+							if blob_stat.st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH):
+								make_read_only(blob_path)
+							continue
+						remove_file(blob_path)
+					except FileNotFoundError:
+						continue
+				removed_count += 1
+				removed_size += blob_stat.st_size
+		return removed_count, removed_size
+
+	def move_to_trash(self, folder):
+		"""
+		Deletes a folder by renaming it into the trash, which is instant no matter its size,
+		the caller still has to start the background collection to purge it
+		"""
+		if not os.path.exists(folder):
+			return None
+		os.makedirs(self.trash_folder, exist_ok=True)
+		trashed_folder = os.path.join(self.trash_folder, uuid.uuid4().hex)
+		try:
+			os.rename(folder, trashed_folder)
+		except OSError as e:
+			# can not be renamed (eg. open files on windows), delete it the slow way
+			print("Error moving folder to the trash, deleting it instead:", e)
+			shutil.rmtree(folder, ignore_errors=True)
+			return None
+		return trashed_folder
+
+	def purge_trash(self):
+		if not os.path.isdir(self.trash_folder):
+			return 0
+		total = 0
+		for current_folder, folders, files in os.walk(self.trash_folder):
+			total += len(files)
+
+		purged = 0
+		for current_folder, folders, files in os.walk(self.trash_folder, topdown=False):
+			for filename in files:
+				try:
+					remove_file(os.path.join(current_folder, filename))
+				except FileNotFoundError:
+					pass
+				purged += 1
+				if self.on_purge_progress is not None and purged % PURGE_PROGRESS_EVERY_FILES == 0:
+					self.on_purge_progress(purged, total)
+			if current_folder != self.trash_folder:
+				os.rmdir(current_folder)
+		if self.on_purge_progress is not None:
+			self.on_purge_progress(purged, total)
+		return purged
+
+	def collect_garbage_in_background(self, adopt_folder=None):
+		"""
+		Purges the trash and runs the garbage collection (and the adoption of the given
+		folder first) in a thread, if one is already running it runs once more when it is done
+		"""
+		with self.lock:
+			if self.gc_thread is not None and self.gc_thread.is_alive():
+				self.gc_pending = adopt_folder or self.gc_pending or ""
+				return
+			self.gc_pending = None
+
+			def run(adopt_folder):
+				while True:
+					try:
+						# the trash goes first, the blobs it links to are only unused once it is gone
+						self.purge_trash()
+						if adopt_folder:
+							self.adopt_tree(adopt_folder)
+						self.collect_garbage()
+					except Exception as e:
+						print("Error collecting unused project blobs:", e)
+					with self.lock:
+						if self.gc_pending is None:
+							self.gc_thread = None
+							return
+						adopt_folder = self.gc_pending
+						self.gc_pending = None
+
+			self.gc_thread = threading.Thread(target=run, args=(adopt_folder,), daemon=True)
+			self.gc_thread.start()
+
+	def get_disk_usage(self, timelines_folder):
+		"""
+		Returns for every timeline folder its amount of files, their size and how much of
+		it is only in that timeline, which is what deleting it would free, plus the totals
+		of the store under the None key
+		"""
+		usage = {}
+		inode_timelines = {}
+		inode_sizes = {}
+		if os.path.isdir(timelines_folder):
+			for timeline_id in os.listdir(timelines_folder):
+				timeline_folder = os.path.join(timelines_folder, timeline_id)
+				if not os.path.isdir(timeline_folder):
+					continue
+				timeline_usage = {"files": 0, "size": 0, "own_size": 0}
+				usage[timeline_id] = timeline_usage
+				for current_folder, folders, files in os.walk(timeline_folder):
+					for filename in files:
+						try:
+							file_stat = os.stat(os.path.join(current_folder, filename))
+						except FileNotFoundError:
+							continue
+						inode = (file_stat.st_dev, file_stat.st_ino)
+						timeline_usage["files"] += 1
+						timeline_usage["size"] += file_stat.st_size
+						inode_timelines.setdefault(inode, set()).add(timeline_id)
+						inode_sizes[inode] = file_stat.st_size
+
+		for inode, timeline_ids in inode_timelines.items():
+			if len(timeline_ids) == 1:
+				usage[next(iter(timeline_ids))]["own_size"] += inode_sizes[inode]
+
+		blobs_size = 0
+		blobs_count = 0
+		if os.path.isdir(self.folder):
+			for current_folder, folders, files in os.walk(self.folder):
+				for filename in files:
+					blobs_count += 1
+					blobs_size += os.stat(os.path.join(current_folder, filename)).st_size
+		usage[None] = {
+			"files": blobs_count,
+			"size": blobs_size,
+			# what is actually on disk for the timelines, every inode counted once
+			"own_size": sum(inode_sizes.values()),
+		}
+		return usage
+
+# one store per project folder, so every user of the same project shares the lock
+BLOB_STORES = {}
+
+def get_blob_store(project_folder):
+	project_folder = os.path.abspath(project_folder)
+	store = BLOB_STORES.get(project_folder, None)
+	if store is None:
+		store = BlobStore(project_folder)
+		BLOB_STORES[project_folder] = store
+	return store
+
+def get_blob_store_for_timeline(timeline_path):
+	# timelines live in <project>_files/timelines/<id>
+	return get_blob_store(os.path.dirname(os.path.dirname(os.path.abspath(timeline_path))))
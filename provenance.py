@@ -0,0 +1,332 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# every file received for a project is recorded here with the run that made it, so it
+# can be found again by its workflow, its values or the words in them
+PROVENANCE_DB_NAME = "provenance.sqlite"
+PROVENANCE_SCHEMA_VERSION = 1
+DEFAULT_SEARCH_LIMIT = 200
+
+# values longer than this (eg. base64 data) are not worth indexing
+MAX_INDEXED_VALUE_LENGTH = 2000
+TERM_PATTERN = re.compile(r"[^\W_]+", re.UNICODE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+	id INTEGER PRIMARY KEY,
+	run_uid TEXT UNIQUE NOT NULL,
+	run_id TEXT,
+	workflow_id TEXT,
+	timeline_id TEXT,
+	submitted_at REAL,
+	started_at REAL,
+	values_json TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+	id INTEGER PRIMARY KEY,
+	run INTEGER REFERENCES runs(id),
+	path TEXT NOT NULL,
+	file_name TEXT COLLATE NOCASE,
+	sha256 TEXT,
+	size INTEGER,
+	timeline_id TEXT,
+	received_at REAL
+);
+CREATE TABLE IF NOT EXISTS run_values (
+	run INTEGER REFERENCES runs(id),
+	expose_id TEXT COLLATE NOCASE,
+	-- last part of the dotted expose_id, so "seed=1" finds "sampler.seed"
+	name TEXT COLLATE NOCASE,
+	value TEXT COLLATE NOCASE
+);
+CREATE TABLE IF NOT EXISTS run_terms (
+	run INTEGER REFERENCES runs(id),
+	term TEXT COLLATE NOCASE
+);
+CREATE INDEX IF NOT EXISTS files_run ON files(run);
+CREATE INDEX IF NOT EXISTS files_path ON files(path);
+CREATE INDEX IF NOT EXISTS files_sha256 ON files(sha256);
+CREATE INDEX IF NOT EXISTS files_timeline ON files(timeline_id, received_at);
+CREATE INDEX IF NOT EXISTS files_file_name ON files(file_name);
+CREATE INDEX IF NOT EXISTS files_received_at ON files(received_at);
+CREATE INDEX IF NOT EXISTS runs_workflow ON runs(workflow_id);
+CREATE INDEX IF NOT EXISTS run_values_expose_id ON run_values(expose_id, value);
+CREATE INDEX IF NOT EXISTS run_values_name ON run_values(name, value);
+CREATE INDEX IF NOT EXISTS run_values_run ON run_values(run);
+CREATE INDEX IF NOT EXISTS run_terms_term ON run_terms(term);
+CREATE INDEX IF NOT EXISTS run_terms_run ON run_terms(run);
+"""
+
+def flatten_values(values, prefix=""):
+	"""
+	Turns the expose values of a run into (key, value) pairs of scalars, nested values
+	get dotted keys, eg. {"image": {"pos_x": 3}} becomes ("image.pos_x", "3")
+	"""
+	if isinstance(values, dict):
+		for key, value in values.items():
+			yield from flatten_values(value, f"{prefix}.{key}" if prefix else str(key))
+	elif isinstance(values, (list, tuple)):
+		for value in values:
+			yield from flatten_values(value, prefix)
+	elif values is not None:
+		if isinstance(values, bool):
+			value = "true" if values else "false"
+		elif isinstance(values, float) and values.is_integer():
+			value = str(int(values))
+		else:
+			value = str(values)
+		if len(value) <= MAX_INDEXED_VALUE_LENGTH:
+			yield prefix, value
+
+def get_terms(text):
+	return set(term.lower() for term in TERM_PATTERN.findall(text))
+
+def escape_like(text):
+	return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def parse_search_query(query):
+	"""
+	Splits the query in key=value filters (exact, the key may be the last part of a dotted key)
+	and free words that have to be the start of a word in the values, the file name or
+	the workflow
+	"""
+	filters = []
+	words = []
+	for token in query.split():
+		if "=" in token:
+			key, _, value = token.partition("=")
+			if key and value:
+				filters.append((key, value))
+				continue
+		words.extend(get_terms(token))
+	return filters, words
+
+class ProvenanceIndex:
+	def __init__(self, project_folder):
+		self.project_folder = project_folder
+		self.path = os.path.join(project_folder, PROVENANCE_DB_NAME)
+		# files arrive on the websocket thread and searches come from the GTK thread
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(self.path, check_same_thread=False)
+		self.connection.row_factory = sqlite3.Row
+		with self.lock:
+			self.connection.execute("PRAGMA journal_mode=WAL")
+			self.connection.execute("PRAGMA synchronous=NORMAL")
+			self.connection.executescript(SCHEMA)
+			self.connection.execute(f"PRAGMA user_version={PROVENANCE_SCHEMA_VERSION}")
+			self.connection.commit()
+
+	def get_relative_path(self, path):
+		# relative paths keep working when the project folder is moved
+		return os.path.relpath(os.path.abspath(path), os.path.abspath(self.project_folder))
+
+	def get_absolute_path(self, relative_path):
+		return os.path.normpath(os.path.join(self.project_folder, relative_path))
+
+	def get_run_row_id(self, provenance):
+		row = self.connection.execute("SELECT id, run_id FROM runs WHERE run_uid = ?", (provenance["run_uid"],)).fetchone()
+		if row is not None:
+			if row["run_id"] is None and provenance.get("run_id", None) is not None:
+				self.connection.execute("UPDATE runs SET run_id = ? WHERE id = ?", (provenance["run_id"], row["id"]))
+			return row["id"]
+
+		values = provenance.get("values", None) or {}
+		cursor = self.connection.execute(
+			"INSERT INTO runs (run_uid, run_id, workflow_id, timeline_id, submitted_at, started_at, values_json) VALUES (?, ?, ?, ?, ?, ?, ?)",
+			(
+				provenance["run_uid"],
+				provenance.get("run_id", None),
+				provenance.get("workflow_id", None),
+				provenance.get("timeline_id", None),
+				provenance.get("submitted_at", None),
+				provenance.get("started_at", None),
+				json.dumps(values, default=str),
+			),
+		)
+		run = cursor.lastrowid
+
+		pairs = list(flatten_values(values))
+		self.connection.executemany(
+			"INSERT INTO run_values (run, expose_id, name, value) VALUES (?, ?, ?, ?)",
+			[(run, key, key.rsplit(".", 1)[-1], value) for key, value in pairs],
+		)
+		terms = set()
+		for key, value in pairs:
+			terms.update(get_terms(value))
+		if provenance.get("workflow_id", None):
+			terms.update(get_terms(provenance["workflow_id"]))
+		self.connection.executemany("INSERT INTO run_terms (run, term) VALUES (?, ?)", [(run, term) for term in terms])
+		return run
+
+	def record_file(self, path, data, provenance):
+		"""
+		Records a file that was just written for a run, provenance holds the run_uid that
+		groups the files of one run plus its run_id, workflow_id, timeline_id, values and times
+		"""
+		relative_path = self.get_relative_path(path)
+		with self.lock:
+			# the file was written again (eg. a REPLACE), whatever was recorded for the path
+			# before describes content that is gone
+			previous_runs = set(
+				row["run"] for row in self.connection.execute("SELECT run FROM files WHERE path = ?", (relative_path,))
+			)
+			self.connection.execute("DELETE FROM files WHERE path = ?", (relative_path,))
+			run = self.get_run_row_id(provenance)
+			self.connection.execute(
+				"INSERT INTO files (run, path, file_name, sha256, size, timeline_id, received_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+				(
+					run,
+					relative_path,
+					os.path.basename(path),
+					hashlib.sha256(data).hexdigest(),
+					len(data),
+					provenance.get("timeline_id", None),
+					time.time(),
+				),
+			)
+			# only the runs that lost a file can have become orphans, sweeping the whole
+			# table for every file received gets slow on big projects
+			for previous_run in previous_runs - {run, None}:
+				self.remove_run_if_orphan(previous_run)
+			self.connection.commit()
+
+	def remove_run_if_orphan(self, run):
+		if self.connection.execute("SELECT 1 FROM files WHERE run = ? LIMIT 1", (run,)).fetchone() is not None:
+			return
+		self.connection.execute("DELETE FROM run_values WHERE run = ?", (run,))
+		self.connection.execute("DELETE FROM run_terms WHERE run = ?", (run,))
+		self.connection.execute("DELETE FROM runs WHERE id = ?", (run,))
+
+	def remove_orphan_runs(self):
+		# runs that have no files left are of no use
+		orphan_runs = "SELECT id FROM runs WHERE id NOT IN (SELECT DISTINCT run FROM files WHERE run IS NOT NULL)"
+		self.connection.execute(f"DELETE FROM run_values WHERE run IN ({orphan_runs})")
+		self.connection.execute(f"DELETE FROM run_terms WHERE run IN ({orphan_runs})")
+		self.connection.execute(f"DELETE FROM runs WHERE id IN ({orphan_runs})")
+
+	def find_inherited_path(self, relative_path, timeline_id, size):
+		"""
+		Branched timelines start with the files of their parent under the same relative
+		path, returns the relative path of a copy of the file in another timeline that is
+		still there (with the same size), or None
+		"""
+		parts = os.path.normpath(relative_path).split(os.sep)
+		if len(parts) < 3 or parts[0] != "timelines" or parts[1] != timeline_id:
+			return None
+		timelines_folder = os.path.join(self.project_folder, "timelines")
+		try:
+			other_timeline_ids = sorted(os.listdir(timelines_folder))
+		except OSError:
+			return None
+		for other_timeline_id in other_timeline_ids:
+			if other_timeline_id == timeline_id:
+				continue
+			candidate = os.path.join("timelines", other_timeline_id, *parts[2:])
+			try:
+				if os.path.getsize(self.get_absolute_path(candidate)) == size:
+					return candidate
+			except OSError:
+				continue
+		return None
+
+	def remove_timeline(self, timeline_id):
+		with self.lock:
+			# the timelines branched from this one still have its files, their records
+			# move over to one of them instead of being dropped
+			rows = self.connection.execute(
+				"SELECT id, path, size FROM files WHERE timeline_id = ?", (timeline_id,)
+			).fetchall()
+			for row in rows:
+				inherited_path = self.find_inherited_path(row["path"], timeline_id, row["size"])
+				if inherited_path is None:
+					self.connection.execute("DELETE FROM files WHERE id = ?", (row["id"],))
+					continue
+				inherited_timeline_id = os.path.normpath(inherited_path).split(os.sep)[1]
+				self.connection.execute(
+					"UPDATE files SET path = ?, timeline_id = ? WHERE id = ?",
+					(inherited_path, inherited_timeline_id, row["id"]),
+				)
+			self.remove_orphan_runs()
+			self.connection.commit()
+
+	def search(self, query, timeline_id=None, limit=DEFAULT_SEARCH_LIMIT):
+		"""
+		Returns the newest files that match every filter and every word of the query,
+		as dicts with the absolute path, the run and its values
+		"""
+		filters, words = parse_search_query(query)
+		conditions = []
+		parameters = []
+		for key, value in filters:
+			# a dotted key has to match whole, otherwise it matches the last part of the key
+			column = "expose_id" if "." in key else "name"
+			conditions.append(f"files.run IN (SELECT run FROM run_values WHERE {column} = ? AND value = ?)")
+			parameters.extend([key, value])
+		for word in words:
+			prefix = escape_like(word) + "%"
+			conditions.append(
+				"(files.run IN (SELECT run FROM run_terms WHERE term LIKE ? ESCAPE '\\') OR files.file_name LIKE ? ESCAPE '\\')"
+			)
+			parameters.extend([prefix, prefix])
+		if timeline_id is not None:
+			conditions.append("files.timeline_id = ?")
+			parameters.append(timeline_id)
+
+		sql = (
+			"SELECT files.path, files.file_name, files.sha256, files.size, files.timeline_id, files.received_at, "
+			"runs.run_id, runs.workflow_id, runs.submitted_at, runs.started_at, runs.values_json "
+			"FROM files LEFT JOIN runs ON runs.id = files.run"
+		)
+		if conditions:
+			sql += " WHERE " + " AND ".join(conditions)
+		sql += " ORDER BY files.received_at DESC, files.id DESC LIMIT ? OFFSET ?"
+
+		# rows whose file is gone are skipped, so pages are read until there are enough
+		results = []
+		offset = 0
+		while len(results) < limit:
+			with self.lock:
+				rows = self.connection.execute(sql, parameters + [limit, offset]).fetchall()
+			offset += len(rows)
+
+			for row in rows:
+				result = dict(row)
+				result["path"] = self.get_absolute_path(row["path"])
+				# files deleted or changed outside of a run are not what the run made anymore,
+				# comparing the size is cheap enough to do for every result unlike the hash
+				try:
+					if os.path.getsize(result["path"]) != row["size"]:
+						continue
+				except OSError:
+					continue
+				result["values"] = json.loads(row["values_json"]) if row["values_json"] else {}
+				del result["values_json"]
+				results.append(result)
+				if len(results) >= limit:
+					break
+
+			if len(rows) < limit:
+				break
+		return results
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+# one index per project folder, shared by the tools dialog and the project dialog
+PROVENANCE_INDEXES = {}
+PROVENANCE_INDEXES_LOCK = threading.Lock()
+
+def get_provenance_index(project_folder):
+	project_folder = os.path.abspath(project_folder)
+	with PROVENANCE_INDEXES_LOCK:
+		index = PROVENANCE_INDEXES.get(project_folder, None)
+		if index is None:
+			index = ProvenanceIndex(project_folder)
+			PROVENANCE_INDEXES[project_folder] = index
+		return index
@@ -0,0 +1,143 @@
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+from imagerevision import get_image_revision
+from scratch import get_scratch_session
+
+# how many proxies we keep around before the least recently used ones get deleted
+PROXY_CACHE_MAX_ENTRIES = 24
+
+def get_file_proxy_key(filepath, scale):
+	"""
+	Key for a proxy of a file on disk, it changes when the file is modified
+	"""
+	stat = os.stat(filepath)
+	return ("file", os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size, scale)
+
+def get_image_saved_token(image):
+	"""
+	Modification time and size of the file the image was loaded from or last saved to,
+	None if it has no file
+	"""
+	gfile = image.get_file()
+	filepath = gfile.get_path() if gfile is not None else None
+	if filepath is None:
+		return None
+	try:
+		stat = os.stat(filepath)
+	except OSError:
+		return None
+	return (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+
+def get_image_proxy_key(image, scale, *extra):
+	"""
+	Key for a proxy of an open GIMP image, extra holds whatever else decides what is
+	exported from the image (eg. the load type and the layer)
+
+	Returns None when the image has unsaved changes, then the proxy must not be cached,
+	the revision only follows the structure of the image so a stroke or an edit of a
+	nested layer would not change it, a clean image looks like its file so the key goes
+	by that file and saving an edit moves it forward
+	"""
+	if image is None or not image.is_valid() or image.is_dirty():
+		return None
+	return ("image", image.get_id(), get_image_saved_token(image), get_image_revision(image, dirty_buckets=False), scale) + tuple(extra)
+
+class ProxyCache:
+	"""
+	Keeps downscaled copies of the inputs that we upload so they are only generated once
+	per source and revision, every proxy is a file owned by the cache in its own temporary
+	folder and gets deleted when evicted
+	"""
+	def __init__(self, max_entries=PROXY_CACHE_MAX_ENTRIES):
+		self.max_entries = max_entries
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+
+	@property
+	def folder(self):
+		# in the scratch folders of the session, on tmpfs when there is one
+		return get_scratch_session().get_folder("proxies")
+
+	def get(self, key):
+		with self.lock:
+			filepath = self.entries.get(key, None)
+			if filepath is None:
+				return None
+			if not os.path.exists(filepath):
+				del self.entries[key]
+				return None
+			self.entries.move_to_end(key)
+			return filepath
+
+	def put(self, key, source_filepath):
+		"""
+		Moves the given file into the cache and returns its new path
+		"""
+		os.makedirs(self.folder, exist_ok=True)
+		extension = os.path.splitext(source_filepath)[1]
+		filepath = os.path.join(self.folder, f"{uuid.uuid4().hex}{extension}")
+		shutil.move(source_filepath, filepath)
+
+		with self.lock:
+			old_filepath = self.entries.pop(key, None)
+			self.entries[key] = filepath
+			evicted = [old_filepath] if old_filepath is not None else []
+			while len(self.entries) > self.max_entries:
+				_, evicted_filepath = self.entries.popitem(last=False)
+				evicted.append(evicted_filepath)
+
+		for evicted_filepath in evicted:
+			self.remove_file(evicted_filepath)
+		return filepath
+
+	def get_or_create(self, key, create_fn, extension=".webp"):
+		"""
+		Returns the proxy for the key, calling create_fn with a temporary path to
+		write it to if it is not in the cache yet, create_fn may return the path it
+		wrote to instead if the extension had to change
+		"""
+		filepath = self.get(key)
+		if filepath is not None:
+			return filepath
+
+		os.makedirs(self.folder, exist_ok=True)
+		temp_filepath = os.path.join(self.folder, f"pending_{uuid.uuid4().hex}{extension}")
+		try:
+			written_filepath = create_fn(temp_filepath) or temp_filepath
+			return self.put(key, written_filepath)
+		except Exception as e:
+			self.remove_file(temp_filepath)
+			raise e
+
+	def evict(self, predicate):
+		"""
+		Deletes every proxy whose key matches the predicate
+		"""
+		with self.lock:
+			keys = [key for key in self.entries.keys() if predicate(key)]
+			evicted = [self.entries.pop(key) for key in keys]
+		for filepath in evicted:
+			self.remove_file(filepath)
+
+	def evict_closed_images(self, open_image_ids):
+		self.evict(lambda key: key[0] == "image" and key[1] not in open_image_ids)
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+		if os.path.exists(self.folder):
+			shutil.rmtree(self.folder, ignore_errors=True)
+
+	def remove_file(self, filepath):
+		if os.path.exists(filepath):
+			try:
+				os.remove(filepath)
+			except Exception as e:
+				print("Error removing proxy file:", e)
+
+# shared by all the exposes so the same input is only downscaled once per run and across runs
+PROXY_CACHE = ProxyCache()
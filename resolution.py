@@ -0,0 +1,100 @@
+import math
+
+import gettext
+_ = gettext.gettext
+
+# the sizes we send are snapped so both sides are a multiple of this, most
+# diffusion models work in latents of 8px and are trained on multiples of 64px
+RESOLUTION_SNAP = 64
+
+# scale factors are (horizontal, vertical) pairs, snapping each side on its own makes
+# them differ slightly
+NO_SCALE = (1.0, 1.0)
+
+# id, label, and either a fixed scale factor or a budget in megapixels
+RESOLUTION_MODES = [
+	("full", _("Full Size"), 1.0, None),
+	("half", _("Half Size"), 0.5, None),
+	("quarter", _("Quarter Size"), 0.25, None),
+	("0.25mp", _("0.25 Megapixels Budget"), None, 0.25),
+	("1mp", _("1 Megapixel Budget (SDXL, Flux)"), None, 1.0),
+	("2mp", _("2 Megapixels Budget"), None, 2.0),
+	("4mp", _("4 Megapixels Budget"), None, 4.0),
+]
+
+DEFAULT_RESOLUTION_MODE = "full"
+
+def get_resolution_mode(mode_id):
+	for mode in RESOLUTION_MODES:
+		if mode[0] == mode_id:
+			return mode
+	return None
+
+def get_scale_factor(mode_id, width, height, budget_only=False):
+	"""
+	Returns the (horizontal, vertical) factors that the size, the coordinates and the
+	upload of an input of width x height have to be multiplied by for the given mode,
+	megapixel budgets never upscale and are snapped so both sides land on a multiple of
+	RESOLUTION_SNAP, with budget_only the fixed factor modes leave the input as it is
+	"""
+	mode = get_resolution_mode(mode_id)
+	if mode is None:
+		return NO_SCALE
+
+	fixed_factor = mode[2]
+	if fixed_factor is not None:
+		return NO_SCALE if budget_only else (fixed_factor, fixed_factor)
+
+	budget = mode[3] * 1024 * 1024
+	if width is None or height is None or width <= 0 or height <= 0 or width * height <= budget:
+		return NO_SCALE
+
+	# flooring both sides keeps the snapped size within the budget
+	factor = math.sqrt(budget / (width * height))
+	snapped_width = min(width, max(RESOLUTION_SNAP, int(width * factor) // RESOLUTION_SNAP * RESOLUTION_SNAP))
+	snapped_height = min(height, max(RESOLUTION_SNAP, int(height * factor) // RESOLUTION_SNAP * RESOLUTION_SNAP))
+	# a very thin image can not shrink its short side any further, the long side makes up for it
+	if snapped_width * snapped_height > budget:
+		if snapped_width < snapped_height:
+			snapped_height = min(height, max(RESOLUTION_SNAP, int(budget / snapped_width) // RESOLUTION_SNAP * RESOLUTION_SNAP))
+		else:
+			snapped_width = min(width, max(RESOLUTION_SNAP, int(budget / snapped_height) // RESOLUTION_SNAP * RESOLUTION_SNAP))
+	return (snapped_width / width, snapped_height / height)
+
+def invert_scale_factor(scale_factor):
+	"""
+	The factors that bring something made at the scaled size back to the original size
+	"""
+	return (1 / scale_factor[0], 1 / scale_factor[1])
+
+def scale_size(size, scale_factor):
+	"""
+	Scales a width or a height by the factor of its axis, never going below 1px
+	"""
+	if scale_factor == 1.0:
+		return size
+	return max(1, int(round(size * scale_factor)))
+
+def scale_coordinate(coordinate, scale_factor):
+	if scale_factor == 1.0:
+		return coordinate
+	return int(round(coordinate * scale_factor))
+
+def snap_crop_box(x1, y1, x2, y2, margin, max_width, max_height, snap=RESOLUTION_SNAP):
+	"""
+	Grows the box by the margin and then to a multiple of snap on each side, keeping it
+	centered and inside max_width x max_height whenever the image is big enough,
+	returns (x, y, width, height)
+	"""
+	def snap_axis(start, end, limit):
+		start = max(0, start - margin)
+		end = min(limit, end + margin)
+		length = min(limit, int(math.ceil((end - start) / snap)) * snap)
+		# grow evenly on both sides and push the box back inside the image if needed
+		start = start - (length - (end - start)) // 2
+		start = max(0, min(start, limit - length))
+		return start, length
+
+	x, width = snap_axis(x1, x2, max_width)
+	y, height = snap_axis(y1, y2, max_height)
+	return (x, y, width, height)
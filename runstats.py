@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+
+from workspace import AI_HUB_FOLDER_PATH
+
+RUN_STATS_FILE_PATH = os.path.join(AI_HUB_FOLDER_PATH, "run_stats.json")
+
+# how many samples we keep per key, enough for a stable p95 while keeping the file small
+RUN_STATS_RESERVOIR_SIZE = 64
+# how many different keys we remember before dropping the least recently used ones
+RUN_STATS_MAX_ENTRIES = 500
+
+def percentile(samples, p):
+	"""
+	Returns the p-th percentile (0-100) of the given samples using linear
+	interpolation between the closest ranks, or None if there are no samples
+	"""
+	if not samples:
+		return None
+	ordered = sorted(samples)
+	if len(ordered) == 1:
+		return ordered[0]
+	rank = (len(ordered) - 1) * (p / 100.0)
+	lower = int(rank)
+	upper = min(lower + 1, len(ordered) - 1)
+	fraction = rank - lower
+	return ordered[lower] + (ordered[upper] - ordered[lower]) * fraction
+
+def format_duration(seconds):
+	seconds = int(round(max(0, seconds)))
+	if seconds < 60:
+		return "{}s".format(seconds)
+	minutes, seconds = divmod(seconds, 60)
+	if minutes < 60:
+		return "{}m {:02d}s".format(minutes, seconds)
+	hours, minutes = divmod(minutes, 60)
+	return "{}h {:02d}m".format(hours, minutes)
+
+def make_run_stats_key(server, workflow_id, key_params):
+	"""
+	Builds a compact key for the given server, workflow and the parameters that
+	affect how long a run takes (eg. image size, steps or model)
+	"""
+	raw = json.dumps([server, workflow_id, key_params], sort_keys=True, default=str)
+	return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+def _add_to_reservoir(samples, seen, value):
+	# standard reservoir sampling, the first samples go in directly and then
+	# every new sample has a size/seen chance of replacing an older one
+	if len(samples) < RUN_STATS_RESERVOIR_SIZE:
+		samples.append(value)
+	else:
+		index = random.randint(0, seen - 1)
+		if index < RUN_STATS_RESERVOIR_SIZE:
+			samples[index] = value
+
+class RunStatsStore:
+	def __init__(self, filepath=RUN_STATS_FILE_PATH):
+		self.filepath = filepath
+		self.entries = {}
+		self.lock = threading.Lock()
+		self.load()
+
+	def load(self):
+		if not os.path.exists(self.filepath):
+			return
+		try:
+			with open(self.filepath, "r") as f:
+				data = json.load(f)
+			if isinstance(data, dict):
+				self.entries = data.get("entries", {})
+		except Exception as e:
+			print("Error loading run stats:", e)
+			self.entries = {}
+
+	def save(self):
+		temp_filepath = self.filepath + ".tmp"
+		try:
+			with open(temp_filepath, "w") as f:
+				json.dump({"entries": self.entries}, f)
+			os.replace(temp_filepath, self.filepath)
+		except Exception as e:
+			print("Error saving run stats:", e)
+
+	def record(self, key, workflow_id, queue_seconds=None, exec_seconds=None):
+		with self.lock:
+			entry = self.entries.get(key, None)
+			if entry is None:
+				entry = {
+					"workflow_id": workflow_id,
+					"queue_seen": 0,
+					"queue": [],
+					"exec_seen": 0,
+					"exec": [],
+				}
+				self.entries[key] = entry
+
+			if queue_seconds is not None:
+				entry["queue_seen"] += 1
+				_add_to_reservoir(entry["queue"], entry["queue_seen"], round(queue_seconds, 2))
+			if exec_seconds is not None:
+				entry["exec_seen"] += 1
+				_add_to_reservoir(entry["exec"], entry["exec_seen"], round(exec_seconds, 2))
+
+			entry["last_used"] = time.time()
+
+			if len(self.entries) > RUN_STATS_MAX_ENTRIES:
+				by_age = sorted(self.entries.keys(), key=lambda k: self.entries[k].get("last_used", 0))
+				for old_key in by_age[:len(self.entries) - RUN_STATS_MAX_ENTRIES]:
+					del self.entries[old_key]
+
+			self.save()
+
+	def get_estimate(self, key):
+		"""
+		Returns the p50/p95 of the queue and execution durations for the key,
+		or None if nothing has been recorded for it yet
+		"""
+		with self.lock:
+			entry = self.entries.get(key, None)
+			if entry is None or len(entry["exec"]) == 0:
+				return None
+			return {
+				"count": entry["exec_seen"],
+				"queue_p50": percentile(entry["queue"], 50),
+				"queue_p95": percentile(entry["queue"], 95),
+				"exec_p50": percentile(entry["exec"], 50),
+				"exec_p95": percentile(entry["exec"], 95),
+			}
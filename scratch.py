@@ -0,0 +1,261 @@
+import atexit
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from gi.repository import GLib # type: ignore
+
+# every GIMP session gets its own scratch folders, named after its process so the folders of
+# sessions that are gone can be told apart and removed by the next one
+SESSION_FOLDER_PREFIX = "aihub_session_"
+SESSION_FOLDER_PATTERN = re.compile(r"^" + SESSION_FOLDER_PREFIX + r"(\d+)_[0-9a-f]+$")
+
+# small short lived files (exports for upload, proxies) go to memory backed storage when the
+# system has it, frames, tiles and temporary projects go to the regular temporary folder
+TMPFS_FOLDERS = ["/dev/shm"]
+TMPFS_MIN_FREE_BYTES = 512 * 1024 * 1024
+
+DEFAULT_SCRATCH_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_SCRATCH_USE_TMPFS = True
+
+# where there is no way to tell whether a process is alive, and for the loose files that
+# versions before the scratch folders left behind
+STALE_AFTER_SECONDS = 24 * 60 * 60
+LEGACY_PATTERNS = [
+	re.compile(r"^aihub_temp_(image|layer|file)_.*\.webp$"),
+	re.compile(r"^ai_hub_temp_project_.+$"),
+	re.compile(r"^aihub_tiles_[0-9a-f]+$"),
+	re.compile(r"^aihub_proxies_\d+$"),
+]
+
+def is_process_alive(pid):
+	if os.name == "nt":
+		# os.kill terminates the process on windows, the caller goes by age instead
+		return None
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		# it exists, it just belongs to somebody else
+		return True
+	except OSError:
+		return None
+	return True
+
+def get_path_size(path):
+	if os.path.isfile(path):
+		return os.path.getsize(path)
+	size = 0
+	for current_folder, folders, files in os.walk(path):
+		for filename in files:
+			try:
+				size += os.path.getsize(os.path.join(current_folder, filename))
+			except OSError:
+				pass
+	return size
+
+def remove_path(path):
+	try:
+		if os.path.isdir(path) and not os.path.islink(path):
+			shutil.rmtree(path, ignore_errors=True)
+		elif os.path.exists(path):
+			os.remove(path)
+	except Exception as e:
+		print("Error removing scratch file:", e)
+
+def get_tmpfs_folder():
+	for folder in TMPFS_FOLDERS:
+		try:
+			if os.path.isdir(folder) and os.access(folder, os.W_OK) and shutil.disk_usage(folder).free >= TMPFS_MIN_FREE_BYTES:
+				return folder
+		except OSError:
+			pass
+	return None
+
+class ScratchEntry:
+	def __init__(self, path, pinned=False):
+		self.path = path
+		self.references = 0
+		self.pinned = pinned
+		self.size = 0
+		self.last_used = time.monotonic()
+
+class ScratchSession:
+	"""
+	Temporary files and folders of this GIMP session, every entry is held while someone
+	references it and once released it is kept around for reuse until the released entries
+	go over max_bytes, then the least recently used ones are deleted, whatever is left is
+	deleted when GIMP exits
+	"""
+	def __init__(self, max_bytes=DEFAULT_SCRATCH_MAX_BYTES, use_tmpfs=DEFAULT_SCRATCH_USE_TMPFS):
+		self.max_bytes = max_bytes
+		folder_name = f"{SESSION_FOLDER_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:8]}"
+		self.large_folder = os.path.join(GLib.get_tmp_dir(), folder_name)
+		tmpfs_folder = get_tmpfs_folder() if use_tmpfs else None
+		self.small_folder = os.path.join(tmpfs_folder, folder_name) if tmpfs_folder is not None else self.large_folder
+		self.entries = {}
+		self.lock = threading.Lock()
+
+	def get_base_folder(self, large):
+		folder = self.large_folder if large else self.small_folder
+		os.makedirs(folder, exist_ok=True)
+		return folder
+
+	def new_entry(self, name, large=False, folder=False):
+		"""
+		Returns the path for a scratch file (or folder if folder is True) with the given name
+		and takes a reference to it, the same name gives the same path so it can be reused,
+		release it once it is not needed anymore
+		"""
+		path = os.path.join(self.get_base_folder(large), name)
+		if folder:
+			os.makedirs(path, exist_ok=True)
+		with self.lock:
+			entry = self.entries.get(path, None)
+			if entry is None:
+				entry = ScratchEntry(path)
+				self.entries[path] = entry
+			entry.references += 1
+			entry.last_used = time.monotonic()
+		return path
+
+	def get_folder(self, name, large=False):
+		"""
+		A folder that lives as long as the session, it is never evicted
+		"""
+		path = os.path.join(self.get_base_folder(large), name)
+		os.makedirs(path, exist_ok=True)
+		with self.lock:
+			if path not in self.entries:
+				self.entries[path] = ScratchEntry(path, pinned=True)
+		return path
+
+	def acquire(self, path):
+		with self.lock:
+			entry = self.entries.get(path, None)
+			if entry is None:
+				return False
+			entry.references += 1
+			entry.last_used = time.monotonic()
+			return True
+
+	def rename(self, path, new_path):
+		"""
+		Moves the file of an entry and the entry with it, for files whose name is only
+		known once they are written, paths that are not scratch entries are just moved
+		"""
+		os.replace(path, new_path)
+		with self.lock:
+			entry = self.entries.pop(path, None)
+			if entry is not None:
+				entry.path = new_path
+				self.entries[new_path] = entry
+
+	def release(self, path, delete=False):
+		"""
+		Drops a reference, paths that are not scratch entries are ignored, with delete the
+		entry is removed right away if nobody else holds it
+		"""
+		if path is None:
+			return
+		with self.lock:
+			entry = self.entries.get(path, None)
+			if entry is None or entry.pinned:
+				return
+			entry.references = max(0, entry.references - 1)
+			entry.last_used = time.monotonic()
+			if entry.references > 0:
+				return
+			if delete or not os.path.exists(path):
+				del self.entries[path]
+				remove = True
+			else:
+				remove = False
+		if remove:
+			remove_path(path)
+			return
+		size = get_path_size(path)
+		with self.lock:
+			entry.size = size
+		self.evict()
+
+	def evict(self):
+		with self.lock:
+			released = [entry for entry in self.entries.values() if entry.references == 0 and not entry.pinned]
+			total = sum(entry.size for entry in released)
+			evicted = []
+			for entry in sorted(released, key=lambda entry: entry.last_used):
+				if total <= self.max_bytes:
+					break
+				total -= entry.size
+				evicted.append(entry.path)
+				del self.entries[entry.path]
+		for path in evicted:
+			remove_path(path)
+
+	def close(self):
+		with self.lock:
+			self.entries = {}
+		for folder in set([self.small_folder, self.large_folder]):
+			if os.path.exists(folder):
+				shutil.rmtree(folder, ignore_errors=True)
+
+def cleanup_stale_sessions():
+	"""
+	Removes the scratch folders of sessions whose process is gone, and the loose temporary
+	files older versions left in the temporary folder
+	"""
+	now = time.time()
+	folders = [GLib.get_tmp_dir()] + [folder for folder in TMPFS_FOLDERS if os.path.isdir(folder)]
+	for folder in folders:
+		try:
+			names = os.listdir(folder)
+		except OSError:
+			continue
+		for name in names:
+			path = os.path.join(folder, name)
+			try:
+				age = now - os.path.getmtime(path)
+			except OSError:
+				continue
+			match = SESSION_FOLDER_PATTERN.match(name)
+			if match is not None:
+				pid = int(match.group(1))
+				if pid == os.getpid():
+					continue
+				alive = is_process_alive(pid)
+				if alive is False or (alive is None and age > STALE_AFTER_SECONDS):
+					remove_path(path)
+			elif age > STALE_AFTER_SECONDS and any(pattern.match(name) for pattern in LEGACY_PATTERNS):
+				remove_path(path)
+
+def cleanup_stale_sessions_in_background():
+	threading.Thread(target=cleanup_stale_sessions, daemon=True).start()
+
+SCRATCH_SESSION = None
+SCRATCH_SESSION_LOCK = threading.Lock()
+SCRATCH_SETTINGS = {"max_bytes": DEFAULT_SCRATCH_MAX_BYTES, "use_tmpfs": DEFAULT_SCRATCH_USE_TMPFS}
+
+def configure_scratch(max_bytes, use_tmpfs):
+	"""
+	Applies the config, where the folders are is decided when the session is first used
+	"""
+	SCRATCH_SETTINGS["max_bytes"] = max_bytes
+	SCRATCH_SETTINGS["use_tmpfs"] = use_tmpfs
+	with SCRATCH_SESSION_LOCK:
+		if SCRATCH_SESSION is not None:
+			SCRATCH_SESSION.max_bytes = max_bytes
+	if SCRATCH_SESSION is not None:
+		SCRATCH_SESSION.evict()
+
+def get_scratch_session():
+	global SCRATCH_SESSION
+	with SCRATCH_SESSION_LOCK:
+		if SCRATCH_SESSION is None:
+			SCRATCH_SESSION = ScratchSession(SCRATCH_SETTINGS["max_bytes"], SCRATCH_SETTINGS["use_tmpfs"])
+			atexit.register(SCRATCH_SESSION.close)
+		return SCRATCH_SESSION
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from gi.repository import GLib # type: ignore
+from gi.repository.GdkPixbuf import Pixbuf # type: ignore
+
+THUMBNAIL_SIZE = 100
+THUMBNAIL_FOLDER_NAME = ".thumbnails"
+# thumbnails kept in memory, the rest are loaded back from the cache folder
+THUMBNAIL_MEMORY_ENTRIES = 1024
+# the cache folder is trimmed to this many thumbnails, oldest first, when the cache is created
+THUMBNAIL_DISK_ENTRIES = 20000
+THUMBNAIL_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+def get_thumbnail_key(filepath, size=THUMBNAIL_SIZE):
+	"""
+	Key of the thumbnail of a file, it changes when the file is modified, returns None
+	if the file does not exist
+	"""
+	try:
+		stat = os.stat(filepath)
+	except OSError:
+		return None
+	raw = "{}|{}|{}|{}".format(os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size, size)
+	return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+class ThumbnailCache:
+	"""
+	Thumbnails of the files shown in the project dialog, kept in memory and as small pngs in
+	the cache folder of the project, missing ones are made by a pool of worker threads and
+	handed to the callback in the main loop
+	"""
+	def __init__(self, folder, size=THUMBNAIL_SIZE):
+		self.folder = folder
+		self.size = size
+		self.memory = OrderedDict()
+		# key to the callbacks waiting for it, so the same thumbnail is only made once
+		self.pending = {}
+		self.lock = threading.Lock()
+		self.executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="aihub_thumbnails")
+		self.executor.submit(self.trim_folder)
+
+	def get_cached_path(self, key):
+		return os.path.join(self.folder, key[:2], key + ".png")
+
+	def remember(self, key, pixbuf):
+		with self.lock:
+			self.memory[key] = pixbuf
+			self.memory.move_to_end(key)
+			while len(self.memory) > THUMBNAIL_MEMORY_ENTRIES:
+				self.memory.popitem(last=False)
+
+	def get_cached(self, filepath):
+		"""
+		Returns the thumbnail if it is in memory, never touches the disk
+		"""
+		key = get_thumbnail_key(filepath, self.size)
+		if key is None:
+			return None
+		with self.lock:
+			pixbuf = self.memory.get(key, None)
+			if pixbuf is not None:
+				self.memory.move_to_end(key)
+			return pixbuf
+
+	def request(self, filepath, callback):
+		"""
+		Makes or loads the thumbnail in the background and calls callback(filepath, pixbuf)
+		in the main loop, pixbuf is None if the file could not be read
+		"""
+		key = get_thumbnail_key(filepath, self.size)
+		if key is None:
+			return
+		with self.lock:
+			if key in self.pending:
+				self.pending[key].append(callback)
+				return
+			self.pending[key] = [callback]
+		self.executor.submit(self.make_thumbnail, key, filepath)
+
+	def make_thumbnail(self, key, filepath):
+		pixbuf = None
+		cached_path = self.get_cached_path(key)
+		try:
+			if os.path.exists(cached_path):
+				pixbuf = Pixbuf.new_from_file(cached_path)
+			else:
+				pixbuf = Pixbuf.new_from_file_at_scale(filepath, self.size, self.size, True)
+				os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+				temp_path = f"{cached_path}.{uuid.uuid4().hex}.tmp"
+				pixbuf.savev(temp_path, "png", [], [])
+				os.replace(temp_path, cached_path)
+		except Exception as e:
+			print("Error making thumbnail for {}:".format(filepath), e)
+
+		if pixbuf is not None:
+			self.remember(key, pixbuf)
+		with self.lock:
+			callbacks = self.pending.pop(key, [])
+
+		def notify():
+			for callback in callbacks:
+				callback(filepath, pixbuf)
+			return False
+		GLib.idle_add(notify)
+
+	def trim_folder(self):
+		if not os.path.isdir(self.folder):
+			return
+		entries = []
+		for current_folder, folders, files in os.walk(self.folder):
+			for filename in files:
+				cached_path = os.path.join(current_folder, filename)
+				try:
+					entries.append((os.stat(cached_path).st_mtime, cached_path))
+				except OSError:
+					pass
+		if len(entries) <= THUMBNAIL_DISK_ENTRIES:
+			return
+		entries.sort()
+		for _mtime, cached_path in entries[:len(entries) - THUMBNAIL_DISK_ENTRIES]:
+			try:
+				os.remove(cached_path)
+			except OSError:
+				pass
+
+	def shutdown(self):
+		# thumbnails that are half made still finish, the queued ones are dropped
+		self.executor.shutdown(wait=False, cancel_futures=True)
+
+# one cache per project folder
+THUMBNAIL_CACHES = {}
+
+def get_thumbnail_cache(project_folder):
+	project_folder = os.path.abspath(project_folder)
+	cache = THUMBNAIL_CACHES.get(project_folder, None)
+	if cache is None:
+		cache = ThumbnailCache(os.path.join(project_folder, THUMBNAIL_FOLDER_NAME))
+		THUMBNAIL_CACHES[project_folder] = cache
+	return cache
+
+def release_thumbnail_cache(project_folder):
+	"""
+	Stops the workers of the cache of the project once nothing shows its files anymore,
+	the next get_thumbnail_cache makes a new one
+	"""
+	cache = THUMBNAIL_CACHES.pop(os.path.abspath(project_folder), None)
+	if cache is not None:
+		cache.shutdown()
@@ -0,0 +1,311 @@
+import hashlib
+import json
+import math
+import threading
+
+import websocket
+from framing import FRAMED_FILES_PROTOCOL, encode_framed_message, decode_framed_message
+
+# numpy is optional, without it the tiles can not be blended and they are added
+# as separate layers instead
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+DEFAULT_TILE_SIZE = 1024
+DEFAULT_TILE_OVERLAP = 128
+DEFAULT_MAX_PARALLEL_TILES = 4
+
+# how long we wait for a single message from the server before giving up on a tile
+TILE_RECEIVE_TIMEOUT_SECONDS = 600
+
+class TileRunError(Exception):
+	pass
+
+def can_blend_tiles():
+	return np is not None
+
+def compute_tile_starts(length, tile_size, overlap):
+	"""
+	Returns the start of every tile along one axis, the tiles are spread evenly so
+	the first one starts at 0, the last one ends at length and every pair of
+	neighbours overlaps by at least the given overlap
+	"""
+	if length <= tile_size:
+		return [0]
+	overlap = min(overlap, tile_size // 2)
+	count = math.ceil((length - overlap) / (tile_size - overlap))
+	count = max(2, count)
+	stride = (length - tile_size) / (count - 1)
+	return [int(round(i * stride)) for i in range(count)]
+
+def compute_tiles(width, height, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP):
+	"""
+	Splits a region of the given size in overlapping tiles, every tile knows how much
+	it overlaps with the tile to its left and the tile above it, which is where it
+	gets feathered when the results are stitched back together
+	"""
+	tile_width = min(tile_size, width)
+	tile_height = min(tile_size, height)
+	x_starts = compute_tile_starts(width, tile_size, overlap)
+	y_starts = compute_tile_starts(height, tile_size, overlap)
+
+	tiles = []
+	for row, y in enumerate(y_starts):
+		for column, x in enumerate(x_starts):
+			tiles.append({
+				"index": len(tiles),
+				"x": x,
+				"y": y,
+				"width": tile_width,
+				"height": tile_height,
+				"overlap_left": x_starts[column - 1] + tile_width - x if column > 0 else 0,
+				"overlap_top": y_starts[row - 1] + tile_height - y if row > 0 else 0,
+			})
+	return tiles
+
+def get_tile_feather(tile, scale=1.0):
+	"""
+	The alpha used to composite the tile over the ones already placed, it ramps up
+	linearly across the overlap with the left and top neighbours, so the seams
+	become a crossfade between both results
+	"""
+	width = int(round(tile["width"] * scale))
+	height = int(round(tile["height"] * scale))
+	overlap_left = int(round(tile["overlap_left"] * scale))
+	overlap_top = int(round(tile["overlap_top"] * scale))
+
+	ramp_x = np.ones(width, dtype=np.float32)
+	if overlap_left > 0:
+		ramp_x[:overlap_left] = (np.arange(overlap_left, dtype=np.float32) + 0.5) / overlap_left
+	ramp_y = np.ones(height, dtype=np.float32)
+	if overlap_top > 0:
+		ramp_y[:overlap_top] = (np.arange(overlap_top, dtype=np.float32) + 0.5) / overlap_top
+	return np.outer(ramp_y, ramp_x)
+
+def pixels_from_rgba_bytes(data, width, height, rowstride):
+	"""
+	Wraps RGBA bytes with the given rowstride (eg. from a pixbuf) as an array of shape
+	height, width, 4 without copying them
+	"""
+	rows = np.frombuffer(data, dtype=np.uint8, count=rowstride * (height - 1) + width * 4)
+	return np.lib.stride_tricks.as_strided(rows, shape=(height, width, 4), strides=(rowstride, 4, 1))
+
+def blend_tiles(width, height, tiles, tile_pixels, scale=1.0):
+	"""
+	Stitches the tile results (RGBA uint8 arrays of shape height, width, 4 at the given
+	scale) in a single RGBA array, the tiles are composited in order with their feather
+	so only the output and one tile are in memory at any time
+	"""
+	if np is None:
+		raise TileRunError("numpy is required to blend tiles")
+
+	output = np.zeros((int(round(height * scale)), int(round(width * scale)), 4), dtype=np.uint8)
+	for tile, pixels in zip(tiles, tile_pixels):
+		x = int(round(tile["x"] * scale))
+		y = int(round(tile["y"] * scale))
+		feather = get_tile_feather(tile, scale)
+		tile_height, tile_width = feather.shape
+		if pixels.shape[0] != tile_height or pixels.shape[1] != tile_width:
+			raise TileRunError("Tile {} came back as {}x{} instead of {}x{}".format(tile["index"], pixels.shape[1], pixels.shape[0], tile_width, tile_height))
+		target = output[y:y + tile_height, x:x + tile_width]
+		alpha = feather[:, :, None]
+		target[...] = (target * (1.0 - alpha) + pixels * alpha + 0.5).astype(np.uint8)
+	return output
+
+class TiledRun:
+	"""
+	Runs the same workflow once per tile, each tile gets its own connection to the
+	server so the results can not get mixed up between runs, and up to max_parallel
+	of them are queued at the same time so a server with several workers processes
+	them in parallel
+	"""
+	def __init__(self, url, header, sslopt, workflow_id, expose_values, tile_expose_id, tiles, tile_files, max_parallel=DEFAULT_MAX_PARALLEL_TILES, framed_files_requested=False, on_progress=None):
+		self.url = url
+		self.header = header
+		self.sslopt = sslopt
+		self.workflow_id = workflow_id
+		self.expose_values = expose_values
+		self.tile_expose_id = tile_expose_id
+		self.tiles = tiles
+		self.tile_files = tile_files
+		self.max_parallel = max(1, max_parallel)
+		self.framed_files_requested = framed_files_requested
+		self.on_progress = on_progress
+
+		self.results = [None] * len(tiles)
+		self.errors = []
+		self.finished_count = 0
+		self.next_tile = 0
+		self.lock = threading.Lock()
+		self.cancelled = threading.Event()
+		# open connection to the id of the run it is waiting for, if known yet
+		self.connections = {}
+
+	def run(self):
+		"""
+		Blocks until every tile is done and returns, per tile, the list of files
+		received as (file message, bytes)
+		"""
+		workers = [threading.Thread(target=self.worker, daemon=True) for _ in range(min(self.max_parallel, len(self.tiles)))]
+		for worker in workers:
+			worker.start()
+		for worker in workers:
+			worker.join()
+
+		if self.cancelled.is_set():
+			raise TileRunError("Cancelled by user")
+		if len(self.errors) > 0:
+			raise TileRunError(self.errors[0])
+		return self.results
+
+	def cancel(self):
+		self.cancelled.set()
+		with self.lock:
+			connections = list(self.connections.items())
+		for ws, run_id in connections:
+			try:
+				if run_id is not None:
+					ws.send(json.dumps({"type": "WORKFLOW_OPERATION", "cancel": run_id}))
+				ws.close()
+			except Exception:
+				pass
+
+	def worker(self):
+		while not self.cancelled.is_set():
+			with self.lock:
+				if self.next_tile >= len(self.tiles) or len(self.errors) > 0:
+					return
+				index = self.next_tile
+				self.next_tile += 1
+			try:
+				self.results[index] = self.run_tile(index)
+			except Exception as e:
+				if not self.cancelled.is_set():
+					with self.lock:
+						self.errors.append("Tile {}: {}".format(index, e))
+				return
+			with self.lock:
+				self.finished_count += 1
+				finished_count = self.finished_count
+			if self.on_progress is not None:
+				self.on_progress(finished_count, len(self.tiles))
+
+	def recv(self, ws):
+		opcode, data = ws.recv_data()
+		if opcode == websocket.ABNF.OPCODE_TEXT:
+			return json.loads(data.decode("utf-8")), None
+		if opcode == websocket.ABNF.OPCODE_BINARY:
+			return None, data
+		raise TileRunError("Connection closed by server")
+
+	def recv_json(self, ws):
+		while True:
+			message, data = self.recv(ws)
+			if message is not None:
+				return message
+
+	def upload(self, ws, framed, file_data):
+		binary_header = {
+			"type": "FILE_UPLOAD",
+			"filename": hashlib.md5(file_data).hexdigest(),
+			"workflow_id": self.workflow_id,
+			"if_not_exists": True,
+		}
+		if framed:
+			ws.send_binary(encode_framed_message(binary_header, file_data))
+		else:
+			ws.send(json.dumps(binary_header))
+			response = self.recv_json(ws)
+			if response["type"] == "FILE_UPLOAD_SKIP":
+				return response.get("file", None)
+			if response["type"] != "UPLOAD_ACK":
+				raise TileRunError(response.get("message", response["type"]))
+			ws.send_binary(file_data)
+
+		response = self.recv_json(ws)
+		if response["type"] in ("FILE_UPLOAD_SUCCESS", "FILE_UPLOAD_SKIP"):
+			return response.get("file", None)
+		raise TileRunError(response.get("message", response["type"]))
+
+	def run_tile(self, index):
+		tile = self.tiles[index]
+		header = dict(self.header)
+		if self.framed_files_requested:
+			header["framing"] = FRAMED_FILES_PROTOCOL
+
+		ws = websocket.create_connection(self.url, header=header, sslopt=self.sslopt, timeout=TILE_RECEIVE_TIMEOUT_SECONDS)
+		with self.lock:
+			self.connections[ws] = None
+		try:
+			info = self.recv_json(ws)
+			if info.get("type", None) != "INFO_LIST":
+				raise TileRunError("Expected INFO_LIST, got {}".format(info.get("type", None)))
+			framed = self.framed_files_requested and info.get("framed_files", None) == FRAMED_FILES_PROTOCOL
+
+			with open(self.tile_files[index], "rb") as f:
+				file_data = f.read()
+			uploaded_path = self.upload(ws, framed, file_data)
+
+			# the tile replaces the whole image for this run
+			expose_values = json.loads(json.dumps(self.expose_values))
+			tile_value = expose_values.get(self.tile_expose_id, None)
+			if not isinstance(tile_value, dict):
+				tile_value = {}
+				expose_values[self.tile_expose_id] = tile_value
+			tile_value["local_file"] = uploaded_path
+			tile_value["value_width"] = tile["width"]
+			tile_value["value_height"] = tile["height"]
+			if "pos_x" in tile_value:
+				tile_value["pos_x"] = tile_value["pos_x"] + tile["x"]
+			if "pos_y" in tile_value:
+				tile_value["pos_y"] = tile_value["pos_y"] + tile["y"]
+
+			ws.send(json.dumps({
+				"type": "WORKFLOW_OPERATION",
+				"workflow_id": self.workflow_id,
+				"expose": expose_values,
+			}))
+
+			files = []
+			# without framing the FILE message and its binary are paired in the order they
+			# arrive, whichever of the two comes first waits for the other
+			pending_file_info = []
+			pending_file_data = []
+			while True:
+				if self.cancelled.is_set():
+					raise TileRunError("Cancelled by user")
+				message, data = self.recv(ws)
+				if data is not None:
+					if framed:
+						file_message, payload = decode_framed_message(data)
+						files.append((file_message, bytes(payload)))
+					elif len(pending_file_info) > 0:
+						files.append((pending_file_info.pop(0), data))
+					else:
+						pending_file_data.append(data)
+					continue
+
+				message_type = message.get("type", None)
+				if message_type in ("WORKFLOW_AWAIT", "WORKFLOW_START"):
+					with self.lock:
+						self.connections[ws] = message.get("id", None)
+				elif message_type == "FILE":
+					if len(pending_file_data) > 0:
+						files.append((message, pending_file_data.pop(0)))
+					else:
+						pending_file_info.append(message)
+				elif message_type == "ERROR":
+					raise TileRunError(message.get("message", "Unknown error"))
+				elif message_type == "WORKFLOW_FINISHED":
+					if message.get("error", False):
+						raise TileRunError(message.get("error_message", "No message provided"))
+					return files
+		finally:
+			with self.lock:
+				self.connections.pop(ws, None)
+			try:
+				ws.close()
+			except Exception:
+				pass
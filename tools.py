@@ -4,14 +4,27 @@ from about import AboutDialog
 from conditions import ConditionEvaluator
 from settings import SettingsDialog
 from update import UpdateDialog
+from framing import FRAMED_FILES_PROTOCOL, decode_framed_message
+from imagerevision import get_image_revision
+from changetracker import ImageChangeTracker
+from proxycache import PROXY_CACHE
+from tiling import DEFAULT_TILE_SIZE, DEFAULT_TILE_OVERLAP, DEFAULT_MAX_PARALLEL_TILES, TiledRun, can_blend_tiles, compute_tiles, blend_tiles, pixels_from_rgba_bytes
+from resolution import RESOLUTION_MODES, DEFAULT_RESOLUTION_MODE, NO_SCALE, get_resolution_mode, invert_scale_factor, scale_size, scale_coordinate
+from provenance import get_provenance_index
+from projectjournal import ProjectFileWriter, load_project_file, write_json_atomic
+from projectstorage import BRANCH_METHODS, DEFAULT_BRANCH_METHOD, break_hardlink, clone_tree_cow, get_blob_store, get_blob_store_for_timeline
+from runstats import RunStatsStore, make_run_stats_key, format_duration
+from scratch import DEFAULT_SCRATCH_MAX_BYTES, DEFAULT_SCRATCH_USE_TMPFS, cleanup_stale_sessions_in_background, configure_scratch, get_scratch_session
 from websocket._app import WebSocketApp
 from workspace import AI_HUB_FOLDER_PATH, AI_HUB_SAVED_PATH, ensure_aihub_folder, get_aihub_common_property_value, update_aihub_common_property_value
 from gi.repository import Gimp, GimpUi, Gtk, GLib, Gdk # type: ignore
 from gi.repository.GdkPixbuf import Pixbuf # type: ignore
 from gi.repository.GdkPixbuf import InterpType # type: ignore
+from gi.repository.GdkPixbuf import Colorspace # type: ignore
 from gi.repository import Gio # type: ignore
+from gi.repository import Gegl # type: ignore
 import threading
-from gtkexposes import EXPOSES, AIHubExposeFrame
+from gtkexposes import EXPOSES, AIHubExposeFrame, AIHubExposeImage
 import uuid
 from project import ProjectDialog
 import ssl
@@ -24,6 +37,7 @@ import websocket
 import socket
 
 import threading
+import time
 
 import urllib.request
 import locale
@@ -39,6 +53,9 @@ _ = gettext.gettext
 
 PROC_NAME = "AI Hub"
 
+# how often we check if the open images changed, in milliseconds
+IMAGE_CHANGES_POLL_INTERVAL = 1500
+
 VERSION = None
 try:
 	with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "VERSION"), "r") as f:
@@ -47,6 +64,13 @@ except Exception as e:
 	VERSION = "unknown"
 
 def open_file_with_default_app(path):
+    # the other app may write the file in place, it must not change the blob that the
+    # file shares with other timelines, see projectstorage.py
+    if os.path.isfile(path):
+        try:
+            break_hardlink(path)
+        except Exception as e:
+            print("Error unsharing file before opening it:", e)
     if sys.platform.startswith("linux"):  # could be "linux", "linux2", "linux3", ...
         subprocess.run(["xdg-open", path])
     elif sys.platform == "darwin":
@@ -128,8 +152,8 @@ MESSAGE_LOCK = threading.Lock()
 
 def get_project_folder_in_timeline(timeline_path, project_is_real):
 	if not project_is_real:
-		base_folder = GLib.get_tmp_dir()
-		project_folder = os.path.join(base_folder, "ai_hub_temp_project_" + timeline_path)
+		# lives in the scratch folder of the session and goes away with it
+		project_folder = get_scratch_session().get_folder("ai_hub_temp_project_" + timeline_path, large=True)
 	else:
 		project_folder = timeline_path
 	
@@ -148,6 +172,15 @@ def store_project_file(timeline_path, project_is_real, filename, file_action, by
 		os.makedirs(files_folder, exist_ok=True)
 	filepath = os.path.join(files_folder, filename)
 
+	# real projects keep every file once in their blob store and the timelines link to it
+	blob_store = get_blob_store_for_timeline(project_folder) if project_is_real else None
+	def write_file(path):
+		if blob_store is not None:
+			blob_store.write_bytes(path, bytes)
+		else:
+			with open(path, "wb") as f:
+				f.write(bytes)
+
 	if protected_run_mode:
 		# we are in protected mode, so we ignore file writing overwrites, we still write to the project folder but
 		# we do not allow overwriting existing files, or appending to existing file batches, instead we will use
@@ -165,13 +198,13 @@ def store_project_file(timeline_path, project_is_real, filename, file_action, by
 
 		# this will not be recognized as a batch, because the number is before the base name
 		filepath = os.path.join(files_folder, f"{i}_{base}{ext}")
-		with open(filepath, "wb") as f:
-			f.write(bytes)
+		write_file(filepath)
 		return filepath
 	
 	if file_action == "REPLACE":
-		with open(filepath, "wb") as f:
-			f.write(bytes)
+		# timelines share unchanged files with their parent, see projectstorage.py
+		break_hardlink(filepath, keep_contents=False)
+		write_file(filepath)
 		return filepath
 	elif file_action == "APPEND":
 		# we want to get the filename with a number appended to it before the extension
@@ -187,12 +220,12 @@ def store_project_file(timeline_path, project_is_real, filename, file_action, by
 						highest_index_found = index
 		i = highest_index_found + 1
 		finalpath = os.path.join(files_folder, f"{base}_{i}{ext}")
-		with open(finalpath, "wb") as f:
-			f.write(bytes)
+		write_file(finalpath)
 		return finalpath
 	elif file_action == "JOIN":
 		# we are going to append to the file if it exists, using the separator if provided
 		# to separate the chunks
+		break_hardlink(filepath)
 		with open(filepath, "ab") as f:
 			if os.path.exists(filepath) and separator:
 				f.write(separator)
@@ -203,6 +236,13 @@ def store_project_file(timeline_path, project_is_real, filename, file_action, by
 def open_project_file_as_image(finalpath):
 	# now try to open it in gimp if it is an image
 
+	# GIMP overwrites the file it was loaded from in place, the blob it shares with other
+	# timelines must stay as it is, see projectstorage.py
+	try:
+		break_hardlink(finalpath)
+	except Exception as e:
+		print("Error unsharing file before opening it:", e)
+
 	loaded_image = Gimp.file_load(Gimp.RunMode.NONINTERACTIVE, Gio.File.new_for_path(finalpath))
 	if loaded_image:
 		Gimp.Display.new(loaded_image)
@@ -211,6 +251,79 @@ def open_project_file_as_image(finalpath):
 	
 	return None
 
+def load_file_as_layer(image, finalpath, name):
+	# let gimp load the file straight into a layer, this avoids decoding the whole
+	# file into a pixbuf first and then copying it again into the layer
+	try:
+		layer = Gimp.file_load_layer(Gimp.RunMode.NONINTERACTIVE, image, Gio.File.new_for_path(finalpath))
+		if layer is not None:
+			layer.set_name(name)
+			return layer
+	except Exception as e:
+		print("Error loading file as layer, falling back to pixbuf:", e)
+
+	pixbuf = Pixbuf.new_from_file(finalpath)
+	return Gimp.Layer.new_from_pixbuf(image, name, pixbuf, 100, Gimp.LayerMode.NORMAL, 0, 100)
+
+def refresh_image_after_new_layers(image, layers):
+	# bug in GIMP 3.0.10 where the image is not updated if the layer is made visible again
+	# the workaround is expensive so it is done once for the whole batch of new layers
+	img_width = image.get_width()
+	img_height = image.get_height()
+	# make a thumbnail starting at 400px with the ratio for the given height
+	height_from_ratio = max(1, int(400 * img_height / img_width))
+	image.get_thumbnail(400,height_from_ratio,Gimp.PixbufTransparency.KEEP_ALPHA)
+
+	for layer in layers:
+		layer.set_visible(False)
+	Gimp.displays_flush()
+	for layer in layers:
+		layer.set_visible(True)
+	Gimp.displays_flush()
+
+def get_tiling_region(image):
+	# the selection if there is one, otherwise the whole image
+	bounds = Gimp.Selection.bounds(image)
+	non_empty, x1, y1, x2, y2 = bounds[-5:]
+	if non_empty and x2 > x1 and y2 > y1:
+		return (x1, y1, x2 - x1, y2 - y1)
+	return (0, 0, image.get_width(), image.get_height())
+
+def export_image_tiles(image, region, tiles, folder):
+	# flatten the visible image once and read every tile straight from its buffer
+	region_x, region_y, _region_width, _region_height = region
+	flat_image = Gimp.Image.new(image.get_width(), image.get_height(), Gimp.ImageBaseType.RGB)
+	tile_files = []
+	try:
+		flat_layer = Gimp.Layer.new_from_visible(image, flat_image)
+		flat_image.insert_layer(flat_layer, None, 0)
+		if not flat_layer.has_alpha():
+			flat_layer.add_alpha()
+		buffer = flat_layer.get_buffer()
+		for tile in tiles:
+			rect = Gegl.Rectangle.new(region_x + tile["x"], region_y + tile["y"], tile["width"], tile["height"])
+			data = buffer.get(rect, 1.0, "R'G'B'A u8", Gegl.AbyssPolicy.CLAMP)
+			pixbuf = Pixbuf.new_from_bytes(GLib.Bytes.new(data), Colorspace.RGB, True, 8, tile["width"], tile["height"], tile["width"] * 4)
+			tile_file = os.path.join(folder, f"tile_{tile['index']}.png")
+			pixbuf.savev(tile_file, "png", [], [])
+			tile_files.append(tile_file)
+	finally:
+		flat_image.delete()
+	return tile_files
+
+def load_tile_pixels(filepath):
+	pixbuf = Pixbuf.new_from_file(filepath)
+	if not pixbuf.get_has_alpha():
+		pixbuf = pixbuf.add_alpha(False, 0, 0, 0)
+	return pixels_from_rgba_bytes(pixbuf.read_pixel_bytes().get_data(), pixbuf.get_width(), pixbuf.get_height(), pixbuf.get_rowstride())
+
+def write_layer_pixels(layer, pixels):
+	height, width = pixels.shape[0], pixels.shape[1]
+	buffer = layer.get_buffer()
+	buffer.set(Gegl.Rectangle.new(0, 0, width, height), "R'G'B'A u8", pixels.tobytes())
+	buffer.flush()
+	layer.update(0, 0, width, height)
+
 def remove_batch_files(filename, timeline_path, project_is_real):
 	# first lets get the folder for the project files
 	project_folder = get_project_folder_in_timeline(timeline_path, project_is_real)
@@ -236,130 +349,130 @@ last_collected_files = []
 last_use_as_frames_action = None
 provide_feedback_to_frame_by_frame_next_frames_callback = None
 
-def process_last_collected_files(current_image, project_is_real, half_size=False, half_size_coords=False):
+def process_last_collected_files(current_image, project_is_real, scale_factor=NO_SCALE, scale_coords=False):
 	global last_collected_files
 	global last_use_as_frames_action
 	global provide_feedback_to_frame_by_frame_next_frames_callback
 	open_with_default_app_afterwards = []
-	for collected in last_collected_files:
-		should_delete_file_afterwards = False
-		action = collected["action"]
-		if "paths" in collected:
-			# batch of files
-			if not project_is_real:
-				# when real projects we do not open any batch automatically
-				# but now we need to save all those files to a given folder
-				# so we must ask the user where to save all of them
-				dialog = Gtk.FileChooserNative(title=_("Select Folder to Save Batch Files"), action=Gtk.FileChooserAction.SELECT_FOLDER, transient_for=None, modal=True)
-				response = dialog.run()
-				if response == Gtk.ResponseType.ACCEPT:
-					user_folder = dialog.get_filename()
-					for path in collected["paths"]:
-						try:
-							shutil.copy(path, user_folder)
-						except Exception as e:
-							print("Error copying file to user location:", e)
-			if provide_feedback_to_frame_by_frame_next_frames_callback and last_use_as_frames_action:
-				fn = provide_feedback_to_frame_by_frame_next_frames_callback
-				should_delete = fn(collected["paths"], last_use_as_frames_action)
-
-				if should_delete:
-					for path in collected["paths"]:
-						if os.path.exists(path):
+	# all the new layers of a run go in a single undo group and get a single redraw
+	new_layers = []
+	selectedlayers = None
+	try:
+		for collected in last_collected_files:
+			should_delete_file_afterwards = False
+			action = collected["action"]
+			if "paths" in collected:
+				# batch of files
+				if not project_is_real:
+					# when real projects we do not open any batch automatically
+					# but now we need to save all those files to a given folder
+					# so we must ask the user where to save all of them
+					dialog = Gtk.FileChooserNative(title=_("Select Folder to Save Batch Files"), action=Gtk.FileChooserAction.SELECT_FOLDER, transient_for=None, modal=True)
+					response = dialog.run()
+					if response == Gtk.ResponseType.ACCEPT:
+						user_folder = dialog.get_filename()
+						for path in collected["paths"]:
 							try:
-								os.remove(path)
+								shutil.copy(path, user_folder)
 							except Exception as e:
-								print("Error removing temporary file:", e)
-		else:
-			finalpath = collected["path"]
-			# new image with autoopen option, or new layer to empty image in non-real project which would otherwise mean the user loses the image
-			# weird workflow but may occur
-			if (action["action"] == "NEW_IMAGE" and action.get("autoopen", False)) or (not project_is_real and (action["action"] == "NEW_LAYER" and current_image is None)):
-				open_project_file_as_image(finalpath)
-			elif action["action"] == "NEW_LAYER":
-				pos_x = action.get("pos_x", 0)
-				pos_y = action.get("pos_y", 0)
-				# we are going to add a new layer to the current image
-				# first lets make a pixbuf from the file at finalpath
-				pixbuf = Pixbuf.new_from_file(finalpath)
-				new_name = action.get("name", _("AI Hub Layer"))
-				layer = Gimp.Layer.new_from_pixbuf(current_image, new_name, pixbuf, 100, Gimp.LayerMode.NORMAL, 0, 100)
-				reference_layer_raw = action.get("reference_layer_id", None)
-				reference_layer_id = int(reference_layer_raw) if reference_layer_raw is not None and reference_layer_raw.isdigit() else None
-				reference_layer = None if reference_layer_id is None else Gimp.Layer.get_by_id(reference_layer_id)
-
-				if reference_layer is None and reference_layer_raw == "__first__":
-					reference_layer = current_image.get_layers()[0] if len(current_image.get_layers()) > 0 else None
-				elif reference_layer is None and reference_layer_raw == "__last__":
-					layers = current_image.get_layers()
-					reference_layer = layers[-1] if len(layers) > 0 else None
-					
-				# get the selected layers before we insert the new one
-				selectedlayers = current_image.get_selected_layers()
-				if reference_layer is None:
-					current_image.insert_layer(layer, None, 0)
+								print("Error copying file to user location:", e)
+				if provide_feedback_to_frame_by_frame_next_frames_callback and last_use_as_frames_action:
+					fn = provide_feedback_to_frame_by_frame_next_frames_callback
+					should_delete = fn(collected["paths"], last_use_as_frames_action)
+
+					if should_delete:
+						for path in collected["paths"]:
+							if os.path.exists(path):
+								try:
+									os.remove(path)
+								except Exception as e:
+									print("Error removing temporary file:", e)
+			else:
+				finalpath = collected["path"]
+				# new image with autoopen option, or new layer to empty image in non-real project which would otherwise mean the user loses the image
+				# weird workflow but may occur
+				if (action["action"] == "NEW_IMAGE" and action.get("autoopen", False)) or (not project_is_real and (action["action"] == "NEW_LAYER" and current_image is None)):
+					open_project_file_as_image(finalpath)
+				elif action["action"] == "NEW_LAYER":
+					pos_x = action.get("pos_x", 0)
+					pos_y = action.get("pos_y", 0)
+					if selectedlayers is None:
+						# get the selected layers before we insert the first new one
+						selectedlayers = current_image.get_selected_layers()
+						current_image.undo_group_start()
+					# we are going to add a new layer to the current image
+					new_name = action.get("name", _("AI Hub Layer"))
+					layer = load_file_as_layer(current_image, finalpath, new_name)
+					reference_layer_raw = action.get("reference_layer_id", None)
+					reference_layer_id = int(reference_layer_raw) if reference_layer_raw is not None and reference_layer_raw.isdigit() else None
+					reference_layer = None if reference_layer_id is None else Gimp.Layer.get_by_id(reference_layer_id)
+
+					if reference_layer is None and reference_layer_raw == "__first__":
+						reference_layer = current_image.get_layers()[0] if len(current_image.get_layers()) > 0 else None
+					elif reference_layer is None and reference_layer_raw == "__last__":
+						layers = current_image.get_layers()
+						reference_layer = layers[-1] if len(layers) > 0 else None
+
+					if reference_layer is None:
+						current_image.insert_layer(layer, None, 0)
+					else:
+						# can be NEW_BEFORE, NEW_AFTER and REPLACE
+						reference_layer_action = action.get("reference_layer_action", "NEW_AFTER")
+						parent_layer = reference_layer.get_parent()
+						sibling_layers = current_image.get_layers() if parent_layer is None else parent_layer.get_children()
+						reference_layer_index = sibling_layers.index(reference_layer)
+						if reference_layer_action == "NEW_BEFORE":
+							current_image.insert_layer(layer, parent_layer, reference_layer_index + 1)
+						elif reference_layer_action == "NEW_AFTER":
+							current_image.insert_layer(layer, parent_layer, reference_layer_index)
+						elif reference_layer_action == "REPLACE":
+							# in order to avoid destructive actions, we are going to insted
+							# hide it and set it before the new layer
+							reference_layer.set_visible(False)
+							current_image.insert_layer(layer, parent_layer, reference_layer_index + 1)
+					if scale_factor != NO_SCALE:
+						# the result was made at the scaled resolution, bring it back to the image size
+						inverse_scale_factor = invert_scale_factor(scale_factor)
+						layer.scale(scale_size(layer.get_width(), inverse_scale_factor[0]), scale_size(layer.get_height(), inverse_scale_factor[1]), False)
+						if scale_coords:
+							pos_x = scale_coordinate(pos_x, inverse_scale_factor[0])
+							pos_y = scale_coordinate(pos_y, inverse_scale_factor[1])
+					layer.set_offsets(pos_x, pos_y)
+					new_layers.append(layer)
+					should_delete_file_afterwards = True
 				else:
-					# can be NEW_BEFORE, NEW_AFTER and REPLACE
-					reference_layer_action = action.get("reference_layer_action", "NEW_AFTER")
-					parent_layer = reference_layer.get_parent()
-					sibling_layers = current_image.get_layers() if parent_layer is None else parent_layer.get_children()
-					reference_layer_index = sibling_layers.index(reference_layer)
-					if reference_layer_action == "NEW_BEFORE":
-						current_image.insert_layer(layer, parent_layer, reference_layer_index + 1)
-					elif reference_layer_action == "NEW_AFTER":
-						current_image.insert_layer(layer, parent_layer, reference_layer_index)
-					elif reference_layer_action == "REPLACE":
-						# in order to avoid destructive actions, we are going to insted
-						# hide it and set it before the new layer
-						reference_layer.set_visible(False)
-						current_image.insert_layer(layer, parent_layer, reference_layer_index + 1)
-				if half_size:
-					layer.scale(layer.get_width() * 2, layer.get_height() * 2, False)
-					if half_size_coords:
-						pos_x = pos_x * 2
-						pos_y = pos_y * 2
-				layer.set_offsets(pos_x, pos_y)
+					if not project_is_real:
+						# unknown action, we will just ask the user to save the file
+						dialog = Gtk.FileChooserNative(title=_("Save File"), action=Gtk.FileChooserAction.SAVE, transient_for=None, modal=True)
+						dialog.set_current_name(os.path.basename(finalpath))
+						response = dialog.run()
+						if response == Gtk.ResponseType.ACCEPT:
+							user_filepath = dialog.get_filename()
+							try:
+								# copy the file to the user location
+								shutil.copyfile(finalpath, user_filepath)
+							except Exception as e:
+								print("Error moving file to user location:", e)
+	
+					if action.get("autoplay", False):
+						open_with_default_app_afterwards.append(finalpath)
+			
+				if should_delete_file_afterwards and os.path.exists(finalpath):
+					try:
+						os.remove(finalpath)
+					except Exception as e:
+						print("Error removing temporary file:", e)
+	finally:
+		if selectedlayers is not None:
+			try:
+				# the redraw workaround toggles the visibility of the new layers, which are
+				# undo steps too, so it has to happen before the group is closed
+				refresh_image_after_new_layers(current_image, new_layers)
+			finally:
 				# go back to the previously selected layers
 				# so the user doesnt suddenly lose their selection
 				current_image.set_selected_layers(selectedlayers)
-
-				# bug in GIMP 3.0.10 where the image is not updated if the layer is made visible again
-				img_width = current_image.get_width()
-				img_height = current_image.get_height()
-				# make a thumbnail starting at 400px with the ratio for the given height
-				height_from_ratio = int(400 * img_height / img_width)
-				pixbuf2 = current_image.get_thumbnail(400,height_from_ratio,Gimp.PixbufTransparency.KEEP_ALPHA)
-
-				layer.set_visible(False)
-				Gimp.displays_flush()
-				layer.set_visible(True)
-				Gimp.displays_flush()
-
-				# do it again for good measure
-				pixbuf3 = current_image.get_thumbnail(400,height_from_ratio,Gimp.PixbufTransparency.KEEP_ALPHA)
-				should_delete_file_afterwards = True
-			else:
-				if not project_is_real:
-					# unknown action, we will just ask the user to save the file
-					dialog = Gtk.FileChooserNative(title=_("Save File"), action=Gtk.FileChooserAction.SAVE, transient_for=None, modal=True)
-					dialog.set_current_name(os.path.basename(finalpath))
-					response = dialog.run()
-					if response == Gtk.ResponseType.ACCEPT:
-						user_filepath = dialog.get_filename()
-						try:
-							# copy the file to the user location
-							shutil.copyfile(finalpath, user_filepath)
-						except Exception as e:
-							print("Error moving file to user location:", e)
-	
-				if action.get("autoplay", False):
-					open_with_default_app_afterwards.append(finalpath)
-			
-			if should_delete_file_afterwards and os.path.exists(finalpath):
-				try:
-					os.remove(finalpath)
-				except Exception as e:
-					print("Error removing temporary file:", e)
+				current_image.undo_group_end()
 
 	for path in open_with_default_app_afterwards:
 		open_file_with_default_app(path)
@@ -374,13 +487,22 @@ def handle_project_file(
 	bytes,
 	action,
 	current_image,
-	protected_run_mode=False
+	protected_run_mode=False,
+	project_folder=None,
+	provenance=None,
 ):
 	file_name = action.get("file_name", "unnamed")
 	file_action = action.get("file_action", "REPLACE")
 	separator = action.get("file_separator", b"")
 	finalpath = store_project_file(timeline_path, project_is_real, file_name, file_action, bytes, separator, protected_run_mode)
 
+	# remember which run made the file so it can be searched for later
+	if project_is_real and project_folder is not None and provenance is not None and finalpath is not None:
+		try:
+			get_provenance_index(project_folder).record_file(finalpath, bytes, provenance)
+		except Exception as e:
+			print("Error recording file provenance:", e)
+
 	if "batch_index" in action and action["batch_index"] is not None:
 		found_existing_entry = False
 		for entry in last_collected_files:
@@ -452,6 +574,11 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 				except Exception as e:
 					print("Error setting websocket_relegator:", e)
 				return
+
+			if self.framed_files and isinstance(msg, bytes):
+				# framed files carry their own description, so they need no pairing with the FILE message
+				self.on_framed_message(msg)
+				return
 			
 			MESSAGE_LOCK.acquire()
 			
@@ -470,6 +597,8 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 							next_file_info.get("action", None),
 							self.selected_image,
 							self.protected_run_mode,
+							self.project_folder,
+							self.get_run_provenance(),
 						)
 						MESSAGE_LOCK.release()
 						return
@@ -503,6 +632,7 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 						self.loras = message_parsed.get("loras", [])
 						self.samplers = message_parsed.get("samplers", [])
 						self.schedulers = message_parsed.get("schedulers", [])
+						self.framed_files = self.framed_files_requested and message_parsed.get("framed_files", None) == FRAMED_FILES_PROTOCOL
 						self.setStatus(_("Status: Processing workflows, models and loras"))
 
 						if (len(self.workflow_contexts) == 0 or len(self.workflow_categories) == 0):
@@ -529,10 +659,12 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 						self.setStatus(_("Status: {}").format(message_parsed.get('message', _('Unknown status'))))
 					elif message_parsed["type"] == "WORKFLOW_AWAIT":
 						# waiting for the workflow with id, there are "before_this" users before you
-						self.setStatus(_("Status: Waiting for workflow {} to start, there are {} users before you").format(message_parsed.get('workflow_id', _('unknown')), message_parsed.get('before_this', 0)))
+						self.run_before_this = message_parsed.get('before_this', 0)
+						self.setRunStatus(_("Status: Waiting for workflow {} to start, there are {} users before you").format(message_parsed.get('workflow_id', _('unknown')), message_parsed.get('before_this', 0)))
 						self.current_run_id = message_parsed.get('id', None)
 					elif message_parsed["type"] == "WORKFLOW_START":
-						self.setStatus(_("Status: Workflow {} has started").format(message_parsed.get('workflow_id', _('unknown'))))
+						self.run_started_at = time.time()
+						self.setRunStatus(_("Status: Workflow {} has started").format(message_parsed.get('workflow_id', _('unknown'))))
 						self.current_run_id = message_parsed.get('id', None)
 					elif message_parsed["type"] == "FILE":
 						if len(self.next_file) > 0:
@@ -545,6 +677,8 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 									message_parsed.get("action", None),
 									self.selected_image,
 									self.protected_run_mode,
+									self.project_folder,
+									self.get_run_provenance(),
 								)
 							except Exception as e:
 								if self.is_running:
@@ -562,6 +696,9 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 							remove_batch_files(filename, self.project_current_timeline_folder, self.project_is_real)
 					elif message_parsed["type"] == "WORKFLOW_FINISHED":
 						self.current_run_id = None
+						if not message_parsed["error"]:
+							self.record_run_stats()
+						self.run_status_base = None
 						if self.is_running:
 							if message_parsed["error"]:
 								self.mark_as_running(False, _("Status: Workflow finished with error: {}").format(message_parsed.get('error_message', _('No message provided'))), error=True)
@@ -586,7 +723,7 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 								if total.is_integer():
 									total = int(total)
 
-							self.setStatus(_("Status: Running {} ({}/{})").format(node_name, progress, total))
+							self.setRunStatus(_("Status: Running {} ({}/{})").format(node_name, progress, total))
 					elif message_parsed["type"] == "SET_CONFIG_VALUE":
 						field = message_parsed.get("field", None)
 						value = message_parsed.get("value", None)
@@ -616,6 +753,7 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 								else:
 									current_config_working_with = next_config
 
+							break_hardlink(timeline_config_path, keep_contents=False)
 							with open(timeline_config_path, "w") as f:
 								json.dump(current_config, f, indent=4)
 					elif message_parsed["type"] == "USE_AS_FRAMES":
@@ -635,6 +773,103 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 
 			MESSAGE_LOCK.release()
 
+		def on_framed_message(self, msg):
+			try:
+				header, payload = decode_framed_message(msg)
+			except Exception as e:
+				self.setStatus(_("Error: Received invalid framed message from server {}").format(str(e)), error=True)
+				return
+
+			if header.get("type", None) != "FILE":
+				self.setStatus(_("Status: Unknown framed message type received: {}").format(header.get("type", None)))
+				return
+
+			try:
+				handle_project_file(
+					self.project_current_timeline_folder,
+					self.project_is_real,
+					payload,
+					header.get("action", None),
+					self.selected_image,
+					self.protected_run_mode,
+					self.project_folder,
+					self.get_run_provenance(),
+				)
+			except Exception as e:
+				if self.is_running:
+					self.mark_as_running(False, _("Error: Failed to write received file from server {}").format(str(e)), error=True)
+				else:
+					self.setStatus(_("Error: Failed to write received file from server {}").format(str(e)), error=True)
+
+		def get_run_provenance(self):
+			if not self.project_is_real or self.project_file_contents is None or self.run_uid is None:
+				return None
+			return {
+				"run_uid": self.run_uid,
+				"run_id": self.current_run_id,
+				"workflow_id": self.run_stats_workflow_id,
+				"timeline_id": self.project_file_contents.get("current_timeline", None),
+				"values": self.run_values,
+				"submitted_at": self.run_submitted_at,
+				"started_at": self.run_started_at,
+			}
+
+		def setRunStatus(self, v: str):
+			# same as setStatus but appends the estimated time left based on the
+			# history of similar runs, the ETA timer calls this again every second
+			self.run_status_base = v
+			self.setStatus(v + self.get_run_eta_text())
+
+		def get_run_eta_text(self):
+			if self.run_stats is None or self.run_stats_key is None:
+				return ""
+			estimate = self.run_stats.get_estimate(self.run_stats_key)
+			if estimate is None:
+				return ""
+
+			now = time.time()
+			if self.run_started_at is not None:
+				elapsed = now - self.run_started_at
+				remaining = estimate["exec_p50"] - elapsed
+				if remaining < 0:
+					# we are past the usual time, so we compare against the slow runs instead
+					remaining = estimate["exec_p95"] - elapsed
+					if remaining < 0:
+						return _(" - taking longer than usual ({} so far)").format(format_duration(elapsed))
+				return _(" - ETA: ~{}").format(format_duration(remaining))
+			elif self.run_submitted_at is not None:
+				waited = now - self.run_submitted_at
+				remaining_queue = max(0, (estimate["queue_p50"] or 0) - waited)
+				# we do not know what the users before us are running, so we assume
+				# it takes about as long as our own run
+				remaining_queue = max(remaining_queue, self.run_before_this * estimate["exec_p50"])
+				return _(" - ETA: ~{}").format(format_duration(remaining_queue + estimate["exec_p50"]))
+			return ""
+
+		def on_run_eta_tick(self):
+			if not self.is_running or self.run_status_base is None:
+				self.run_eta_timeout_id = None
+				return False
+			self.setRunStatus(self.run_status_base)
+			return True
+
+		def get_current_run_stats_key(self):
+			key_params = {}
+			for element in self.workflow_elements_all:
+				value = element.get_run_stats_key(resolution_mode=self.resolution_mode)
+				if value is not None:
+					key_params[element.id] = value
+			return make_run_stats_key(f"{self.apihost}:{self.apiport}", self.workflow_selector.get_active_id(), key_params)
+
+		def record_run_stats(self):
+			if self.run_stats is None or self.run_stats_key is None or self.run_started_at is None:
+				return
+			queue_seconds = None
+			if self.run_submitted_at is not None:
+				queue_seconds = self.run_started_at - self.run_submitted_at
+			exec_seconds = time.time() - self.run_started_at
+			self.run_stats.record(self.run_stats_key, self.run_stats_workflow_id, queue_seconds, exec_seconds)
+
 		def refresh_image_list(self, recreate_list: bool):
 			if self.errored:
 				return
@@ -646,37 +881,46 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 
 			if (recreate_list):
 				# we are going to recreate the list of images available in GIMP
-				#self.image_selector.remove_all()
 				available_ids = []
-				# the store is a list of string, string, and a pixbuf for the image
-				self.image_model = self.image_selector.get_model() or Gtk.ListStore(int, str, Pixbuf)  # ID, Name, Preview
+				rows = []
+				thumbnails_changed = False
+				new_thumbnail_cache = {}
 				for img in Gimp.get_images():
-					available_ids.append(img.get_id())
 					option_id = img.get_id()
-					
-					# check if the image_selector_model already has this id
-					# if not, then we add it, otherwise we will update the preview
-					modified = False
-					for row in self.image_model:
-						if row[0] == option_id:
-							# update the preview
-							image_preview = img.get_thumbnail(128,128,Gimp.PixbufTransparency.KEEP_ALPHA)
-							row[2] = image_preview
-							modified = True
-							break
-					if not modified:
-						name_id = img.get_name()
+					available_ids.append(option_id)
+
+					# thumbnails are only regenerated when the image revision changes, getting them
+					# is what makes refocusing the dialog slow when there are many big images open
+					revision = get_image_revision(img)
+					cached = self.image_thumbnail_cache.get(option_id, None)
+					if cached is not None and cached[0] == revision:
+						image_preview = cached[1]
+					else:
 						image_preview = img.get_thumbnail(128,128,Gimp.PixbufTransparency.KEEP_ALPHA)
-						self.image_model.append([option_id, name_id, image_preview])
-
-				# find if there are images that are no longer available and remove them from the list
-				rows_to_remove = [row.iter for row in self.image_model if row[0] not in available_ids]
-				for row_iter in rows_to_remove:
-					self.image_model.remove(row_iter)
+						thumbnails_changed = True
+					new_thumbnail_cache[option_id] = (revision, image_preview)
+					rows.append([option_id, img.get_name(), image_preview])
+
+				# forget the images that have been closed
+				self.image_thumbnail_cache = new_thumbnail_cache
+
+				current_model = self.image_selector.get_model()
+				rows_changed = (
+					current_model is None or
+					thumbnails_changed or
+					[(row[0], row[1]) for row in current_model] != [(row[0], row[1]) for row in rows]
+				)
 
-				if (not self.image_selector.get_model()):
-					self.image_selector.set_model(self.image_model)
+				if rows_changed:
+					# we build the whole new model at once and swap it in, rather than updating
+					# row by row which makes every open combo box redraw on every change
+					# the store is a list of int, string, and a pixbuf for the image
+					new_model = Gtk.ListStore(int, str, Pixbuf)  # ID, Name, Preview
+					for row in rows:
+						new_model.append(row)
+					self.set_image_model(new_model, current_image_id if current_image_id in available_ids else None)
 
+				if (current_model is None):
 					renderer_pixbuf = Gtk.CellRendererPixbuf()
 					renderer_text = Gtk.CellRendererText()
 
@@ -703,16 +947,44 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 				for element in self.workflow_elements_all:
 					element.current_image_changed(self.selected_image, self.image_selector.get_model())
 
+		def set_image_model(self, new_model, active_image_id):
+			# setting the model triggers the changed signal with nothing selected, we do not want
+			# that to be taken as the user deselecting the image
+			self.swapping_image_model = True
+			try:
+				self.image_selector.set_model(new_model)
+				self.image_model = new_model
+				if active_image_id is not None:
+					set_active_image_id(self.image_selector, active_image_id)
+			finally:
+				self.swapping_image_model = False
+
+			for element in self.workflow_elements_all:
+				element.image_model_changed(new_model)
+
+			if hasattr(self, "project_dialog") and self.project_dialog is not None:
+				self.project_dialog.image_model = new_model
+
+		def on_image_selector_changed(self, combo):
+			if self.swapping_image_model:
+				return
+			self.refresh_image_list(False)
+
 		def build_ui_base(self):
 			if self.errored:
 				return
 			
 			self.image_selector = Gtk.ComboBox()
 			self.refresh_image_list(True)
-			self.image_selector.connect("changed", lambda combo: self.refresh_image_list(False))
+			self.image_selector.connect("changed", self.on_image_selector_changed)
 			self.main_box.pack_start(self.image_selector, False, False, 0)
 
 			self.image_selector.set_tooltip_text(_("Select the image to work with"))
+
+			# from now on we only refresh what changed in the open images
+			self.image_change_tracker.poll(self.get_shown_image_ids())
+			if self.image_changes_poll_timeout_id is None:
+				self.image_changes_poll_timeout_id = GLib.timeout_add(IMAGE_CHANGES_POLL_INTERVAL, self.on_image_changes_poll)
 			
 			# lets start with the basics and make a selector for the contexts
 			self.context_selector = Gtk.ComboBoxText()
@@ -748,34 +1020,43 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 
 			self.calculate_special_workflows()
 
-			self.half_size_checkbox = Gtk.CheckButton(label=_("Use Half Size"))
-			self.half_size_checkbox.set_tooltip_text(_("If enabled, the workflow will be run at half the size of the original image, this can help speed up processing at the cost of quality"))
-			self.main_box.pack_start(self.half_size_checkbox, False, False, 0)
+			self.resolution_selector = Gtk.ComboBoxText()
+			for mode_id, mode_label, _factor, _budget in RESOLUTION_MODES:
+				self.resolution_selector.append(mode_id, mode_label)
+			self.resolution_selector.set_tooltip_text(_("The resolution the workflow will be run at, a smaller size or a megapixel budget can help speed up processing at the cost of quality, results are scaled back to the image size"))
+			self.main_box.pack_start(self.resolution_selector, False, False, 0)
 
-			# set enabled or disabled based on the last default config
-			half_size_default = get_aihub_common_property_value("", "", "default_half_size", False)
-			self.half_size_checkbox.set_active(half_size_default)
+			# set the mode based on the last default config, older configs only had the half size toggle
+			resolution_mode_default = get_aihub_common_property_value("", "", "default_resolution_mode", False)
+			if resolution_mode_default is None or get_resolution_mode(resolution_mode_default) is None:
+				half_size_default = get_aihub_common_property_value("", "", "default_half_size", False)
+				resolution_mode_default = "half" if half_size_default else DEFAULT_RESOLUTION_MODE
+			self.resolution_selector.set_active_id(resolution_mode_default)
 
-			self.half_size_coords_checkbox = Gtk.CheckButton(label=_("Use Half Size Layer Coordinates"))
-			self.half_size_coords_checkbox.set_tooltip_text(_("If enabled, the positions of layers added to the image will be also adjusted for half size processing, this is useful when using half size processing to ensure layers are placed correctly"))
-			self.main_box.pack_start(self.half_size_coords_checkbox, False, False, 0)
+			self.scale_coords_checkbox = Gtk.CheckButton(label=_("Scale Layer Coordinates"))
+			self.scale_coords_checkbox.set_tooltip_text(_("If enabled, the positions of layers added to the image will be also adjusted for the selected resolution, this is useful when not using the full size to ensure layers are placed correctly"))
+			self.main_box.pack_start(self.scale_coords_checkbox, False, False, 0)
 
 			# set enabled or disabled based on the last default config
-			half_size_coords_default = get_aihub_common_property_value("", "", "default_half_size_coords", False)
-			self.half_size_coords_checkbox.set_active(half_size_coords_default)
+			scale_coords_default = get_aihub_common_property_value("", "", "default_scale_coords", False)
+			if scale_coords_default is None:
+				scale_coords_default = get_aihub_common_property_value("", "", "default_half_size_coords", False)
+			self.scale_coords_checkbox.set_active(bool(scale_coords_default))
 
-			if half_size_default:
-				self.set_half_size(True)
-			else:
-				self.set_half_size(False)
+			self.set_resolution_mode(resolution_mode_default)
+			self.set_scale_coords(bool(scale_coords_default))
 
-			if half_size_coords_default:
-				self.set_half_size_coords(True)
-			else:
-				self.set_half_size_coords(False)
+			self.scale_coords_checkbox.connect("toggled", self.on_scale_coords_toggled)
+			self.resolution_selector.connect("changed", self.on_resolution_mode_changed)
+
+			self.tiled_mode_checkbox = Gtk.CheckButton(label=_("Process in Tiles"))
+			self.tiled_mode_checkbox.set_tooltip_text(_("If enabled, big images (or the selection) are split in overlapping tiles that are processed as separate runs at full resolution and blended back together, only for workflows that use the merged image"))
+			self.main_box.pack_start(self.tiled_mode_checkbox, False, False, 0)
 
-			self.half_size_coords_checkbox.connect("toggled", self.on_half_size_coords_toggled)
-			self.half_size_checkbox.connect("toggled", self.on_half_size_toggled)
+			tiled_mode_default = get_aihub_common_property_value("", "", "default_tiled_mode", False)
+			self.tiled_mode_checkbox.set_active(bool(tiled_mode_default))
+			self.tiled_mode = bool(tiled_mode_default)
+			self.tiled_mode_checkbox.connect("toggled", self.on_tiled_mode_toggled)
 
 			# we are also going to make some label text display to display
 			# the description
@@ -829,30 +1110,37 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 
 			self.on_context_selected(self.context_selector)
 
-		def on_half_size_toggled(self, checkbox):
-			is_active = checkbox.get_active()
-			self.set_half_size(is_active)
+		def on_resolution_mode_changed(self, combo):
+			mode_id = combo.get_active_id()
+			if mode_id is None:
+				return
+			self.set_resolution_mode(mode_id)
 
-			update_aihub_common_property_value("", "", "default_half_size", is_active, self.project_saved_config_json_file)
+			update_aihub_common_property_value("", "", "default_resolution_mode", mode_id, self.project_saved_config_json_file)
 
-		def set_half_size(self, half_size: bool):
-			self.half_size = half_size
+		def set_resolution_mode(self, mode_id: str):
+			self.resolution_mode = mode_id
 
-			if half_size:
-				# if half size is enabled, we also enable half size coords
-				self.half_size_coords_checkbox.set_sensitive(True)
+			if mode_id != "full":
+				# if we are not at full size, the coords can be scaled too
+				self.scale_coords_checkbox.set_sensitive(True)
 			else:
-				# if half size is disabled, we also disable half size coords
-				self.half_size_coords_checkbox.set_sensitive(False)
+				# at full size there is nothing to scale
+				self.scale_coords_checkbox.set_sensitive(False)
 
-		def on_half_size_coords_toggled(self, checkbox):
+		def on_scale_coords_toggled(self, checkbox):
 			is_active = checkbox.get_active()
-			self.set_half_size_coords(is_active)
+			self.set_scale_coords(is_active)
 
-			update_aihub_common_property_value("", "", "default_half_size_coords", is_active, self.project_saved_config_json_file)
+			update_aihub_common_property_value("", "", "default_scale_coords", is_active, self.project_saved_config_json_file)
 		
-		def set_half_size_coords(self, half_size_coords: bool):
-			self.half_size_coords = half_size_coords
+		def set_scale_coords(self, scale_coords: bool):
+			self.scale_coords = scale_coords
+
+		def on_tiled_mode_toggled(self, checkbox):
+			self.tiled_mode = checkbox.get_active()
+
+			update_aihub_common_property_value("", "", "default_tiled_mode", self.tiled_mode, self.project_saved_config_json_file)
 
 		def setup_project_ui(self):
 			if self.errored:
@@ -1091,6 +1379,7 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 					"usehttps": self.apiprotocol == "wss",
 					"host": self.apihost,
 					"port": self.apiport,
+					"framed_files": self.framed_files,
 				}
 
 				for expose_id, widget in exposes.items():
@@ -1258,7 +1547,8 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 					if element.get_widget():
 						element.after_ui_built(self.workflow_elements_all)
 
-				self.on_dialog_focus(None, None)
+				# the new elements know nothing yet about the images, so they all get refreshed
+				self.refresh_all_elements()
 			except Exception as e:
 				self.setStatus(_("Error: {}").format(str(e)), error=True)
 				self.setErrored()
@@ -1327,10 +1617,14 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 				dialog.connect("response", lambda d, r: d.destroy())
 				return
 			
+			# every image expose scales its upload for this mode from its own size
+			self.run_resolution_mode = self.resolution_mode
+			self.run_scale_factor = NO_SCALE
+
 			conditions = workflow.get("conditions", [])
 			for condition in conditions:
 				evaluator = ConditionEvaluator(condition)
-				valid = evaluator.evaluate(self.workflow_elements_all, self.half_size, self.half_size_coords)
+				valid = evaluator.evaluate(self.workflow_elements_all, self.run_resolution_mode, self.scale_coords)
 				if not valid:
 					dialog = Gtk.MessageDialog(
 						transient_for=self,
@@ -1347,7 +1641,45 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 					# make it close once you click ok, and also call mark_as_running(False)
 					dialog.connect("response", lambda d, r: d.destroy())
 					return
+
+			self.run_stats_key = self.get_current_run_stats_key()
+			self.run_stats_workflow_id = selected_workflow
+			# groups the files of this run in the provenance index
+			self.run_uid = uuid.uuid4().hex
+			self.run_values = None
+			self.run_submitted_at = None
+			self.run_started_at = None
+			self.run_before_this = 0
+
+			# warn the user if similar runs have been very slow before, we do not bother
+			# in continuous mode since the user already accepted the first run
+			estimate = self.run_stats.get_estimate(self.run_stats_key) if self.run_stats is not None else None
+			if (
+				estimate is not None and
+				not self.continuous_mode and
+				self.expensive_run_warning_seconds > 0 and
+				estimate["exec_p95"] >= self.expensive_run_warning_seconds
+			):
+				dialog = Gtk.MessageDialog(
+					transient_for=self,
+					flags=0,
+					message_type=Gtk.MessageType.WARNING,
+					buttons=Gtk.ButtonsType.YES_NO,
+					text=_("This workflow may take a long time"),
+				)
+				dialog.format_secondary_text(_("Similar runs took about {} and up to {} to complete. Do you want to run it anyway?").format(format_duration(estimate["exec_p50"]), format_duration(estimate["exec_p95"])))
+				dialog.set_modal(True)
+				dialog.set_keep_above(True)
+				response = dialog.run()
+				dialog.destroy()
+				if response != Gtk.ResponseType.YES:
+					return
 			
+			# tiled runs send the image at full resolution, one run per tile
+			tile_element = self.get_tile_element(workflow) if self.tiled_mode else None
+			if tile_element is not None:
+				self.run_resolution_mode = None
+
 			self.mark_as_running(True)
 
 			workflow_is_init = workflow.get("project_type_init", False)
@@ -1422,10 +1754,17 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 			try:
 				# we are going to gather all the values
 				values = {}
+				# the results are brought back with the factor the first image that was sent
+				# was scaled by, in most workflows that is the image they were made from
+				result_scale_factor = None
 				for element in self.workflow_elements_all:
+					if element is tile_element:
+						# every tile is uploaded on its own by the tiled run
+						values[element.id] = element.get_value()
+						continue
 					websocket_relegator = WsRelegator()
 					self.websocket_relegator = websocket_relegator
-					status = element.upload_binary(self.websocket, self.websocket_relegator, half_size=self.half_size)
+					status = element.upload_binary(self.websocket, self.websocket_relegator, resolution_mode=self.run_resolution_mode)
 					self.websocket_relegator = None
 					if (status is False or type(status) is str):
 						self.mark_as_running(False)
@@ -1434,15 +1773,27 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 						else:
 							self.setStatus(_("Error: Failed to upload binary data"), error=True)
 						return
-					values[element.id] = element.get_value(half_size=self.half_size, half_size_coords=self.half_size_coords)
+					values[element.id] = element.get_value(resolution_mode=self.run_resolution_mode, scale_coords=self.scale_coords)
+					if result_scale_factor is None and getattr(element, "uploaded_file_path", None) is not None:
+						result_scale_factor = element.get_scale_factor(self.run_resolution_mode)
+				self.run_scale_factor = result_scale_factor or NO_SCALE
+
+				if tile_element is not None:
+					self.start_tiled_run(tile_element, values)
+					return
 
 				workflow_operation = {
 					"type": "WORKFLOW_OPERATION",
 					"workflow_id": self.workflow_selector.get_active_id(),
 					"expose": values
 				}
+				self.run_values = values
 
+				self.run_submitted_at = time.time()
 				self.websocket.send(json.dumps(workflow_operation))
+
+				if self.run_eta_timeout_id is None:
+					self.run_eta_timeout_id = GLib.timeout_add(1000, self.on_run_eta_tick)
 			except Exception as e:
 				self.setStatus(_("Error: {}").format(str(e)), error=True)
 				self.setErrored()
@@ -1450,12 +1801,141 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 
 			return
 		
+		def get_tile_element(self, workflow):
+			# tiling only makes sense for plain image workflows, project workflows keep their files
+			# in the project and their results can not be stitched
+			if workflow.get("project_type", None) is not None or workflow.get("project_type_init", False):
+				return None
+			for element in self.workflow_elements_all:
+				if (
+					isinstance(element, AIHubExposeImage) and
+					element.is_using_internal_file() and
+					element.data.get("type", "upload") == "merged_image" and
+					element.selected_image is not None
+				):
+					return element
+			return None
+
+		def start_tiled_run(self, tile_element, values):
+			image = tile_element.selected_image
+			region = get_tiling_region(image)
+			tiles = compute_tiles(region[2], region[3], self.tile_size, self.tile_overlap)
+
+			tiles_folder = get_scratch_session().new_entry(f"aihub_tiles_{uuid.uuid4().hex}", large=True, folder=True)
+			tile_files = export_image_tiles(image, region, tiles, tiles_folder)
+
+			self.tiled_run = TiledRun(
+				f"{self.apiprotocol}://{self.apihost}:{self.apiport}/ws",
+				self.get_websocket_header(),
+				{"cert_reqs": ssl.CERT_NONE} if self.apiprotocol == "wss" else None,
+				self.workflow_selector.get_active_id(),
+				values,
+				tile_element.id,
+				tiles,
+				tile_files,
+				max_parallel=self.max_parallel_tiles,
+				framed_files_requested=self.framed_files_requested,
+				on_progress=self.on_tiled_run_progress,
+			)
+			self.cancel_run_button.set_sensitive(True)
+			self.setStatus(_("Status: Processing {} tiles, up to {} at the same time").format(len(tiles), min(self.max_parallel_tiles, len(tiles))))
+			threading.Thread(
+				target=self.run_tiled_in_background,
+				args=(self.tiled_run, image, region, tiles, tiles_folder),
+				daemon=True,
+			).start()
+
+		def on_tiled_run_progress(self, finished_count, total_count):
+			self.setStatus(_("Status: Processed {} of {} tiles").format(finished_count, total_count))
+
+		def run_tiled_in_background(self, tiled_run, image, region, tiles, tiles_folder):
+			try:
+				results = tiled_run.run()
+
+				# we keep the first image that came back for every tile
+				result_files = []
+				for tile, files in zip(tiles, results):
+					image_files = [data for file_message, data in files if (file_message.get("action", None) or {}).get("action", None) in ("NEW_LAYER", "NEW_IMAGE")]
+					if len(image_files) == 0:
+						raise Exception(_("Tile {} did not return an image").format(tile["index"]))
+					result_file = os.path.join(tiles_folder, f"result_{tile['index']}.png")
+					with open(result_file, "wb") as f:
+						f.write(image_files[0])
+					result_files.append(result_file)
+
+				pixels = None
+				if can_blend_tiles():
+					self.setStatus(_("Status: Blending {} tiles").format(len(tiles)))
+					tile_pixels = [load_tile_pixels(result_file) for result_file in result_files]
+					# workflows that upscale return bigger tiles, everything is blended at their scale
+					scale = tile_pixels[0].shape[1] / tiles[0]["width"]
+					pixels = blend_tiles(region[2], region[3], tiles, tile_pixels, scale)
+
+				GLib.idle_add(self.finish_tiled_run, image, region, tiles, pixels, result_files, tiles_folder)
+			except Exception as e:
+				get_scratch_session().release(tiles_folder, delete=True)
+				self.tiled_run = None
+				self.mark_as_running(False, _("Status: Tiled run failed: {}").format(str(e)), error=True)
+
+		def finish_tiled_run(self, image, region, tiles, pixels, result_files, tiles_folder):
+			try:
+				region_x, region_y, region_width, region_height = region
+				name = _("AI Hub Tiled Layer")
+				if pixels is not None and (pixels.shape[1] != region_width or pixels.shape[0] != region_height):
+					# the workflow changed the size (eg. an upscale) so the result goes to its own image
+					new_image = Gimp.Image.new(pixels.shape[1], pixels.shape[0], Gimp.ImageBaseType.RGB)
+					layer = Gimp.Layer.new(new_image, name, pixels.shape[1], pixels.shape[0], Gimp.ImageType.RGBA_IMAGE, 100, Gimp.LayerMode.NORMAL)
+					new_image.insert_layer(layer, None, 0)
+					write_layer_pixels(layer, pixels)
+					Gimp.Display.new(new_image)
+				elif pixels is not None:
+					image.undo_group_start()
+					try:
+						layer = Gimp.Layer.new(image, name, region_width, region_height, Gimp.ImageType.RGBA_IMAGE, 100, Gimp.LayerMode.NORMAL)
+						image.insert_layer(layer, None, 0)
+						write_layer_pixels(layer, pixels)
+						layer.set_offsets(region_x, region_y)
+						# toggles visibility, so it belongs in the undo group
+						refresh_image_after_new_layers(image, [layer])
+					finally:
+						image.undo_group_end()
+				else:
+					# without numpy we can not blend, so every tile becomes a layer in a group
+					image.undo_group_start()
+					try:
+						group = Gimp.GroupLayer.new(image, name)
+						image.insert_layer(group, None, 0)
+						for tile, result_file in zip(tiles, result_files):
+							layer = load_file_as_layer(image, result_file, _("Tile {}").format(tile["index"]))
+							image.insert_layer(layer, group, 0)
+							layer.set_offsets(region_x + tile["x"], region_y + tile["y"])
+						refresh_image_after_new_layers(image, [group])
+					finally:
+						image.undo_group_end()
+			except Exception as e:
+				self.tiled_run = None
+				self.mark_as_running(False, _("Status: Tiled run failed: {}").format(str(e)), error=True)
+				return False
+			finally:
+				get_scratch_session().release(tiles_folder, delete=True)
+
+			self.tiled_run = None
+			self.mark_as_running(False, _("Status: Tiled run finished successfully; ready for another run"))
+			return False
+
 		def on_cancel_run_workflow(self, button=None):
 			if self.errored:
 				return
 			
 			self.continuous_mode = False
 			
+			if self.tiled_run is not None:
+				# the tiled run cancels the runs of all its tiles
+				self.cancel_run_button.set_sensitive(False)
+				self.cancel_run_button.set_label(_("Cancelling..."))
+				self.tiled_run.cancel()
+				return
+
 			# literally not running or we haven't received a run id
 			# either this is going slow or something odd is happening
 			# either way without this id we can't really cancel anything
@@ -1497,6 +1977,12 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 					if element.get_widget():
 						element.get_widget().set_sensitive(not running)
 
+				if not running:
+					self.run_status_base = None
+					if self.run_eta_timeout_id is not None:
+						GLib.source_remove(self.run_eta_timeout_id)
+						self.run_eta_timeout_id = None
+
 				messageToShow = messageOverride if messageOverride is not None else (_("Status: Running workflow...") if running else _("Status: Ready"))
 				self.setStatus(messageToShow, error=error)
 				if not running and not self.continuous_mode:
@@ -1508,7 +1994,7 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 					self.on_dialog_focus(None, None)
 
 				if not running and not error:
-					process_last_collected_files(self.selected_image, self.project_is_real, self.half_size, self.half_size_coords)
+					process_last_collected_files(self.selected_image, self.project_is_real, self.run_scale_factor, self.scale_coords)
 				elif not running and error and self.project_is_real and not self.protected_run_mode:
 					self.rollback_timeline_to_last_valid_state()
 
@@ -1544,20 +2030,27 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 			self.setStatus(_("Error: {}").format(str(error)), error=True)
 			self.setErrored()
 
+		def get_websocket_header(self):
+			return {
+				"api-key": self.apikey,
+				"client": "gimp",
+				# add current locale
+				"locale": locale.getlocale()[0] if locale.getlocale() and locale.getlocale()[0] else "en",
+			}
+
 		def start_websocket(self):
 			try:
+				header = self.get_websocket_header()
+				if self.framed_files_requested:
+					# the server tells us in INFO_LIST if it accepted it
+					header["framing"] = FRAMED_FILES_PROTOCOL
 				self.websocket = websocket.WebSocketApp(
 					f"{self.apiprotocol}://{self.apihost}:{self.apiport}/ws",
 					on_message=self.on_message,
 					on_open=self.on_open,
 					on_close=self.on_close,
 					on_error=self.on_error,
-					header={
-						"api-key": self.apikey,
-						"client": "gimp",
-						# add current locale
-						"locale": locale.getlocale()[0] if locale.getlocale() and locale.getlocale()[0] else "en",
-					},
+					header=header,
 				)
 				self.websocket.run_forever(
 					sslopt={"cert_reqs": ssl.CERT_NONE} if self.apiprotocol == "wss" else None,
@@ -1586,6 +2079,33 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 
 			self.current_run_id: str = None
 
+			# single frame file transfers, see framing.py
+			self.framed_files_requested: bool = False
+			self.framed_files: bool = False
+
+			# run history used to estimate how long a run is going to take
+			self.run_stats: RunStatsStore = None
+			self.run_stats_key: str = None
+			self.run_stats_workflow_id: str = None
+			self.run_submitted_at: float = None
+			self.run_started_at: float = None
+			self.run_uid: str = None
+			self.run_values = None
+			self.run_before_this: int = 0
+			self.run_status_base: str = None
+			self.run_eta_timeout_id = None
+			self.expensive_run_warning_seconds: float = 0
+
+			# tiled processing of big images, see tiling.py
+			self.tiled_mode = False
+			self.tiled_run = None
+			self.tile_size = DEFAULT_TILE_SIZE
+			self.tile_overlap = DEFAULT_TILE_OVERLAP
+			self.max_parallel_tiles = DEFAULT_MAX_PARALLEL_TILES
+
+			# how branched timelines get the files of their parent, see projectstorage.py
+			self.timeline_branch_method = DEFAULT_BRANCH_METHOD
+
 			self.workflows = {}
 			self.workflow_contexts = []
 			self.workflow_categories = []
@@ -1599,6 +2119,21 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 
 			self.selected_image = None
 
+			# image id to (revision, thumbnail) for the image selector
+			self.image_thumbnail_cache = {}
+			self.swapping_image_model = False
+
+			# keeps track of what changed in the open images so we only refresh what needs it
+			self.image_change_tracker = ImageChangeTracker()
+			self.image_changes_poll_timeout_id = None
+
+			# the resolution mode picked in the ui, the one of the current run, and the scale
+			# factor the image its results are brought back with was sent at
+			self.resolution_mode = DEFAULT_RESOLUTION_MODE
+			self.scale_coords = False
+			self.run_resolution_mode = None
+			self.run_scale_factor = NO_SCALE
+
 			# elements of the main UI
 			self.image_selector: Gtk.ComboBox
 			self.image_model: Gtk.ListStore
@@ -1620,6 +2155,8 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 
 			# eg the ./myproject.aihubproj
 			self.project_file = None
+			# journals and coalesces the writes to the project file, see projectjournal.py
+			self.project_file_writer = None
 			# eg. ./myproject/
 			self.project_folder = uuid.uuid4().hex
 			self.project_is_real = False
@@ -1840,6 +2377,22 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 				self.apiport = config.get("api", "port")
 				self.apiprotocol = config.get("api", "protocol")
 				self.apikey = config.get("api", "apikey")
+				self.framed_files_requested = config.getboolean("api", "framed_files", fallback=False)
+
+				self.expensive_run_warning_seconds = config.getfloat("runs", "expensive_run_warning_seconds", fallback=0)
+				self.tile_size = config.getint("tiling", "tile_size", fallback=DEFAULT_TILE_SIZE)
+				self.tile_overlap = config.getint("tiling", "tile_overlap", fallback=DEFAULT_TILE_OVERLAP)
+				self.max_parallel_tiles = config.getint("tiling", "max_parallel_tiles", fallback=DEFAULT_MAX_PARALLEL_TILES)
+				self.timeline_branch_method = config.get("projects", "timeline_branch_method", fallback=DEFAULT_BRANCH_METHOD)
+				if self.timeline_branch_method not in BRANCH_METHODS:
+					self.timeline_branch_method = DEFAULT_BRANCH_METHOD
+				configure_scratch(
+					config.getint("scratch", "max_size_mb", fallback=DEFAULT_SCRATCH_MAX_BYTES // 1024 // 1024) * 1024 * 1024,
+					config.getboolean("scratch", "use_tmpfs", fallback=DEFAULT_SCRATCH_USE_TMPFS),
+				)
+				# temporary files of GIMP sessions that did not exit cleanly
+				cleanup_stale_sessions_in_background()
+				self.run_stats = RunStatsStore()
 
 				self.setStatus(_("Status: Communicating at {}://{}:{}").format(self.apiprotocol, self.apihost, self.apiport))
 
@@ -2061,6 +2614,12 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 			if hasattr(self, "project_dialog") and self.project_dialog is not None:
 				self.project_dialog.cleanup()
 
+			# remove the downscaled inputs we kept around for the runs
+			PROXY_CACHE.clear()
+
+			# pending project changes are written and the journal folded into the project file
+			self.close_project_file_writer()
+
 			self.destroy()
 			Gtk.main_quit()
 			lock_socket.close()
@@ -2121,43 +2680,51 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 				self.showErrorDialog(_("Error"), _("Project folder {} does not exist").format(project_folder))
 				return
 
+			# whatever the previous project still had pending is written before switching
+			self.close_project_file_writer()
+
 			try:
-				with open(project_file_path, "r") as f:
-					project_absolute_config = json.load(f)
-					if not isinstance(project_absolute_config, dict):
-						raise Exception(_("Invalid project file format"))
-					self.project_folder = project_folder
-					self.project_is_real = True
-					self.project_file = project_file_path
-					self.project_file_contents = project_absolute_config
-					current_timeline_id = self.project_file_contents.get("current_timeline", None)
-					if current_timeline_id is None:
-						for timeline in self.project_file_contents.get("timelines", {}).values():
-							if timeline.get("initial", False):
-								current_timeline_id = timeline.get("id", None)
-								break
-					if current_timeline_id is None:
-						self.project_current_timeline_folder = None
-					else:
-						self.project_current_timeline_folder = os.path.join(self.project_folder, "timelines", current_timeline_id)
-					if self.project_current_timeline_folder is not None and not os.path.isdir(self.project_current_timeline_folder):
-						raise Exception(_("Invalid project file format: current timeline folder does not exist"))
-					self.project_saved_config_json_file = os.path.join(self.project_folder, "saved.json")
-					# Ensure the saved config file exists
-					if not os.path.isfile(self.project_saved_config_json_file):
-						raise Exception(_("Invalid project file format: saved.json file does not exist"))
-					
-					# check that is is a valid json file
-					with open(self.project_saved_config_json_file, "r") as sf:
-						saved_config = json.load(sf)
-						if not isinstance(saved_config, dict):
-							raise Exception(_("Invalid saved.json file format"))
-
-					self.setStatus(_("Status: Opened project {}").format(self.project_file_contents.get('project_name', _('Unknown'))))
-					if hasattr(self, "category_selector") and self.category_selector is not None:
-						self.on_category_selected(self.category_selector)
-					if not quiet:
-						self.on_project_opened()
+				project_absolute_config, replayed_entries = load_project_file(project_file_path)
+				if not isinstance(project_absolute_config, dict):
+					raise Exception(_("Invalid project file format"))
+				self.project_folder = project_folder
+				self.project_is_real = True
+				self.project_file = project_file_path
+				self.project_file_contents = project_absolute_config
+				self.project_file_writer = ProjectFileWriter(project_file_path, project_absolute_config, on_error=self.on_project_file_write_error)
+				if replayed_entries > 0:
+					print("Replayed {} project journal entries".format(replayed_entries))
+				# changes left in the journal by the last session go into the project file now,
+				# this also drops a last entry that was cut short
+				self.project_file_writer.compact()
+				current_timeline_id = self.project_file_contents.get("current_timeline", None)
+				if current_timeline_id is None:
+					for timeline in self.project_file_contents.get("timelines", {}).values():
+						if timeline.get("initial", False):
+							current_timeline_id = timeline.get("id", None)
+							break
+				if current_timeline_id is None:
+					self.project_current_timeline_folder = None
+				else:
+					self.project_current_timeline_folder = os.path.join(self.project_folder, "timelines", current_timeline_id)
+				if self.project_current_timeline_folder is not None and not os.path.isdir(self.project_current_timeline_folder):
+					raise Exception(_("Invalid project file format: current timeline folder does not exist"))
+				self.project_saved_config_json_file = os.path.join(self.project_folder, "saved.json")
+				# Ensure the saved config file exists
+				if not os.path.isfile(self.project_saved_config_json_file):
+					raise Exception(_("Invalid project file format: saved.json file does not exist"))
+				
+				# check that is is a valid json file
+				with open(self.project_saved_config_json_file, "r") as sf:
+					saved_config = json.load(sf)
+					if not isinstance(saved_config, dict):
+						raise Exception(_("Invalid saved.json file format"))
+
+				self.setStatus(_("Status: Opened project {}").format(self.project_file_contents.get('project_name', _('Unknown'))))
+				if hasattr(self, "category_selector") and self.category_selector is not None:
+					self.on_category_selected(self.category_selector)
+				if not quiet:
+					self.on_project_opened()
 			except Exception as e:
 				self.showErrorDialog("Error", _("Failed to open project file: {}").format(str(e)))
 				self.close_project_cleanup_data()
@@ -2165,6 +2732,7 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 		def close_project_cleanup_data(self):
 			if self.errored:
 				return
+			self.close_project_file_writer()
 			self.project_file = None
 			self.project_file_contents = None
 			self.project_folder = uuid.uuid4().hex
@@ -2172,6 +2740,23 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 			self.project_current_timeline_folder = uuid.uuid4().hex
 			self.project_saved_config_json_file = None
 
+		def save_project_file(self):
+			# the write happens once the main loop is idle, together with any other change made until then
+			if self.project_file_writer is not None:
+				self.project_file_writer.schedule_write(self.project_file_contents)
+
+		def close_project_file_writer(self):
+			if self.project_file_writer is None:
+				return
+			try:
+				self.project_file_writer.close()
+			except Exception as e:
+				print("Error writing project file:", e)
+			self.project_file_writer = None
+
+		def on_project_file_write_error(self, e):
+			self.setStatus(_("Error: Failed to update project file: {}").format(str(e)), error=True)
+
 		def close_project(self):
 			if self.errored:
 				return
@@ -2204,8 +2789,7 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 				for element in self.workflow_elements_all:
 					element.update_project_current_timeline_path_and_saved_path(self.project_current_timeline_folder, self.project_saved_config_json_file)
 
-				with open(self.project_file, "w") as f:
-					json.dump(self.project_file_contents, f, indent=4)
+				self.save_project_file()
 
 				if self.project_current_timeline_folder is not None and not os.path.isdir(self.project_current_timeline_folder):
 					os.makedirs(self.project_current_timeline_folder)
@@ -2231,8 +2815,7 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 			else:
 				self.project_current_timeline_folder = os.path.join(self.project_folder, "timelines", new_current_timeline)
 
-			with open(self.project_file, "w") as f:
-				json.dump(self.project_file_contents, f, indent=4)
+			self.save_project_file()
 
 			if self.project_current_timeline_folder is not None and not os.path.isdir(self.project_current_timeline_folder):
 				os.makedirs(self.project_current_timeline_folder)
@@ -2272,8 +2855,9 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 			self.project_current_timeline_folder = os.path.join(self.project_folder, "timelines", initial_timeline_id)
 			self.project_saved_config_json_file = os.path.join(self.project_folder, "saved.json")
 
-			with open(self.project_file, "w") as f:
-				json.dump(self.project_file_contents, f, indent=4)
+			self.close_project_file_writer()
+			write_json_atomic(self.project_file, self.project_file_contents)
+			self.project_file_writer = ProjectFileWriter(self.project_file, self.project_file_contents, on_error=self.on_project_file_write_error)
 
 			# make the directory for the project
 			if not os.path.isdir(self.project_folder):
@@ -2309,14 +2893,8 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 				}
 				self.project_file_contents["current_timeline"] = new_timeline_id
 
-				# update the project file
-				try:
-					with open(self.project_file, "w") as f:
-						json.dump(self.project_file_contents, f, indent=4)
-				except Exception as e:
-					self.setStatus(_("Error: Failed to update project file: {}").format(str(e)), error=True)
-					self.setErrored()
-					return
+				# update the project file, together with any other change of this run start
+				self.save_project_file()
 
 				# create the new timeline folder
 				self.project_current_timeline_folder = os.path.join(self.project_folder, "timelines", new_timeline_id)
@@ -2325,13 +2903,14 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 
 				if not is_initial:
 					# now such timeline inherits everything from the previous timeline
-					# so we copy the entire structure into our new timeline folder
+					# so we clone the entire structure into our new timeline folder, the files
+					# are shared with the parent until one of them is written to
 					previous_timeline_id = self.project_file_contents["timelines"][new_timeline_id]["parent_id"]
 					if previous_timeline_id is not None:
 						previous_timeline_folder = os.path.join(self.project_folder, "timelines", previous_timeline_id)
 						try:
 							if os.path.isdir(previous_timeline_folder):
-								shutil.copytree(previous_timeline_folder, self.project_current_timeline_folder, dirs_exist_ok=True)
+								clone_tree_cow(previous_timeline_folder, self.project_current_timeline_folder, self.timeline_branch_method)
 						except Exception as e:
 							self.setStatus(_("Error: Failed to copy timeline data: {}").format(str(e)), error=True)
 							self.setErrored()
@@ -2378,21 +2957,70 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 			current_timeline_folder = os.path.join(self.project_folder, "timelines", current_timeline_id)
 
 			try:
-				if os.path.isdir(current_timeline_folder):
-					shutil.rmtree(current_timeline_folder)
+				get_provenance_index(self.project_folder).remove_timeline(current_timeline_id)
+			except Exception as e:
+				print("Error removing timeline from the provenance index:", e)
+
+			# moved to the trash right away, the files are deleted in the background
+			blob_store = self.get_project_blob_store()
+			try:
+				blob_store.move_to_trash(current_timeline_folder)
 			except Exception as e:
 				self.setStatus(_("Error: Failed to delete timeline data: {}").format(str(e)), error=True)
+			blob_store.collect_garbage_in_background()
 			
 			self.project_file_contents["current_timeline"] = timeline_to_rollback_to
 			self.on_change_project_file(self.project_file_contents)
 	
 		def on_dialog_focus(self, widget, event):
+			if self.errored or self.is_running:
+				return
+			# the user may have been painting while the dialog was not focused, and pixel changes
+			# can not be detected, so the images with unsaved changes are refreshed as well
+			self.check_for_image_changes(include_dirty=True)
+
+		def refresh_all_elements(self):
 			if self.errored or self.is_running:
 				return
 			# call the function in all the workflow_elements_all to notify them that the dialog has been focused
 			self.refresh_image_list(True)
 			for element in self.workflow_elements_all:
 				element.on_refresh()
+			self.image_change_tracker.poll(self.get_shown_image_ids())
+
+		def get_shown_image_ids(self):
+			# the images the dialog and its exposes show, changes to the others do not matter
+			image_ids = set()
+			if self.selected_image is not None and self.selected_image.is_valid():
+				image_ids.add(self.selected_image.get_id())
+			for element in self.workflow_elements_all:
+				image_ids.update(element.get_shown_image_ids())
+			return image_ids
+
+		def check_for_image_changes(self, include_dirty=False):
+			image_list_changed, changed_image_ids = self.image_change_tracker.poll(self.get_shown_image_ids(), include_dirty)
+			if not image_list_changed and len(changed_image_ids) == 0:
+				return
+
+			if image_list_changed:
+				# proxies of closed images can never be used again
+				PROXY_CACHE.evict_closed_images(self.image_change_tracker.image_ids)
+
+			# the image list uses its own thumbnail cache, so only the changed images get new thumbnails
+			self.refresh_image_list(True)
+			for element in self.workflow_elements_all:
+				element.on_images_invalidated(changed_image_ids)
+
+		def on_image_changes_poll(self):
+			if self.errored:
+				self.image_changes_poll_timeout_id = None
+				return False
+			if not self.is_running:
+				try:
+					self.check_for_image_changes()
+				except Exception as e:
+					print("Error checking for image changes:", e)
+			return True
 
 			# refresh the gimp displays, they sometimes get messed up
 			# nope causes gimp to become slow
@@ -2401,6 +3029,10 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 
 		def on_project_opened(self):
 			update_aihub_common_property_value("", "", "last_opened_project", self.project_file, None)
+			if self.project_is_real:
+				# purges what was left in the trash and moves the timelines made before the blob
+				# store existed into it, in the background
+				self.get_project_blob_store().collect_garbage_in_background(adopt_folder=os.path.join(self.project_folder, "timelines"))
 			self.calculate_special_workflows()
 			for element in self.workflow_elements_all:
 				element.update_project_current_timeline_path_and_saved_path(self.project_current_timeline_folder, self.project_saved_config_json_file)
@@ -2409,6 +3041,20 @@ def runToolsProcedure(procedure, run_mode, image, drawables, config, run_data):
 			else:
 				GLib.idle_add(self.setup_project_ui)
 
+		def get_project_blob_store(self):
+			blob_store = get_blob_store(self.project_folder)
+			blob_store.on_purge_progress = self.on_purge_trash_progress
+			return blob_store
+
+		def on_purge_trash_progress(self, purged, total):
+			# a run has its own status, the purge is not worth overwriting it
+			if self.is_running or total == 0:
+				return
+			if purged < total:
+				self.setStatus(_("Status: Deleting removed timelines ({}/{} files)").format(purged, total))
+			else:
+				self.setStatus(_("Status: Deleted removed timelines ({} files)").format(total))
+
 		def on_project_closed(self):
 			for element in self.workflow_elements_all:
 				element.update_project_current_timeline_path_and_saved_path(self.project_current_timeline_folder, self.project_saved_config_json_file)
@@ -15,6 +15,29 @@ DEFAULT_CONFIG["api"] = {
 	"port": "8000",
 	"protocol": "ws",
 	"apikey": "YOUR_API_KEY",
+	# send and receive files as a single binary frame with a json header, only used if the server supports it
+	"framed_files": "false",
+}
+DEFAULT_CONFIG["runs"] = {
+	# warn before running a workflow that usually takes longer than this, 0 to disable
+	"expensive_run_warning_seconds": "300",
+}
+DEFAULT_CONFIG["tiling"] = {
+	# size of the square tiles sent when processing in tiles, and how much neighbouring tiles overlap
+	"tile_size": "1024",
+	"tile_overlap": "128",
+	# how many tiles are queued in the server at the same time, a server with several workers runs them in parallel
+	"max_parallel_tiles": "4",
+}
+DEFAULT_CONFIG["projects"] = {
+	# how a branched timeline gets the files of its parent: auto (reflink, hardlink or copy), reflink (or copy) or copy
+	"timeline_branch_method": "auto",
+}
+DEFAULT_CONFIG["scratch"] = {
+	# temporary exports, frames and tiles of a session are kept up to this size before the oldest are deleted
+	"max_size_mb": "2048",
+	# keep the small temporary files in memory (/dev/shm) when the system has it
+	"use_tmpfs": "true",
 }
 
 def get_config_filepath():